@@ -1,30 +1,141 @@
 import os
+import json
 import uuid
-import subprocess
-import traceback
-import yt_dlp
+import logging
 import time
 import socket
 import threading
-from flask import Flask, render_template, request, jsonify, send_from_directory, stream_with_context, Response
+import types
+from urllib.parse import urlencode
+from flask import Flask, render_template, request, jsonify, stream_with_context, Response
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.serving import is_running_from_reloader
-from threading import Thread
+from werkzeug.wsgi import ClosingIterator
+
+import log_config
+
+log_config.configure()
 
 # Import our YouTube helper module with enhanced anti-bot protection
 import youtube_helper
+import strategy_selector
+import info_store
+import metadata_cache
+import artifact_store
+import scheduler
+import job_store
+import progress_events
+import stream_pipeline
+import reaper
+import file_serving
+import batch
+import throughput
+import ydl_pool
+import toolchain
+import player_cache
+import metrics
+import recovery
+import audio_outputs
+import format_ladder
+import clips
+import bandwidth
+import ytdlp_loader
+from ytdlp_loader import yt_dlp
+
+logger = logging.getLogger(__name__)
 
 # Set socket timeout globally to prevent hanging connections
 socket.setdefaulttimeout(30)
 
 app = Flask(__name__)
 
+# Reverse proxies in front of the app (e.g. 1 on Railway). Only that many X-Forwarded-For
+# hops are trusted; with 0 the header is ignored, as any client can set it.
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', 0))
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
+
+# Set by gunicorn.conf.py when the master imports the app before forking the workers
+PRELOADING = os.environ.get('APP_PRELOAD') == '1'
+
 # Configuration
 # For deployments to platforms like Replit, we'll use a temporary folder
 DOWNLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "temp_downloads")
 os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
 
-# For debugging
-print(f"Temporary download folder: {DOWNLOAD_FOLDER}")
+logger.info("Temporary download folder: %s", DOWNLOAD_FOLDER)
+
+# Detect ffmpeg and its encoders once, audio jobs pick their post-processing from this
+logger.info("Media toolchain: %s", toolchain.probe())
+
+# Content types of the files jobs can produce, by extension
+MEDIA_TYPES = {
+    'mp4': 'video/mp4',
+    'webm': 'video/webm',
+    'mkv': 'video/x-matroska',
+    'mp3': 'audio/mpeg',
+    'm4a': 'audio/mp4',
+    'opus': 'audio/ogg',
+    'ogg': 'audio/ogg',
+}
+# Audio-only webm, e.g. the Opus track copied as it was downloaded
+AUDIO_MEDIA_TYPES = dict(MEDIA_TYPES, webm='audio/webm')
+
+def file_extension(path, default='mp4'):
+    """Extension of a produced file, without the dot"""
+    extension = os.path.splitext(path or '')[1].lstrip('.').lower()
+    return extension if extension in MEDIA_TYPES else default
+
+def extraction_error_response(error):
+    """Error response for a failed extraction, by what YouTube reported"""
+    error_message = str(error).lower()
+    if "sign in to confirm you're not a bot" in error_message or "confirm your identity" in error_message:
+        return jsonify({"error": "YouTube's anti-bot protection is blocking this request. We're actively working on a solution."}), 429
+    elif "unavailable" in error_message or "private" in error_message:
+        return jsonify({"error": "This video is unavailable or private."}), 404
+    elif "copyright" in error_message:
+        return jsonify({"error": "This video is blocked due to copyright restrictions."}), 403
+    return jsonify({"error": "YouTube is blocking this request. Please try again later or with a different video."}), 500
+
+def client_address():
+    """Address of the client for per-client bandwidth shares; behind trusted proxies ProxyFix sets it"""
+    return request.remote_addr
+
+def normalize_quality(format_type, quality, format_id=None, args=None):
+    """
+    Validate the quality setting of a request; audio settings name their outputs, see audio_outputs
+    
+    Args:
+        format_type (str): 'video' or 'audio'
+        quality (str): Quality setting of the request
+        format_id (str): Format picked from the /formats ladder, replaces the video quality
+        args (dict): Request parameters; 'start', 'end' and 'cut' make the job a clip, see clips
+        
+    Returns:
+        str: The setting to key and run the job with, carrying the clip if there is one
+        
+    Raises:
+        audio_outputs.AudioSpecError: If an audio setting is invalid on this server
+        clips.ClipError: If the requested range is invalid or can't be cut here
+    """
+    # A setting handed back from /download already carries its clip, it is checked again like new ones
+    quality, clip = clips.split(quality)
+    args = args or {}
+    if args.get('start') or args.get('end'):
+        clip = clips.make_clip(args.get('start'), args.get('end'), args.get('cut'))
+    elif clip:
+        clip = clips.make_clip(clip['start'], clip['end'], 'precise' if clip['precise'] else 'keyframe')
+    
+    if format_type != 'audio':
+        quality = format_ladder.FORMAT_ID_PREFIX + format_id if format_id else quality
+    elif format_id:
+        raise audio_outputs.AudioSpecError("format_id is for video downloads, audio outputs are set with 'quality'")
+    else:
+        quality = audio_outputs.canonical(audio_outputs.parse(quality))
+    return clips.encode(quality, clip)
+
+# Finished downloads shared between jobs asking for the same video/format/quality
+artifacts = artifact_store.ArtifactStore(os.path.join(DOWNLOAD_FOLDER, 'artifacts'))
 
 @app.route('/')
 def index():
@@ -39,71 +150,58 @@ def download_video():
     
     if not video_url:
         return jsonify({"error": "No URL provided"}), 400
+    try:
+        quality = normalize_quality(format_type, quality, data.get('format_id'), data)
+    except (audio_outputs.AudioSpecError, clips.ClipError) as e:
+        return jsonify({"error": str(e)}), 400
+    base_quality, clip = clips.split(quality)
     
     try:
         # Get video info first to determine filename and other details
         video_info = None
-        file_extension = 'mp4'  # Default extension
+        extension = 'mp4'  # Default extension
         
         # Log the request details for debugging
-        print(f"Processing request - URL: {video_url}, Format: {format_type}, Quality: {quality}")
-        print(f"Request headers: {dict(request.headers)}")
+        logger.info("Processing request - URL: %s, Format: %s, Quality: %s", video_url, format_type, quality)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Request headers: %s", dict(request.headers))
         
         try:
             # Use our enhanced YouTube helper to get video info with anti-bot protection
-            print(f"Getting info for {video_url} with enhanced protection")
+            logger.debug("Getting info for %s with enhanced protection", video_url)
             video_info = youtube_helper.extract_video_info(
                 video_url, 
                 format_type=format_type,
-                quality=quality,
+                quality=base_quality,
                 skip_download=True
             )
             
             # Log success for debugging
             if video_info:
-                print(f"Successfully retrieved info for video: {video_info.get('title', 'Unknown')}")
+                logger.info("Successfully retrieved info for video: %s", video_info.get('title', 'Unknown'))
         except Exception as e:
-            error_message = str(e)
-            print(f"Error with enhanced protection: {error_message}")
-            
-            # Provide more specific error messages based on the error
-            if "sign in to confirm you're not a bot" in error_message.lower() or "confirm your identity" in error_message.lower():
-                return jsonify({"error": "YouTube's anti-bot protection is blocking this request. We're actively working on a solution."}), 429
-            elif "unavailable" in error_message.lower() or "private" in error_message.lower():
-                return jsonify({"error": "This video is unavailable or private."}), 404
-            elif "copyright" in error_message.lower():
-                return jsonify({"error": "This video is blocked due to copyright restrictions."}), 403
-            else:
-                return jsonify({"error": f"YouTube is blocking this request. Please try again later or with a different video."}), 500
-        
-        # Define basic info options
-        info_opts = {
-            'format': 'best',
-            'noplaylist': True,
-            'restrictfilenames': True,
-            'quiet': True,
-            'skip_download': True
-        }
+            logger.warning("Error with enhanced protection: %s", e)
+            return extraction_error_response(e)
+        
+        if not video_info:
+            return jsonify({"error": "Could not retrieve video information"}), 500
         
-        # Special format configuration for audio
+        # Audio files are named after the first requested output
         if format_type == 'audio':
-            info_opts.update({'format': 'bestaudio'})
-            file_extension = 'mp3'
-        # Handle video quality for video downloads
-        elif quality != 'best':
-            if quality == '1080':
-                info_opts.update({'format': 'best[height<=1080]'})
-            elif quality == '720':
-                info_opts.update({'format': 'best[height<=720]'})
-            elif quality == '480':
-                info_opts.update({'format': 'best[height<=480]'})
+            extension = audio_outputs.expected_extension(audio_outputs.parse(base_quality)[0], video_info)
         
-        # Get video info
-        with yt_dlp.YoutubeDL(info_opts) as ydl:
-            video_info = ydl.extract_info(video_url, download=False)
+        # A format picked from the /formats ladder must exist in this video
+        format_id = format_ladder.format_id_of(base_quality)
+        if format_id:
+            selected_format = format_ladder.find_format(video_info, format_id)
+            if selected_format is None:
+                return jsonify({"error": f"Unknown format {format_id!r}, see /formats for this video"}), 400
+            extension = selected_format.get('ext') or extension
         
-        if not video_info:
-            return jsonify({"error": "Could not retrieve video information"}), 500
+        try:
+            clips.check_duration(clip, video_info.get('duration'))
+        except clips.ClipError as e:
+            return jsonify({"error": str(e)}), 400
         
         # Generate a safe filename
         safe_title = ''.join(c for c in video_info['title'] if c.isalnum() or c in ' -_').strip()
@@ -112,7 +210,7 @@ def download_video():
         # Determine content type and file extension based on format
         content_type = 'video/mp4'
         if format_type == 'audio':
-            content_type = 'audio/mpeg'
+            content_type = AUDIO_MEDIA_TYPES.get(extension, 'audio/mpeg')
             download_type = "Audio"
         else:
             download_type = "Video"
@@ -121,25 +219,159 @@ def download_video():
         is_short = 'youtube.com/shorts/' in video_url
         filename_prefix = 'Short_' if is_short else ''
         
-        # Create a download URL that will be streamed directly to browser
-        download_url = f"/stream-download?url={video_url}&format={format_type}&quality={quality}"
+        # Hand the extracted info to the download job so it doesn't extract the URL again
+        info_token = info_store.store_info(video_info, video_url)
+        
+        # Create a download URL that will be streamed directly to browser; clips are only cut by jobs,
+        # and video-only ladder formats only get their audio from a job's merge
+        streamable = not clip and (not format_id or format_ladder.streamable(selected_format))
+        download_url = None if not streamable else '/stream-download?' + urlencode({
+            'url': video_url,
+            'format': format_type,
+            'quality': quality,
+            'token': info_token
+        })
+        initiate_url = '/initiate-download?' + urlencode({
+            'url': video_url,
+            'format': format_type,
+            'quality': quality,
+            'token': info_token
+        })
         
         # Return success with the streaming URL
         return jsonify({
             "success": True,
             "message": f"Ready to download! Click the button below to get your {download_type}.",
             "download_url": download_url,
-            "filename": f"{filename_prefix}{safe_title}.{file_extension}"
+            "redirect": initiate_url,
+            "info_token": info_token,
+            "filename": f"{filename_prefix}{safe_title}{clips.filename_suffix(clip)}.{extension}"
         })
                 
     except Exception as e:
-        error_details = traceback.format_exc()
-        print(f"Error: {error_details}")
+        logger.exception("Error preparing download for %s", video_url)
         return jsonify({"error": str(e)}), 500
 
 
-# Background download queue for handling Railway timeouts
-download_queue = {}
+@app.route('/formats', methods=['GET'])
+def list_formats():
+    """
+    Every downloadable format of a video with resolution, codecs, bitrate and size, from one extraction
+    
+    Pass a format_id from the list (and the info_token) to /download or /initiate-download to get that format.
+    """
+    video_url = request.args.get('url')
+    if not video_url:
+        return jsonify({"error": "No URL provided"}), 400
+    
+    try:
+        # Cached per video: the same entry serves /download for every quality
+        info = youtube_helper.extract_video_info(video_url, format_type='video', quality='best', skip_download=True)
+    except Exception as e:
+        logger.warning("Error extracting formats: %s", e)
+        return extraction_error_response(e)
+    if not info:
+        return jsonify({"error": "Could not retrieve video information"}), 500
+    
+    ladder = format_ladder.build(info)
+    # Jobs started with this token download from the same info dict
+    ladder['info_token'] = info_store.store_info(info, video_url)
+    return jsonify(ladder)
+
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """Report counters of the metadata cache, artifact reuse, worker pools, bandwidth, temp storage, yt-dlp reuse and job recovery"""
+    return jsonify({
+        'metadata': metadata_cache.cache.stats(),
+        'artifacts': artifacts.stats(),
+        'scheduler': download_scheduler.stats(),
+        'postprocess': postprocess_scheduler.stats(),
+        'bandwidth': {'ingress': bandwidth.ingress.stats(), 'egress': bandwidth.egress.stats()},
+        'storage': temp_reaper.stats(),
+        'toolchain': toolchain.probe(),
+        'ydl_pool': ydl_pool.pool.stats(),
+        'player_cache': player_cache.stats(),
+        'recovery': job_recovery.stats(),
+        'event_streams': event_streams.stats(),
+        'ytdlp': ytdlp_loader.stats()
+    })
+
+
+
+@app.route('/strategy-stats', methods=['GET'])
+def strategy_stats():
+    """Report success rate, latency and circuit state of each extraction strategy in this worker"""
+    return jsonify({
+        'order': strategy_selector.selector.preview(youtube_helper.STRATEGY_NAMES),
+        'strategies': strategy_selector.selector.stats()
+    })
+
+# Background download queue for handling Railway timeouts, shared by all workers
+download_queue = job_store.create_job_store(DOWNLOAD_FOLDER)
+# Info handoffs from /download and /formats live next to the jobs, so any worker can pick them up
+info_store.use_store(download_queue)
+progress_writer = job_store.ThrottledProgressWriter(download_queue)
+# Pushes job updates to /download-events streams served by this worker
+progress_notifier = progress_events.ProgressNotifier()
+# Caps the /download-events streams open in this worker
+event_streams = progress_events.StreamSlots()
+
+# Keeps temp_downloads within its disk quota and expires old job records
+temp_reaper = reaper.TempReaper(DOWNLOAD_FOLDER, artifacts, download_queue)
+
+# Bounded pool of download workers
+download_scheduler = scheduler.DownloadScheduler()
+# CPU-bound ffmpeg work of finished downloads, one worker per core at a lower priority
+postprocess_scheduler = scheduler.DownloadScheduler(workers=scheduler.POSTPROCESS_WORKERS,
+                                                    max_pending=scheduler.POSTPROCESS_MAX_PENDING,
+                                                    name='postprocess', nice=scheduler.POSTPROCESS_NICE)
+
+# Read from the scheduler and the reaper's last sweep at scrape time
+metrics.Gauge('downloader_queue_depth', 'Downloads waiting for a worker',
+              lambda: download_scheduler.stats()['pending'])
+metrics.Gauge('downloader_active_workers', 'Download workers currently running a job',
+              lambda: download_scheduler.stats()['active'])
+metrics.Gauge('downloader_postprocess_queue_depth', 'Finished downloads waiting for a post-processing worker',
+              lambda: postprocess_scheduler.stats()['pending'])
+metrics.Gauge('downloader_postprocess_active_workers', 'Post-processing workers currently running ffmpeg',
+              lambda: postprocess_scheduler.stats()['active'])
+metrics.Gauge('downloader_bandwidth_ingress_bytes_per_second', 'Measured rate of upstream downloads',
+              bandwidth.ingress.rate)
+metrics.Gauge('downloader_bandwidth_egress_bytes_per_second', 'Measured rate of files and streams sent to clients',
+              bandwidth.egress.rate)
+metrics.Gauge('downloader_bandwidth_ingress_limit_bytes_per_second', "This worker's cap on upstream downloads",
+              lambda: bandwidth.ingress.limit or None)
+metrics.Gauge('downloader_bandwidth_egress_limit_bytes_per_second', "This worker's cap on sending to clients",
+              lambda: bandwidth.egress.limit or None)
+metrics.Gauge('downloader_bandwidth_ingress_flows', 'Downloads currently sharing the ingress bandwidth',
+              lambda: bandwidth.ingress.stats()['active_flows'])
+metrics.Gauge('downloader_bandwidth_egress_flows', 'Clients currently sharing the egress bandwidth',
+              lambda: bandwidth.egress.stats()['active_flows'])
+metrics.Gauge('downloader_event_streams_open', 'Open /download-events streams, each holding a server thread',
+              lambda: event_streams.stats()['open'])
+metrics.Gauge('downloader_temp_bytes', 'Bytes used in the download folder at the last sweep',
+              lambda: temp_reaper.stats()['bytes_used'])
+metrics.Gauge('downloader_temp_files', 'Files in the download folder at the last sweep',
+              lambda: temp_reaper.stats()['files'])
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Expose this worker's pipeline metrics in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Clips up to this long are small enough to go ahead like audio and Shorts
+SHORT_CLIP_SECONDS = int(os.environ.get('SHORT_CLIP_SECONDS', 600))
+
+def job_priority(video_url, format_type, quality):
+    """Pick the scheduler lane for a job: short jobs first, big video last"""
+    quality, clip = clips.split(quality)
+    if format_type == 'audio' or 'youtube.com/shorts/' in video_url:
+        return scheduler.PRIORITY_HIGH
+    if clip and clip['end'] - clip['start'] <= SHORT_CLIP_SECONDS:
+        return scheduler.PRIORITY_HIGH
+    if quality in ('720', '480'):
+        return scheduler.PRIORITY_NORMAL
+    return scheduler.PRIORITY_LOW
 
 @app.route('/initiate-download', methods=['GET'])
 def initiate_download():
@@ -150,131 +382,470 @@ def initiate_download():
     
     if not video_url:
         return jsonify({"error": "No URL provided"}), 400
+    try:
+        quality = normalize_quality(format_type, quality, request.args.get('format_id'), request.args)
+    except (audio_outputs.AudioSpecError, clips.ClipError) as e:
+        return jsonify({"error": str(e)}), 400
+    
+    profile = throughput.resolve(request.args.get('profile'))
+    if profile is None:
+        return jsonify({"error": f"Unknown profile, use one of: {', '.join(throughput.PROFILES)}"}), 400
+    
+    # Reuse the info extracted by /download if the client passed its token
+    prefetched_info = info_store.get_info(request.args.get('token'), video_url)
+    if prefetched_info:
+        try:
+            clips.check_duration(clips.split(quality)[1], prefetched_info.get('duration'))
+        except clips.ClipError as e:
+            return jsonify({"error": str(e)}), 400
     
     # Generate a job ID
     job_id = str(uuid.uuid4())
     
-    # Set up the job in the queue
-    download_queue[job_id] = {
-        'status': 'pending',
-        'progress': 0,
-        'file_path': None,
-        'error': None,
-        'info': None,
-        'started_at': time.time()
-    }
+    try:
+        status, queue_id = queue_download(job_id, video_url, format_type, quality, prefetched_info,
+                                          priority=job_priority(video_url, format_type, quality),
+                                          profile=profile)
+    except scheduler.QueueFullError as e:
+        response = jsonify({'error': 'Server is busy, please try again shortly.', 'retry_after': e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
     
-    # Start background download thread
-    download_thread = Thread(target=background_download, 
-                            args=(job_id, video_url, format_type, quality))
-    download_thread.daemon = True
-    download_thread.start()
+    if status == 'completed':
+        return jsonify({
+            'job_id': job_id,
+            'status': 'completed',
+            'message': 'Download ready. Fetch it from /download-file endpoint.'
+        })
     
     return jsonify({
         'job_id': job_id,
         'status': 'pending',
+        'queue_position': download_scheduler.position(queue_id),
         'message': 'Download initiated. Check status with /download-status endpoint.'
     })
 
+def queue_download(job_id, video_url, format_type, quality, prefetched_info=None, priority=scheduler.PRIORITY_NORMAL,
+                   profile=None):
+    """
+    Create a download job and get it a file: an existing artifact, a running download or a new one
+    
+    Args:
+        job_id (str): ID for the new job
+        video_url (str): YouTube URL
+        format_type (str): 'video' or 'audio'
+        quality (str): Quality setting
+        prefetched_info (dict): Info dict from /download, if any
+        priority (int): Scheduler lane if a new download is needed
+        profile (str): Throughput profile name, the default profile if None
+        
+    Returns:
+        tuple: ('completed', None) if an artifact was reused, else ('pending', ID of the job doing the download)
+        
+    Raises:
+        scheduler.QueueFullError: If the download queue is full; the job is removed again
+    """
+    # Set up the job in the queue, with everything needed to start it again if its worker dies
+    download_queue.create(job_id, {
+        'status': 'pending',
+        'progress': 0,
+        'file_path': None,
+        'error': None,
+        'title': None,
+        'url': video_url,
+        'format': format_type,
+        'quality': quality,
+        'profile': profile or throughput.DEFAULT_PROFILE,
+        'priority': priority,
+        'phase': 'queued',
+        'started_at': time.time()
+    })
+    
+    try:
+        return start_flight(job_id, video_url, format_type, quality, prefetched_info, priority, profile)
+    except scheduler.QueueFullError:
+        download_queue.delete(job_id)
+        metrics.jobs_total.inc(outcome='rejected')
+        raise
+
+def artifact_outputs(artifact, quality):
+    """Files of an artifact by audio output name, None for artifacts with a single file"""
+    if not artifact.get('extra_files'):
+        return None
+    # The main file is the first output of the (normalized) quality setting
+    return {clips.split(quality)[0].split(',')[0]: artifact['path'], **artifact['extra_files']}
+
+def start_flight(job_id, video_url, format_type, quality, prefetched_info=None, priority=scheduler.PRIORITY_NORMAL,
+                 profile=None):
+    """
+    Get the file for an existing job record: reuse an artifact, attach to a running download or start one
+    
+    Returns:
+        tuple: ('completed', None) if an artifact was reused, else ('pending', ID of the job doing the download)
+        
+    Raises:
+        scheduler.QueueFullError: If the download queue is full
+    """
+    flight_key = metadata_cache.make_key(video_url, format_type, quality)
+    
+    # Serve an artifact another job already downloaded
+    artifact = artifacts.lookup(flight_key)
+    if artifact:
+        download_queue.update(job_id,
+                              status='completed',
+                              progress=100,
+                              file_path=artifact['path'],
+                              outputs=artifact_outputs(artifact, quality),
+                              title=artifact['info'].get('title'))
+        metrics.jobs_total.inc(outcome='reused')
+        return 'completed', None
+    
+    # Only the first job for a key downloads, the others attach to it
+    if artifacts.join(flight_key, job_id):
+        try:
+            download_scheduler.submit(job_id, background_download,
+                                      args=(job_id, video_url, format_type, quality, prefetched_info, profile),
+                                      priority=priority)
+        except scheduler.QueueFullError:
+            # Jobs that attached in the meantime fail, the caller decides about this one
+            fail_jobs([attached for attached in artifacts.fail(flight_key, job_id) if attached != job_id],
+                      'Server is busy, please try again shortly.')
+            raise
+        queue_id = job_id
+    else:
+        # Report the queue position of the job doing the actual download
+        queue_id = artifacts.flight_leader(flight_key)
+    download_queue.update(job_id, queue_id=queue_id)
+    return 'pending', queue_id
+
+def get_job(job_id):
+    """Job record for an ID, None if it doesn't exist or is an info handoff"""
+    record = download_queue.get(job_id)
+    if info_store.is_handoff(record):
+        return None
+    return record
+
 @app.route('/download-status/<job_id>', methods=['GET'])
 def download_status(job_id):
     """Check the status of a download job"""
-    if job_id not in download_queue:
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Invalid job ID'}), 404
+    
+    return jsonify(job_status_response(job_id, job))
+
+@app.route('/download-events/<job_id>', methods=['GET'])
+def download_events(job_id):
+    """Stream status updates of a download job as Server-Sent Events"""
+    job = get_job(job_id)
+    if job is None:
         return jsonify({'error': 'Invalid job ID'}), 404
     
-    job = download_queue[job_id]
+    # Every stream holds a server thread; past the limit, 204 makes EventSource stop and the client polls
+    release_slot = event_streams.acquire()
+    if release_slot is None:
+        return Response(status=204)
     
-    # Check for timeout (10 minutes)
-    if job['status'] == 'pending' and (time.time() - job['started_at']) > 600:
-        job['status'] = 'failed'
-        job['error'] = 'Download timed out after 10 minutes'
+    def generate(job):
+        version = 0
+        last_payload = None
+        last_sent_at = 0
+        deadline = time.time() + progress_events.SSE_MAX_DURATION
+        try:
+            while True:
+                payload = job_status_response(job_id, job)
+                if payload != last_payload:
+                    # The first event tells the client how soon to reconnect when the stream is closed at the deadline
+                    retry = progress_events.SSE_RETRY_MS if last_payload is None else None
+                    yield progress_events.format_event(json.dumps(payload), retry=retry)
+                    last_payload = payload
+                    last_sent_at = time.time()
+                elif time.time() - last_sent_at > 15:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    last_sent_at = time.time()
+                
+                if payload['status'] in ('completed', 'failed') or time.time() > deadline:
+                    return
+                
+                # Coalesce bursts of updates into at most one event per interval
+                time.sleep(max(0, progress_events.SSE_MIN_INTERVAL - (time.time() - last_sent_at)))
+                
+                new_version, state = progress_notifier.wait(job_id, version, progress_events.SSE_POLL_INTERVAL)
+                if new_version == version or not state or state.get('status') in ('completed', 'failed'):
+                    # No live updates here (the job may run on another worker) or it just ended:
+                    # the job store is authoritative
+                    job = download_queue.get(job_id) or job
+                else:
+                    job.update(state)
+                    # A live update means the job's worker is alive
+                    job['updated_at'] = time.time()
+                version = new_version
+        finally:
+            progress_notifier.release(job_id)
+    
+    response = Response(stream_with_context(generate(job)), mimetype='text/event-stream')
+    # Also runs if the response is closed before the stream starts
+    response.call_on_close(release_slot)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Tell nginx-style proxies not to buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def job_status_response(job_id, job):
+    """Build the status payload shared by /download-status and /download-events"""
+    # Only the worker that queued the job knows its position
+    queue_position = None
+    if job['status'] == 'pending' and job.get('queue_id'):
+        # Finished downloads wait a second time, for a post-processing worker
+        pool = postprocess_scheduler if job.get('phase') == 'post-processing' else download_scheduler
+        queue_position = pool.position(job['queue_id'])
     
     response = {
         'status': job['status'],
-        'progress': job['progress']
+        'progress': job['progress'],
+        'phase': job.get('phase')
     }
     
+    # The worker running the job stopped sending heartbeats; the recovery loop will queue it again
+    if job_recovery.is_stale(job):
+        response['phase'] = 'interrupted'
+    
+    if queue_position is not None:
+        response['queue_position'] = queue_position
+    if job['status'] == 'pending' and job.get('phase') == 'downloading':
+        response['speed'] = job.get('speed')
+        response['eta'] = job.get('eta')
+        if job.get('bandwidth_share'):
+            response['bandwidth_share'] = job['bandwidth_share']
+    
     if job['status'] == 'completed':
         # Add download info
         response['download_url'] = f"/download-file/{job_id}"
-        if job['info'] and 'title' in job['info']:
-            response['title'] = job['info']['title']
+        if job.get('title'):
+            response['title'] = job['title']
             # Create safe filename
-            safe_title = ''.join(c for c in job['info']['title'] if c.isalnum() or c in ' -_').strip()
+            safe_title = ''.join(c for c in job['title'] if c.isalnum() or c in ' -_').strip()
             safe_title = safe_title.replace(' ', '_')
-            response['filename'] = f"{safe_title}.{'mp3' if format_type == 'audio' else 'mp4'}"
+            clip = clips.split(job.get('quality'))[1]
+            response['filename'] = f"{safe_title}{clips.filename_suffix(clip)}.{file_extension(job.get('file_path'))}"
+        if job.get('outputs'):
+            # Audio jobs with several outputs: one URL per output, the first is also download_url
+            response['outputs'] = [{'name': name, 'download_url': f"/download-file/{job_id}?output={name}"}
+                                   for name in job['outputs']]
+        if job.get('cpu_seconds'):
+            response['cpu_seconds'] = job['cpu_seconds']
     elif job['status'] == 'failed':
         response['error'] = job['error']
     
-    return jsonify(response)
+    return response
 
 @app.route('/download-file/<job_id>', methods=['GET'])
 def download_file(job_id):
     """Download the processed file"""
-    if job_id not in download_queue:
+    job = get_job(job_id)
+    if job is None:
         return "Invalid job ID", 404
     
-    job = download_queue[job_id]
+    # Audio jobs with several outputs serve the one named by ?output=, the first by default
+    file_path = job['file_path']
+    output = request.args.get('output')
+    if output and job['status'] == 'completed':
+        if output not in (job.get('outputs') or {}):
+            return "Unknown output", 404
+        file_path = job['outputs'][output]
     
-    if job['status'] != 'completed' or not job['file_path'] or not os.path.exists(job['file_path']):
+    if job['status'] != 'completed' or not file_path or not os.path.exists(file_path):
         return "File not ready or no longer available", 404
     
     # Determine content type based on file extension
-    content_type = 'audio/mpeg' if job['file_path'].endswith('.mp3') else 'video/mp4'
+    extension = file_extension(file_path)
+    content_type = (AUDIO_MEDIA_TYPES if job.get('format') == 'audio' else MEDIA_TYPES)[extension]
     
     # Create safe filename
-    filename = "download.mp4"
-    if job['info'] and 'title' in job['info']:
-        safe_title = ''.join(c for c in job['info']['title'] if c.isalnum() or c in ' -_').strip()
+    filename = f"download.{extension}"
+    if job.get('title'):
+        safe_title = ''.join(c for c in job['title'] if c.isalnum() or c in ' -_').strip()
         safe_title = safe_title.replace(' ', '_')
-        filename = f"{safe_title}.{'mp3' if job['file_path'].endswith('.mp3') else 'mp4'}"
-    
-    # Stream the file to avoid timeout issues
-    return send_from_directory(
-        os.path.dirname(job['file_path']),
-        os.path.basename(job['file_path']),
-        mimetype=content_type,
-        as_attachment=True,
-        download_name=filename
-    )
-
-def background_download(job_id, video_url, format_type, quality):
+        filename = f"{safe_title}{clips.filename_suffix(clips.split(job.get('quality'))[1])}.{extension}"
+    
+    # Least recently served artifacts are evicted first when the disk quota is hit
+    reaper.touch_access(file_path)
+    
+    # Stream the file with range/conditional support, or hand it to the fronting proxy
+    started = time.monotonic()
+    response = file_serving.serve_file(file_path, content_type, filename, DOWNLOAD_FOLDER)
+    # Offloaded and 304 responses have no body here, the proxy or the client's cache has the bytes
+    body_size = response.content_length or 0
+    
+    def record_serve():
+        metrics.phase_seconds.observe(time.monotonic() - started, phase='serve')
+        metrics.bytes_total.inc(body_size, direction='served')
+    
+    # With an egress cap the body is paced to the client's share, giving up sendfile's zero copy
+    if bandwidth.egress.limited and body_size:
+        weight = bandwidth.lane_weight(job_priority(job['url'], job['format'], job['quality']))
+        response.response = bandwidth.egress.throttle(response.response, client_address(), weight)
+    
+    if isinstance(response.response, types.GeneratorType):
+        # Passthrough bodies skip the response's close callbacks, so time the transfer on the body itself
+        response.response = ClosingIterator(response.response, record_serve)
+    else:
+        # A sendfile body must reach the server unwrapped to stay zero-copy; count it at handoff
+        record_serve()
+    return response
+
+def start_batch_item(job_id, video_url, format_type, quality, profile=None):
+    """Queue one batch item; batch items never jump ahead of interactive downloads"""
+    queue_download(job_id, video_url, format_type, quality, priority=scheduler.PRIORITY_LOW, profile=profile)
+
+# Expands playlists, channels and URL lists into item jobs
+batch_runner = batch.BatchRunner(download_queue, start_batch_item)
+
+@app.route('/batch-download', methods=['POST'])
+def batch_download():
+    """Start downloading a playlist, a channel or a list of URLs and return a batch ID"""
+    data = request.get_json() or {}
+    source = data.get('urls') or data.get('url')
+    format_type = data.get('format', 'video')
+    quality = data.get('quality', 'best')
+    
+    if not source:
+        return jsonify({"error": "No URL provided"}), 400
+    if isinstance(source, list) and not all(isinstance(url, str) and url for url in source):
+        return jsonify({"error": "'urls' must be a list of URLs"}), 400
+    try:
+        # The same clip is cut from every item
+        quality = normalize_quality(format_type, quality, args=data)
+    except (audio_outputs.AudioSpecError, clips.ClipError) as e:
+        return jsonify({"error": str(e)}), 400
+    profile = throughput.resolve(data.get('profile'))
+    if profile is None:
+        return jsonify({"error": f"Unknown profile, use one of: {', '.join(throughput.PROFILES)}"}), 400
+    
+    batch_id = batch_runner.start(source, format_type, quality, profile)
+    logger.info("Batch started for %s", source if isinstance(source, str) else f"{len(source)} URL(s)",
+                extra={'batch_id': batch_id})
+    
+    return jsonify({
+        'batch_id': batch_id,
+        'status': 'pending',
+        'status_url': f"/batch-status/{batch_id}",
+        'zip_url': f"/batch-zip/{batch_id}",
+        'message': 'Batch started. Check progress with /batch-status endpoint.'
+    })
+
+def get_batch(batch_id):
+    """Batch record for an ID, None if it doesn't exist or is a plain job"""
+    record = download_queue.get(batch_id)
+    if record is None or record.get('kind') != 'batch':
+        return None
+    return record
+
+@app.route('/batch-status/<batch_id>', methods=['GET'])
+def batch_status(batch_id):
+    """Report aggregate and per-item progress of a batch"""
+    record = get_batch(batch_id)
+    if record is None:
+        return jsonify({'error': 'Invalid batch ID'}), 404
+    
+    return jsonify(batch_runner.summary(record))
+
+@app.route('/batch-zip/<batch_id>', methods=['GET'])
+def batch_zip(batch_id):
+    """Stream the files of a batch as a ZIP archive, adding items as they finish"""
+    if get_batch(batch_id) is None:
+        return jsonify({'error': 'Invalid batch ID'}), 404
+    
+    def archive_files():
+        errors = []
+        for job in batch_runner.finished_items(batch_id):
+            file_path = job.get('file_path')
+            if job['status'] != 'completed' or not file_path or not os.path.exists(file_path):
+                errors.append(f"{job.get('title') or job['job_id']}: {job.get('error') or 'file no longer available'}")
+                continue
+            safe_title = ''.join(c for c in (job.get('title') or 'download') if c.isalnum() or c in ' -_').strip()
+            safe_title = safe_title.replace(' ', '_') or 'download'
+            reaper.touch_access(file_path)
+            clip = clips.split(job.get('quality'))[1]
+            yield f"{safe_title}{clips.filename_suffix(clip)}.{file_extension(file_path)}", file_path
+        if errors:
+            yield 'failed.txt', ('\n'.join(errors) + '\n').encode('utf-8')
+    
+    archive = batch.zip_stream(archive_files())
+    if bandwidth.egress.limited:
+        # Batches are the bulk lane, they share the client's egress with its other downloads
+        archive = bandwidth.egress.throttle(archive, client_address(), bandwidth.lane_weight(scheduler.PRIORITY_LOW))
+    response = Response(stream_with_context(archive), mimetype='application/zip')
+    file_serving.set_attachment(response.headers, f"batch_{batch_id[:8]}.zip")
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def background_download(job_id, video_url, format_type, quality, prefetched_info=None, profile=None):
     """Background thread for downloading YouTube content"""
-    job = download_queue[job_id]
+    flight_key = metadata_cache.make_key(video_url, format_type, quality)
+    # Shorts, audio and short clips get a bigger share of the ingress cap
+    weight = bandwidth.lane_weight(job_priority(video_url, format_type, quality))
+    # Clips share everything but the flight key with full downloads of the same setting
+    quality, clip = clips.split(quality)
+    
+    # The job's run time counts from here, not from when it was queued
+    set_job_state(artifacts.flight_jobs(flight_key, job_id), phase='extracting', started_at=time.time())
+    
+    # Monotonic timestamps of the current attempt, split into extract, download and post-process phases
+    timings = {}
+    # CPU time of this worker thread; yt-dlp's own ffmpeg runs (merging) are not included
+    cpu_started = time.thread_time()
+    
+    # Bytes reported so far per file, to charge only new bytes to the ingress cap;
+    # concurrent fragment downloads call the hook from several threads
+    received = {}
+    received_lock = threading.Lock()
+    
+    def progress_hook(progress_data):
+        now = time.monotonic()
+        timings.setdefault('download_started', now)
+        if progress_data.get('status') == 'downloading':
+            filename = progress_data.get('filename')
+            downloaded = progress_data.get('downloaded_bytes') or 0
+            new_bytes = 0
+            with received_lock:
+                # The first report of a file may include bytes of an earlier, resumed run: it only sets the baseline
+                if filename not in received:
+                    received[filename] = downloaded
+                elif downloaded > received[filename]:
+                    new_bytes = downloaded - received[filename]
+                    received[filename] = downloaded
+            if new_bytes:
+                # Waiting here holds back the next read, and TCP slows the origin down to the share
+                bandwidth.ingress.consume(flight_key, new_bytes, weight)
+        elif progress_data.get('status') == 'finished':
+            # Video and audio of a merged format each finish; the last one ends the download phase
+            timings['downloaded'] = now
+            metrics.bytes_total.inc(progress_data.get('total_bytes') or progress_data.get('downloaded_bytes') or 0,
+                                    direction='downloaded')
+        update_progress(job_id, progress_data, flight_key)
     
     try:
         # Create temporary file path
-        temp_file = os.path.join(DOWNLOAD_FOLDER, f"temp_{job_id}.{'.mp3' if format_type == 'audio' else '.mp4'}")
+        temp_file = os.path.join(DOWNLOAD_FOLDER, f"temp_{job_id}.%(ext)s")
         
         # Basic download options
         base_opts = {
             'outtmpl': temp_file,
-            'quiet': False,  # Output for debugging
-            'progress_hooks': [lambda d: update_progress(job_id, d)],
+            'quiet': not logger.isEnabledFor(logging.DEBUG),
+            'progress_hooks': [progress_hook],
+            # Keep mtime at the download time instead of the upstream Last-Modified date
+            'updatetime': False,
         }
         
-        print(f"[Job {job_id}] Downloading {video_url} with enhanced protection")
+        logger.info("Downloading %s with enhanced protection", video_url, extra={'job_id': job_id})
         
-        # Add audio post-processing if needed
-        if format_type == 'audio':
-            # Check if FFmpeg is available
-            try:
-                subprocess_result = subprocess.run(['ffmpeg', '-version'], 
-                                                stdout=subprocess.PIPE, 
-                                                stderr=subprocess.PIPE, 
-                                                shell=True)
-                ffmpeg_available = subprocess_result.returncode == 0
-                
-                if ffmpeg_available:
-                    base_opts.update({
-                        'postprocessors': [{
-                            'key': 'FFmpegExtractAudio',
-                            'preferredcodec': 'mp3',
-                            'preferredquality': '256',
-                        }],
-                    })
-            except:
-                pass
+        # Audio: download the one track every output is made from, converted below instead of by yt-dlp
+        audio_plan = audio_outputs.parse(quality) if format_type == 'audio' else None
+        if audio_plan:
+            base_opts.update({'format': audio_outputs.source_format(audio_plan)})
         
         # Get download format based on quality selection
         if quality != 'best' and format_type == 'video':
@@ -285,6 +856,25 @@ def background_download(job_id, video_url, format_type, quality):
             elif quality == '480':
                 base_opts.update({'format': 'best[height<=480]'})
         
+        # Without a handed-off info dict, one extracted by /download or /formats on any worker may be cached
+        if prefetched_info is None:
+            prefetched_info = youtube_helper.cached_video_info(video_url, format_type)
+        
+        # A format picked from the /formats ladder
+        format_id = format_ladder.format_id_of(quality)
+        if format_id and format_type == 'video':
+            selected_format = format_ladder.find_format(prefetched_info or {}, format_id)
+            base_opts['format'] = format_ladder.download_format(selected_format or {'format_id': format_id})
+        
+        # Only the clip's range is fetched, ffmpeg cuts it while downloading
+        if clip:
+            # Batch items aren't checked against their length before they get here
+            clips.check_duration(clip, (prefetched_info or {}).get('duration'))
+            base_opts.update(clips.ydl_options(clip))
+        
+        # Fragment concurrency, chunk and buffer sizes of the job's throughput profile
+        throughput.apply_profile(base_opts, profile)
+        
         # Enhance options with anti-bot protection
         enhanced_opts = youtube_helper.get_enhanced_ydl_opts(base_opts, format_type)
         
@@ -293,73 +883,270 @@ def background_download(job_id, video_url, format_type, quality):
         info = None
         
         for attempt in range(3):
+            timings.clear()
+            timings['attempt_started'] = time.monotonic()
             try:
-                with yt_dlp.YoutubeDL(enhanced_opts) as ydl:
-                    # Verbose output for debugging
-                    print(f"[Job {job_id}] Download attempt {attempt+1}")
-                    info = ydl.extract_info(video_url, download=True)
-                    
-                    # Check if download succeeded
-                    if info and 'requested_downloads' in info and info['requested_downloads']:
-                        downloaded_file = info['requested_downloads'][0].get('_filename', temp_file)
-                        if os.path.exists(downloaded_file):
-                            print(f"[Job {job_id}] Successfully downloaded on attempt {attempt+1}")
-                            break
-                    else:
-                        print(f"[Job {job_id}] Download info not available in attempt {attempt+1}")
+                if attempt == 0 and prefetched_info:
+                    # Skip extraction, the info dict was already fetched by /download or /formats
+                    timings['prefetched'] = True
+                    logger.info("Download attempt %d using prefetched info", attempt + 1, extra={'job_id': job_id})
+                    info = youtube_helper.download_from_info(prefetched_info, enhanced_opts)
+                else:
+                    with yt_dlp.YoutubeDL(enhanced_opts) as ydl:
+                        logger.info("Download attempt %d", attempt + 1, extra={'job_id': job_id})
+                        info = ydl.extract_info(video_url, download=True)
+                
+                # Check if download succeeded
+                if info and 'requested_downloads' in info and info['requested_downloads']:
+                    # 'filepath' is the final file after post-processing, '_filename' the raw download
+                    requested = info['requested_downloads'][0]
+                    downloaded_file = requested.get('filepath') or requested.get('_filename')
+                    if os.path.exists(downloaded_file):
+                        logger.info("Successfully downloaded on attempt %d", attempt + 1, extra={'job_id': job_id})
+                        break
+                else:
+                    logger.warning("Download info not available in attempt %d", attempt + 1, extra={'job_id': job_id})
             except Exception as e:
-                print(f"[Job {job_id}] Error in download attempt {attempt+1}: {str(e)}")
+                logger.warning("Error in download attempt %d: %s", attempt + 1, e, extra={'job_id': job_id})
                 # Try with different settings on next attempt
                 enhanced_opts = youtube_helper.get_enhanced_ydl_opts(base_opts, format_type)
         
         # Check if any of the attempts succeeded
         if not downloaded_file or not os.path.exists(downloaded_file):
-            job['status'] = 'failed'
-            job['error'] = 'Download failed after multiple attempts. YouTube may be blocking access.'
+            fail_jobs(artifacts.fail(flight_key, job_id),
+                      'Download failed after multiple attempts. YouTube may be blocking access.')
             return
         
-        # Mark job as completed
-        job['status'] = 'completed'
-        job['file_path'] = downloaded_file
-        job['info'] = info
-        job['progress'] = 100
-        print(f"[Job {job_id}] Download complete: {downloaded_file}")
+        cpu_seconds = {'download': time.thread_time() - cpu_started, 'postprocess': None}
+        if not audio_plan:
+            finish_download(job_id, flight_key, quality, downloaded_file, info, None, timings, cpu_seconds)
+            return
+        
+        # Free this download worker for the next download while the ffmpeg work waits for a CPU
+        timings['postprocess_queued'] = time.monotonic()
+        set_job_state(artifacts.flight_jobs(flight_key, job_id), phase='post-processing')
+        # No progress deadline while waiting for a CPU worker, finish_download starts it again
+        job_recovery.queued(artifacts.flight_jobs(flight_key, job_id))
+        try:
+            postprocess_scheduler.submit(job_id, finish_download,
+                                         args=(job_id, flight_key, quality, downloaded_file, info, audio_plan,
+                                               timings, cpu_seconds),
+                                         priority=job_priority(video_url, format_type, quality))
+        except scheduler.QueueFullError:
+            # Post-processing is backed up: doing it here holds back further downloads until it catches up
+            logger.warning("Post-processing queue is full, converting on the download worker", extra={'job_id': job_id})
+            finish_download(job_id, flight_key, quality, downloaded_file, info, audio_plan, timings, cpu_seconds)
         
     except Exception as e:
-        error_details = traceback.format_exc()
-        print(f"[Job {job_id}] Error: {error_details}")
-        job['status'] = 'failed'
-        job['error'] = str(e)
+        logger.exception("Download failed", extra={'job_id': job_id})
+        fail_jobs(artifacts.fail(flight_key, job_id) or [job_id], str(e))
 
-def update_progress(job_id, progress_data):
-    """Update the progress of a download job"""
-    if job_id in download_queue:
-        job = download_queue[job_id]
+def finish_download(job_id, flight_key, quality, downloaded_file, info, audio_plan, timings, cpu_seconds):
+    """
+    Second stage of a job: convert the downloaded file, store it and complete every job waiting on it
+    
+    Runs on a post-processing worker for audio jobs, directly after the download otherwise.
+    
+    Args:
+        job_id (str): Job that did the download
+        flight_key (str): Key of the download the jobs are waiting on
+        quality (str): Quality setting without the clip
+        downloaded_file (str): File yt-dlp produced
+        info (dict): Info dict of the download
+        audio_plan (list): Audio outputs to make from the file, None for video
+        timings (dict): Phase timestamps of the download attempt
+        cpu_seconds (dict): CPU time of the job so far, 'postprocess' is filled in here
+    """
+    try:
+        extra_files = None
+        mode = 'video'
+        if audio_plan:
+            # Copies and encodes of all requested outputs, from a single decode of the track
+            timings['postprocess_started'] = time.monotonic()
+            job_recovery.touch(artifacts.flight_jobs(flight_key, job_id))
+            postprocess_started = time.thread_time()
+            source_acodec = info['requested_downloads'][0].get('acodec') or info.get('acodec')
+            paths, ffmpeg_seconds = audio_outputs.convert(downloaded_file, source_acodec, audio_plan)
+            cpu_seconds['postprocess'] = ffmpeg_seconds + time.thread_time() - postprocess_started
+            downloaded_file = paths[0]
+            extra_files = {output['name']: path for output, path in zip(audio_plan[1:], paths[1:])}
+            mode = audio_outputs.mode(audio_plan)
+        metrics.job_cpu_seconds.observe(sum(v for v in cpu_seconds.values() if v is not None), mode=mode)
         
-        if progress_data.get('status') == 'downloading':
-            # Calculate progress percentage
-            downloaded = progress_data.get('downloaded_bytes', 0)
-            total = progress_data.get('total_bytes') or progress_data.get('total_bytes_estimate', 0)
-            
-            if total > 0:
-                progress = int((downloaded / total) * 100)
-                job['progress'] = min(progress, 99)  # Cap at 99% until fully complete
+        # Move the files into the shared store and complete every job waiting on them
+        artifact, job_ids = artifacts.finish(flight_key, downloaded_file, info, extra_files, leader=job_id)
+        observe_download_phases(timings)
+        set_job_state(job_ids,
+                      status='completed',
+                      phase='completed',
+                      file_path=artifact['path'],
+                      outputs=artifact_outputs(artifact, quality),
+                      cpu_seconds=cpu_seconds,
+                      title=info.get('title'),
+                      progress=100)
+        logger.info("Download complete: %s (%d job(s), %.2fs CPU)", artifact['path'], len(job_ids),
+                    sum(v for v in cpu_seconds.values() if v is not None), extra={'job_id': job_id})
+    
+    except Exception as e:
+        logger.exception("Post-processing failed", extra={'job_id': job_id})
+        fail_jobs(artifacts.fail(flight_key, job_id) or [job_id], str(e))
+
+def observe_download_phases(timings):
+    """
+    Record the phases of a successful download attempt; everything after the last file is post-processing
+    
+    Jobs that went through the post-processing pool also record the time they waited for a worker.
+    """
+    finished_at = time.monotonic()
+    download_started = timings.get('download_started')
+    if download_started is None:
+        # No progress events (e.g. yt-dlp found the file already there), nothing to split
+        return
+    if not timings.get('prefetched'):
+        metrics.phase_seconds.observe(download_started - timings['attempt_started'], phase='extract')
+    downloaded = timings.get('downloaded', finished_at)
+    metrics.phase_seconds.observe(downloaded - download_started, phase='download')
+    waited = 0
+    if 'postprocess_queued' in timings:
+        waited = timings['postprocess_started'] - timings['postprocess_queued']
+        metrics.phase_seconds.observe(waited, phase='postprocess_wait')
+    metrics.phase_seconds.observe(finished_at - downloaded - waited, phase='postprocess')
+
+def set_job_state(job_ids, **fields):
+    """Write fields to the given jobs and push them to their event streams"""
+    if fields.get('status') not in ('completed', 'failed'):
+        job_recovery.touch(job_ids)
+    for state_job_id in job_ids:
+        download_queue.update(state_job_id, **fields)
+        progress_notifier.publish(state_job_id, **fields)
+        if fields.get('status') in ('completed', 'failed'):
+            progress_writer.forget(state_job_id)
+            progress_notifier.forget(state_job_id)
+            metrics.jobs_total.inc(outcome=fields['status'])
+
+def fail_jobs(job_ids, error):
+    """Mark all given jobs as failed"""
+    set_job_state(job_ids, status='failed', phase='failed', error=error)
+
+def abandon_jobs(job_ids, error):
+    """Fail jobs whose download hung, with every job attached to it, and close their flights"""
+    fail_jobs(artifacts.abandon(job_ids) or job_ids, error)
+
+def resume_job(job, downloaded_bytes):
+    """
+    Queue a job whose worker died again, under its own ID so yt-dlp continues its .part files
+    
+    Args:
+        job (dict): Job record, checkpointed by queue_download
+        downloaded_bytes (int): Bytes the interrupted run left in the download folder
+        
+    Returns:
+        bool: False if the download queue is full
+    """
+    job_id = job['job_id']
+    download_queue.update(job_id, phase='queued')
+    try:
+        start_flight(job_id, job['url'], job['format'], job['quality'],
+                     priority=job.get('priority', scheduler.PRIORITY_NORMAL), profile=job.get('profile'))
+    except scheduler.QueueFullError:
+        return False
+    download_queue.update(job_id, resumes=job.get('resumes', 0) + 1, resumed_bytes=downloaded_bytes)
+    return True
+
+def owned_jobs():
+    """IDs of the jobs and batches this worker keeps alive with heartbeats"""
+    return artifacts.in_flight_jobs() + batch_runner.running()
+
+# Heartbeats for this worker's jobs; jobs of dead workers are resumed from their partial files,
+# hung jobs of live workers are failed
+job_recovery = recovery.JobRecovery(DOWNLOAD_FOLDER, download_queue, owned_jobs, resume_job, fail_jobs,
+                                    abandon=abandon_jobs, recover_batch=batch_runner.recover)
+
+def update_progress(job_id, progress_data, flight_key=None):
+    """Update the progress of a download job and of the jobs attached to it"""
+    job_ids = artifacts.flight_jobs(flight_key, job_id) if flight_key else [job_id]
+    job_recovery.touch(job_ids)
+    
+    if progress_data.get('status') == 'downloading':
+        # Calculate progress percentage
+        downloaded = progress_data.get('downloaded_bytes', 0)
+        total = progress_data.get('total_bytes') or progress_data.get('total_bytes_estimate', 0)
+        
+        if total > 0:
+            # Cap at 99% until fully complete
+            progress = min(int((downloaded / total) * 100), 99)
+            live = {
+                'phase': 'downloading',
+                'speed': progress_data.get('speed'),
+                'eta': progress_data.get('eta'),
+                # Bytes/s this download may use under the ingress cap, None without one
+                'bandwidth_share': bandwidth.ingress.share(flight_key) if flight_key else None
+            }
+            for waiting_job_id in job_ids:
+                # Streams get every update, store writes are throttled per job
+                progress_notifier.publish(waiting_job_id, progress=progress, **live)
+                progress_writer.set_progress(waiting_job_id, progress, **live)
+    elif progress_data.get('status') == 'finished':
+        # Merging formats or audio conversion runs after the last file is downloaded;
+        # the record first gets the progress the throttle held back
+        for finished_job_id in job_ids:
+            progress_writer.flush(finished_job_id)
+        set_job_state(job_ids, phase='post-processing')
 
 @app.route('/stream-download', methods=['GET'])
 def stream_download():
-    """Legacy endpoint - now redirects to the new asynchronous download system"""
+    """Stream the media to the client while it is downloading, without a temp file"""
     video_url = request.args.get('url')
     format_type = request.args.get('format', 'video')
     quality = request.args.get('quality', 'best')
     
     if not video_url:
         return "No URL provided", 400
+    try:
+        quality = normalize_quality(format_type, quality, request.args.get('format_id'), request.args)
+    except (audio_outputs.AudioSpecError, clips.ClipError) as e:
+        return jsonify({"error": str(e)}), 400
+    if clips.split(quality)[1]:
+        return jsonify({"error": "Clips are cut by download jobs, use /initiate-download"}), 400
     
-    # Redirect to the new async download flow
-    return jsonify({
-        "error": "This endpoint is deprecated. Please use the new download flow.",
-        "redirect": f"/initiate-download?url={video_url}&format={format_type}&quality={quality}"
-    }), 302
+    # Reuse the info extracted by /download if the client passed its token
+    info = info_store.get_info(request.args.get('token'), video_url)
+    if info is None:
+        try:
+            info = youtube_helper.extract_video_info(video_url, format_type=format_type, quality=quality)
+        except Exception as e:
+            logger.warning("Error extracting info for streaming: %s", e)
+            return jsonify({"error": "YouTube is blocking this request. Please try again later."}), 500
+    if not info:
+        return jsonify({"error": "Could not retrieve video information"}), 500
+    
+    safe_title = ''.join(c for c in (info.get('title') or 'download') if c.isalnum() or c in ' -_').strip()
+    safe_title = safe_title.replace(' ', '_') or 'download'
+    
+    try:
+        pipeline = stream_pipeline.StreamPipeline(info, format_type, quality)
+    except stream_pipeline.StreamBusyError:
+        retry_after = download_scheduler.retry_after()
+        response = jsonify({"error": "Server is busy, please try again shortly.", "retry_after": retry_after})
+        response.headers['Retry-After'] = str(retry_after)
+        return response, 503
+    except (audio_outputs.AudioSpecError, stream_pipeline.StreamFormatError) as e:
+        # The track this video has can't be turned into the requested output here
+        return jsonify({"error": str(e)}), 400
+    
+    logger.info("Streaming %s as %s", video_url, pipeline.extension)
+    body = pipeline
+    if bandwidth.egress.limited:
+        # Pacing the output also slows yt-dlp's fetch through the pipe
+        body = bandwidth.egress.throttle(pipeline, client_address(),
+                                         bandwidth.lane_weight(job_priority(video_url, format_type, quality)))
+    response = Response(stream_with_context(body), mimetype=pipeline.mimetype)
+    # The body closes the pipeline when it is iterated; this covers responses closed before the first chunk
+    response.call_on_close(pipeline.close)
+    file_serving.set_attachment(response.headers, f"{safe_title}.{pipeline.extension}")
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 # We don't need this route anymore since files are saved directly to Downloads folder
 # @app.route('/downloads/<path:filename>', methods=['GET'])
@@ -371,6 +1158,25 @@ def stream_download():
 # def open_folder():
 #     return "No longer needed"
 
+def start_background_services():
+    """
+    Start this worker's threads: temp reaper, job heartbeats/recovery, yt-dlp warm-up, player cache pre-warm
+    
+    Threads don't survive fork, so a preloading gunicorn master leaves this to its
+    workers (see gunicorn.conf.py); otherwise it runs when the app is imported.
+    """
+    temp_reaper.start()
+    job_recovery.start()
+    ytdlp_loader.start_warmup()
+    # Solve the current YouTube player into the shared cache before the first request needs it
+    player_cache.start_prewarm()
+
+if PRELOADING:
+    # Imported once in the gunicorn master: load yt-dlp here so the workers share it copy-on-write
+    ytdlp_loader.warm('preload')
+else:
+    start_background_services()
+
 if __name__ == '__main__':
     # Use environment variables for host and port if available (for Railway)
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,224 @@
+"""
+Single-flight coordination and a content-addressed store for finished downloads
+
+Concurrent jobs for the same (video ID, format, quality) attach to one in-flight
+download instead of starting their own, and later jobs reuse the finished file
+until it is evicted.
+"""
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _paths(artifact):
+    """All files of an artifact record"""
+    return [artifact['path'], *artifact.get('extra_files', {}).values()]
+
+
+class ArtifactStore:
+    """Tracks in-flight downloads per key and the finished artifacts they produce"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(self.folder, exist_ok=True)
+        self._lock = threading.Lock()
+        # key -> {'leader': job_id, 'jobs': [job_id, ...], 'started_at': ts}
+        self._flights = {}
+        # key -> {'digest', 'path', 'extra_files', 'info', 'size', 'created_at', 'last_access'}
+        self._artifacts = {}
+        self._stats = {'coalesced_jobs': 0, 'artifact_hits': 0, 'artifacts_stored': 0, 'deduplicated': 0}
+
+    def lookup(self, key):
+        """
+        Return the finished artifact for a key
+
+        Args:
+            key (str): Download key, see metadata_cache.make_key
+
+        Returns:
+            dict: Artifact record with 'path' and 'info', or None
+        """
+        with self._lock:
+            artifact = self._artifacts.get(key)
+            if artifact is None:
+                return None
+            if not all(os.path.exists(path) for path in _paths(artifact)):
+                del self._artifacts[key]
+                return None
+            artifact['last_access'] = time.time()
+            self._stats['artifact_hits'] += 1
+            return artifact
+
+    def join(self, key, job_id):
+        """
+        Attach a job to the in-flight download for a key, or make it the leader
+
+        Args:
+            key (str): Download key
+            job_id (str): Job to attach
+
+        Returns:
+            bool: True if the caller is the leader and must run the download
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                self._flights[key] = {'leader': job_id, 'jobs': [job_id], 'started_at': time.time()}
+                return True
+            flight['jobs'].append(job_id)
+            self._stats['coalesced_jobs'] += 1
+            return False
+
+    def flight_leader(self, key):
+        """Return the ID of the job running the in-flight download for a key"""
+        with self._lock:
+            flight = self._flights.get(key)
+            return flight['leader'] if flight else None
+
+    def flight_jobs(self, key, leader=None):
+        """
+        Return the IDs of all jobs waiting on the in-flight download for a key
+
+        Args:
+            key (str): Download key
+            leader (str): Only if this job leads the flight, so an abandoned download
+                can't report into the flight that replaced it
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None or (leader is not None and flight['leader'] != leader):
+                return []
+            return list(flight['jobs'])
+
+    def in_flight_jobs(self):
+        """Return the IDs of every job waiting on an in-flight download of this process"""
+        with self._lock:
+            return [job_id for flight in self._flights.values() for job_id in flight['jobs']]
+
+    def _store_file(self, file_path):
+        # Called without the lock: hashing a large file takes seconds and must not stall
+        # progress updates and lookups. Returns the digest, the path in the store and
+        # whether identical content was already there.
+        digest = file_digest(file_path)
+        extension = os.path.splitext(file_path)[1]
+        artifact_path = os.path.join(self.folder, f"{digest}{extension}")
+        if os.path.exists(artifact_path):
+            # Identical content already stored under another key
+            os.remove(file_path)
+            return digest, artifact_path, True
+        shutil.move(file_path, artifact_path)
+        return digest, artifact_path, False
+
+    def _pop_flight(self, key, leader):
+        # Called with the lock held. A download that was abandoned and woke up later must
+        # not close the flight a new leader started under the same key.
+        flight = self._flights.get(key)
+        if flight is None or (leader is not None and flight['leader'] != leader):
+            return None
+        return self._flights.pop(key)
+
+    def finish(self, key, file_path, info, extra_files=None, leader=None):
+        """
+        Move a finished download into the store and close its flight
+
+        Args:
+            key (str): Download key
+            file_path (str): Downloaded file, moved into the store
+            info (dict): Info dict of the download
+            extra_files (dict): Further files made by the same job (e.g. other audio outputs)
+                by name, moved into the store as well
+            leader (str): Job that ran the download; the flight is only closed if that job
+                still leads it. The file is stored either way.
+
+        Returns:
+            tuple: (artifact record, list of job IDs that were waiting on it); the record's
+                'extra_files' maps the names of extra_files to their paths in the store
+        """
+        digest, artifact_path, deduplicated = self._store_file(file_path)
+        stored = {name: self._store_file(path) for name, path in (extra_files or {}).items()}
+        stored_extras = {name: result[1] for name, result in stored.items()}
+        size = sum(os.path.getsize(path) for path in {artifact_path, *stored_extras.values()})
+
+        # Only the index update needs the lock
+        with self._lock:
+            now = time.time()
+            artifact = {
+                'digest': digest,
+                'path': artifact_path,
+                'extra_files': stored_extras,
+                'info': info,
+                'size': size,
+                'created_at': now,
+                'last_access': now,
+            }
+            self._artifacts[key] = artifact
+            self._stats['artifacts_stored'] += 1
+            self._stats['deduplicated'] += deduplicated + sum(result[2] for result in stored.values())
+            flight = self._pop_flight(key, leader)
+
+        return artifact, (flight['jobs'] if flight else [])
+
+    def fail(self, key, leader=None):
+        """
+        Close the flight for a key after its download failed
+
+        Args:
+            key (str): Download key
+            leader (str): Job that ran the download; nothing happens if it no longer leads the flight
+
+        Returns:
+            list: IDs of the jobs that were waiting on it
+        """
+        with self._lock:
+            flight = self._pop_flight(key, leader)
+        return flight['jobs'] if flight else []
+
+    def abandon(self, job_ids):
+        """
+        Close the flights the given jobs wait on, e.g. after their download hung,
+        so later jobs for the same keys start a new download
+
+        Returns:
+            list: IDs of every job that was waiting on those flights
+        """
+        job_ids = set(job_ids)
+        with self._lock:
+            keys = [key for key, flight in self._flights.items() if job_ids.intersection(flight['jobs'])]
+            return [job_id for key in keys for job_id in self._flights.pop(key)['jobs']]
+
+    def evict(self, key):
+        """Forget the artifact for a key and delete its file if no other key shares it"""
+        with self._lock:
+            artifact = self._artifacts.pop(key, None)
+            if artifact is None:
+                return
+            still_used = {path for a in self._artifacts.values() for path in _paths(a)}
+            for path in _paths(artifact):
+                if path not in still_used and os.path.exists(path):
+                    os.remove(path)
+
+    def forget_path(self, path):
+        """Drop index entries for an artifact file that was deleted from disk"""
+        with self._lock:
+            for key in [k for k, a in self._artifacts.items() if path in _paths(a)]:
+                del self._artifacts[key]
+
+    def stats(self):
+        """Return coalescing and reuse counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._flights)
+            stats['artifacts'] = len(self._artifacts)
+            stats['artifact_bytes'] = sum(a['size'] for a in {a['path']: a for a in self._artifacts.values()}.values())
+        return stats
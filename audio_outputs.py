@@ -0,0 +1,230 @@
+"""
+Audio output modes: the native Opus/AAC track copied into a container, or encodes at a chosen bitrate
+
+For audio jobs the 'quality' setting names the outputs, comma-separated:
+'webm', 'ogg' (Opus copy), 'm4a' (AAC copy), 'native' (the track as downloaded),
+or an encode like 'mp3', 'mp3-320', 'aac-128', 'opus-96'. 'best' picks MP3 when
+ffmpeg can encode it and a copy of the AAC track otherwise. All outputs of a job
+come from one download and one ffmpeg run, which decodes the track once for
+every encoder. Every output but 'native' needs ffmpeg and is refused up front
+on a server without it.
+"""
+import os
+import subprocess
+import time
+
+import toolchain
+
+# Outputs that keep the downloaded codec: codec the source must have, container extension
+COPY_OUTPUTS = {
+    'native': {'acodec': None, 'ext': None},
+    'm4a': {'acodec': 'aac', 'ext': 'm4a'},
+    'webm': {'acodec': 'opus', 'ext': 'webm'},
+    'ogg': {'acodec': 'opus', 'ext': 'ogg'},
+}
+# Encoded outputs: container extension and default bitrate in kbps
+ENCODED_OUTPUTS = {
+    'mp3': {'ext': 'mp3', 'bitrate': 256},
+    'aac': {'ext': 'm4a', 'bitrate': 192},
+    'opus': {'ext': 'opus', 'bitrate': 128},
+}
+BITRATES = (64, 96, 128, 160, 192, 256, 320)
+MAX_OUTPUTS = 4
+
+# ffmpeg muxer options for writing each container to a pipe, which cannot seek
+PIPE_MUXERS = {
+    'mp3': ['-f', 'mp3'],
+    'm4a': ['-f', 'ipod', '-movflags', 'frag_keyframe+empty_moov'],
+    'webm': ['-f', 'webm'],
+    'ogg': ['-f', 'ogg'],
+    'opus': ['-f', 'ogg'],
+}
+
+
+class AudioSpecError(ValueError):
+    """Raised for an unknown output, bitrate or an output this server's ffmpeg can't produce"""
+
+
+def _encoder(codec):
+    available = toolchain.probe()['encoders']
+    return next((name for name in toolchain.AUDIO_ENCODERS[codec] if name in available), None)
+
+
+def parse(spec):
+    """
+    Turn an audio quality setting into output descriptions
+
+    Args:
+        spec (str): 'best' or comma-separated output names, see the module docstring
+
+    Returns:
+        list: Dicts with 'name', 'codec', 'ext', 'bitrate' (None for copies) and 'copy'
+
+    Raises:
+        AudioSpecError: If the spec is invalid or needs an encoder that is missing
+    """
+    if not spec or spec == 'best':
+        if toolchain.can_encode('mp3'):
+            spec = 'mp3'
+        else:
+            # m4a can be remuxed from an AAC track or encoded from an Opus one, without ffmpeg (or its
+            # AAC encoder) take the track as it comes
+            spec = 'm4a' if toolchain.can_stream_copy() and toolchain.can_encode('aac') else 'native'
+
+    outputs = []
+    for name in (part.strip().lower() for part in spec.split(',')):
+        if name in COPY_OUTPUTS:
+            output = {'name': name, 'codec': COPY_OUTPUTS[name]['acodec'], 'ext': COPY_OUTPUTS[name]['ext'],
+                      'bitrate': None, 'copy': True}
+            # Which track the video has is only known after the download: any output but 'native'
+            # may need a remux (ogg always does) or, from the other codec, an encode
+            if output['codec'] and not toolchain.can_stream_copy():
+                raise AudioSpecError(f"{name!r} output needs ffmpeg, which is not available; use 'native'")
+            if output['codec'] and not toolchain.can_encode(output['codec']):
+                raise AudioSpecError(f"{name!r} output needs an encoder for {output['codec']}, "
+                                     "which is not available; use 'native'")
+        else:
+            codec, _, bitrate = name.partition('-')
+            if codec not in ENCODED_OUTPUTS:
+                raise AudioSpecError(f"Unknown audio output {name!r}")
+            try:
+                bitrate = int(bitrate) if bitrate else ENCODED_OUTPUTS[codec]['bitrate']
+            except ValueError:
+                raise AudioSpecError(f"Invalid bitrate in {name!r}")
+            if bitrate not in BITRATES:
+                raise AudioSpecError(f"Bitrate must be one of {', '.join(map(str, BITRATES))} kbps")
+            if not toolchain.can_encode(codec):
+                raise AudioSpecError(f"Encoding to {codec} is not available on this server")
+            output = {'name': f"{codec}-{bitrate}", 'codec': codec, 'ext': ENCODED_OUTPUTS[codec]['ext'],
+                      'bitrate': bitrate, 'copy': False}
+        if output['name'] not in [o['name'] for o in outputs]:
+            outputs.append(output)
+
+    if len(outputs) > MAX_OUTPUTS:
+        raise AudioSpecError(f"At most {MAX_OUTPUTS} audio outputs per download")
+    return outputs
+
+
+def source_format(outputs):
+    """yt-dlp format selector for the track all outputs are made from, preferring what the copies need"""
+    copy_codecs = {o['codec'] for o in outputs if o['copy'] and o['codec']}
+    if copy_codecs == {'aac'}:
+        return 'bestaudio[ext=m4a]/bestaudio[acodec^=mp4a]/bestaudio'
+    if copy_codecs == {'opus'}:
+        return 'bestaudio[ext=webm][acodec=opus]/bestaudio[acodec=opus]/bestaudio'
+    if not copy_codecs and all(o['copy'] for o in outputs):
+        # 'native' only: m4a plays everywhere, so prefer it like the plain audio downloads always did
+        return 'bestaudio[ext=m4a]/bestaudio'
+    return 'bestaudio'
+
+
+def canonical(outputs):
+    """Quality setting naming exactly these outputs, so 'mp3' and 'mp3-256' share downloads"""
+    return ','.join(o['name'] for o in outputs)
+
+
+def mode(outputs):
+    """'audio-copy' if no output needs an encoder, 'audio-encode' otherwise"""
+    return 'audio-copy' if all(o['copy'] for o in outputs) else 'audio-encode'
+
+
+def track_codec(acodec):
+    """Normalise a yt-dlp acodec ('mp4a.40.2', 'opus', ...) to 'aac', 'opus' or the value itself"""
+    acodec = (acodec or '').lower()
+    if acodec.startswith('mp4a') or acodec == 'aac':
+        return 'aac'
+    return acodec or None
+
+
+def expected_extension(output, info=None):
+    """Extension an output will have; for 'native' that of the best audio-only format in info"""
+    if output['ext']:
+        return output['ext']
+    formats = [f for f in (info or {}).get('formats') or [] if f.get('vcodec') == 'none' and f.get('url')]
+    return formats[-1].get('ext', 'm4a') if formats else 'm4a'
+
+
+def codec_args(output, source_codec):
+    """
+    ffmpeg codec options producing an output from a track
+
+    A copy output whose codec the downloaded track doesn't have (the preferred
+    format was missing) is encoded into its container's codec instead.
+    """
+    if output['copy'] and output['codec'] in (None, source_codec):
+        return ['-c:a', 'copy']
+    codec = output['codec']
+    bitrate = output['bitrate'] or ENCODED_OUTPUTS[codec]['bitrate']
+    encoder = _encoder(codec)
+    if encoder is None:
+        raise AudioSpecError(f"Encoding to {codec} is not available on this server")
+    return ['-c:a', encoder, '-b:a', f"{bitrate}k"]
+
+
+def _run_ffmpeg(cmd):
+    """Run ffmpeg and return the CPU seconds it used, None where the platform can't tell"""
+    process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if hasattr(os, 'wait4'):
+        # Read stderr before waiting so a chatty ffmpeg can't block on a full pipe
+        stderr = process.stderr.read()
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status) if hasattr(os, 'waitstatus_to_exitcode') \
+            else (status >> 8)
+        cpu_seconds = usage.ru_utime + usage.ru_stime
+    else:
+        _, stderr = process.communicate()
+        cpu_seconds = None
+    process.stderr.close()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {stderr.decode('utf-8', 'replace').strip()[-500:]}")
+    return cpu_seconds
+
+
+def convert(source_path, source_acodec, outputs):
+    """
+    Produce every output from a downloaded track with at most one ffmpeg run
+
+    An output that is a copy into the container the track already has is the
+    downloaded file itself. The others are written next to it, named
+    <source base>.<output name>.<ext>.
+
+    Args:
+        source_path (str): Downloaded audio file
+        source_acodec (str): acodec of the downloaded format
+        outputs (list): Outputs from parse()
+
+    Returns:
+        tuple: (list of file paths in the order of outputs, CPU seconds spent in ffmpeg)
+    """
+    source_codec = track_codec(source_acodec)
+    base, source_ext = os.path.splitext(source_path)
+    source_ext = source_ext.lstrip('.')
+
+    paths = []
+    ffmpeg_outputs = []
+    source_used = False
+    for output in outputs:
+        ext = output['ext'] or source_ext
+        same_file = output['copy'] and ext == source_ext and output['codec'] in (None, source_codec)
+        if same_file and not source_used:
+            paths.append(source_path)
+            source_used = True
+            continue
+        path = f"{base}.{output['name']}.{ext}"
+        ffmpeg_outputs += ['-map', '0:a:0', '-vn'] + codec_args(output, source_codec) + [path]
+        paths.append(path)
+
+    cpu_seconds = 0.0
+    if ffmpeg_outputs:
+        ffmpeg = toolchain.probe()['ffmpeg']
+        if ffmpeg is None:
+            raise AudioSpecError('Converting audio needs ffmpeg, which is not available')
+        started = time.monotonic()
+        cpu_seconds = _run_ffmpeg([ffmpeg, '-hide_banner', '-loglevel', 'error', '-y', '-i', source_path]
+                                  + ffmpeg_outputs)
+        if cpu_seconds is None:
+            # Without wait4 the wall time is the closest upper bound
+            cpu_seconds = time.monotonic() - started
+    if not source_used:
+        os.remove(source_path)
+    return paths, cpu_seconds
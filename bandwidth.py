@@ -0,0 +1,213 @@
+"""
+Token-bucket bandwidth sharing for upstream downloads (ingress) and file serving (egress)
+
+Each direction has an aggregate cap, split between the active flows by weighted
+max-min fairness: a flow never gets more than it has recently been using (plus
+headroom to grow), and what it leaves over goes to the others. Ingress flows are
+download jobs, egress flows are client IPs, so one big job or one client with many
+parallel range requests can't starve everyone else. Shorts and audio jobs get a
+larger weight from their scheduler lane and finish sooner.
+
+Limits are per process: BANDWIDTH_INGRESS_MBIT and BANDWIDTH_EGRESS_MBIT are the
+container's totals and are divided between the WEB_CONCURRENCY gunicorn workers.
+0 (the default) leaves a direction unlimited. Ingress usage is measured either way;
+egress only when capped, as uncapped files go out with sendfile() past the app.
+"""
+import os
+import threading
+import time
+
+import scheduler
+
+_WORKERS = max(int(os.environ.get('WEB_CONCURRENCY', 1)), 1)
+INGRESS_LIMIT = float(os.environ.get('BANDWIDTH_INGRESS_MBIT', 0)) * 125000 / _WORKERS
+EGRESS_LIMIT = float(os.environ.get('BANDWIDTH_EGRESS_MBIT', 0)) * 125000 / _WORKERS
+# Bytes a flow may send at once after being idle, in seconds of its share
+BURST_SECONDS = float(os.environ.get('BANDWIDTH_BURST_SECONDS', 0.5))
+
+# Share weights of the scheduler lanes
+LANE_WEIGHTS = {scheduler.PRIORITY_HIGH: 4, scheduler.PRIORITY_NORMAL: 2, scheduler.PRIORITY_LOW: 1}
+
+# Shares are recomputed this often from the rates measured in between
+REBALANCE_INTERVAL = 0.5
+# A flow that moved no bytes for this long no longer takes a share
+IDLE_SECONDS = 2.0
+# A flow is allowed this much more than its measured rate, so it can ramp up
+GROWTH = 1.5
+# And at least this much, so a new or stalled flow isn't stuck near zero
+MIN_SHARE = 64 * 1024
+# Longest single wait, so a changed share takes effect soon
+MAX_SLEEP = 0.25
+
+
+class BandwidthManager:
+    """
+    Aggregate cap and per-flow token buckets for one direction
+
+    Args:
+        direction (str): 'ingress' or 'egress'
+        limit (float): Bytes per second for all flows together, 0 for no limit
+    """
+
+    def __init__(self, direction, limit, burst_seconds=BURST_SECONDS):
+        self.direction = direction
+        self.limit = limit
+        self.burst_seconds = burst_seconds
+        self._flows = {}
+        self._lock = threading.Lock()
+        self._rebalanced_at = time.monotonic()
+        self._window_bytes = 0
+        self._rate = 0.0
+        self._total_bytes = 0
+
+    def _flow(self, key, weight, now):
+        flow = self._flows.get(key)
+        if flow is None:
+            # Not measured yet: a new flow starts with a full fair share
+            flow = self._flows[key] = {'weight': weight, 'share': None, 'tokens': 0.0, 'refilled_at': now,
+                                       'window_bytes': 0, 'rate': None, 'last_seen': now}
+            self._allocate()
+        elif weight > flow['weight']:
+            flow['weight'] = weight
+            self._allocate()
+        return flow
+
+    def _rebalance(self, now):
+        # Called with the lock held: measure rates, drop idle flows and hand out the link again
+        elapsed = now - self._rebalanced_at
+        if elapsed > 0:
+            self._rate = 0.7 * self._rate + 0.3 * (self._window_bytes / elapsed)
+            for flow in self._flows.values():
+                measured = flow['window_bytes'] / elapsed
+                flow['rate'] = measured if flow['rate'] is None else 0.7 * flow['rate'] + 0.3 * measured
+                flow['window_bytes'] = 0
+        self._window_bytes = 0
+        self._rebalanced_at = now
+        for key in [key for key, flow in self._flows.items() if now - flow['last_seen'] > IDLE_SECONDS]:
+            del self._flows[key]
+        self._allocate()
+
+    def _allocate(self):
+        # Called with the lock held
+        if not self.limit or not self._flows:
+            return
+        # Water-filling: flows that want less than an equal (weighted) split get what they want,
+        # the rest is split between the others by weight
+        demands = {key: float('inf') if flow['rate'] is None else max(flow['rate'] * GROWTH, MIN_SHARE)
+                   for key, flow in self._flows.items()}
+        remaining = self.limit
+        weights = sum(flow['weight'] for flow in self._flows.values())
+        for key in sorted(self._flows, key=lambda key: demands[key] / self._flows[key]['weight']):
+            flow = self._flows[key]
+            fair = remaining * flow['weight'] / weights
+            flow['share'] = min(demands[key], fair)
+            remaining -= flow['share']
+            weights -= flow['weight']
+        # Left over only if every flow got what it wants: the headroom is split by weight too
+        if remaining > 0:
+            weights = sum(flow['weight'] for flow in self._flows.values())
+            for flow in self._flows.values():
+                flow['share'] += remaining * flow['weight'] / weights
+
+    def consume(self, key, nbytes, weight=1):
+        """
+        Account for bytes of a flow, waiting until its share allows them
+
+        Bytes are taken first and paid back by waiting, so chunks larger than the
+        bucket still go through at the flow's rate.
+
+        Args:
+            key (str): Flow, e.g. a job's download key or a client IP
+            nbytes (int): Bytes just transferred or about to be
+            weight (int): Share weight of the flow, see LANE_WEIGHTS
+        """
+        if nbytes <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            flow = self._flow(key, weight, now)
+            flow['last_seen'] = now
+            flow['window_bytes'] += nbytes
+            self._window_bytes += nbytes
+            self._total_bytes += nbytes
+            if now - self._rebalanced_at >= REBALANCE_INTERVAL:
+                self._rebalance(now)
+            if not self.limit:
+                return
+            self._refill(flow, now)
+            flow['tokens'] -= nbytes
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                flow = self._flow(key, weight, now)
+                flow['last_seen'] = now
+                self._refill(flow, now)
+                if flow['tokens'] >= 0:
+                    return
+                wait = -flow['tokens'] / flow['share']
+            time.sleep(min(wait, MAX_SLEEP))
+
+    def _refill(self, flow, now):
+        share = flow['share'] or self.limit
+        flow['tokens'] = min(flow['tokens'] + (now - flow['refilled_at']) * share, share * self.burst_seconds)
+        flow['refilled_at'] = now
+
+    def throttle(self, chunks, key, weight=1):
+        """
+        Pace an iterable of byte chunks, e.g. a response body, to the flow's share
+
+        The iterable is closed when the returned generator is, so response bodies
+        still release their files and processes.
+        """
+        try:
+            for chunk in chunks:
+                self.consume(key, len(chunk), weight)
+                yield chunk
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+
+    @property
+    def limited(self):
+        """True if this direction has a cap"""
+        return bool(self.limit)
+
+    def share(self, key):
+        """Bytes per second currently allocated to a flow, None if unlimited or not active"""
+        with self._lock:
+            flow = self._flows.get(key)
+            if not self.limit or flow is None or flow['share'] is None:
+                return None
+            return int(flow['share'])
+
+    def rate(self):
+        """Measured bytes per second over the last few seconds"""
+        with self._lock:
+            if time.monotonic() - self._rebalanced_at >= REBALANCE_INTERVAL:
+                self._rebalance(time.monotonic())
+            return int(self._rate)
+
+    def stats(self):
+        """Return the limit, measured rate, utilization and the active flows' shares"""
+        rate = self.rate()
+        with self._lock:
+            return {
+                'limit_bps': int(self.limit) or None,
+                'rate_bps': rate,
+                'utilization': round(rate / self.limit, 3) if self.limit else None,
+                'total_bytes': self._total_bytes,
+                'active_flows': len(self._flows),
+                'shares_bps': sorted((int(flow['share']) for flow in self._flows.values() if flow['share']),
+                                     reverse=True)[:20],
+            }
+
+
+def lane_weight(priority):
+    """Share weight for a scheduler lane"""
+    return LANE_WEIGHTS.get(priority, 1)
+
+
+ingress = BandwidthManager('ingress', INGRESS_LIMIT)
+egress = BandwidthManager('egress', EGRESS_LIMIT)
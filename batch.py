@@ -0,0 +1,393 @@
+"""
+Playlist, channel and multi-URL batch downloads
+
+Entries are expanded lazily with extract_flat, fed to the download scheduler a few
+at a time per batch, and the finished files can be streamed back as one ZIP archive
+that is assembled while it is being sent.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+import zipfile
+
+import scheduler
+import youtube_helper
+from ytdlp_loader import yt_dlp
+
+logger = logging.getLogger(__name__)
+
+# Items taken from one playlist or channel
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 200))
+# Items of one batch queued or downloading at the same time
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 3))
+# Seconds between job store checks while waiting on batch items
+BATCH_POLL_INTERVAL = float(os.environ.get('BATCH_POLL_INTERVAL', 1))
+# Longest a ZIP download waits on unfinished items; what has not finished by then is listed as failed
+BATCH_ZIP_TIMEOUT = float(os.environ.get('BATCH_ZIP_TIMEOUT', 3600))
+
+ZIP_READ_SIZE = 256 * 1024
+
+
+def expand_entries(source, max_items=BATCH_MAX_ITEMS):
+    """
+    Yield the videos of a playlist/channel URL or of a list of URLs
+
+    Playlist pages are only fetched as the generator is consumed.
+
+    Args:
+        source (str or list): Playlist or channel URL, or a list of video URLs
+        max_items (int): Stop after this many entries
+
+    Yields:
+        dict: 'url' and 'title' (None if the flat entry has none) of each video
+    """
+    if isinstance(source, (list, tuple)):
+        for url in source[:max_items]:
+            yield {'url': url, 'title': None}
+        return
+
+    opts = youtube_helper.get_enhanced_ydl_opts({
+        'extract_flat': 'in_playlist',
+        'lazy_playlist': True,
+        'playlistend': max_items,
+        'noplaylist': False,
+        'quiet': True,
+        'skip_download': True,
+    })
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        # process=False keeps 'entries' as the extractor's generator, so pages load on demand
+        info = ydl.extract_info(source, download=False, process=False)
+        if not info:
+            raise ValueError('Could not read the playlist')
+        if info.get('_type') not in ('playlist', 'multi_video'):
+            yield {'url': info.get('webpage_url') or source, 'title': info.get('title')}
+            return
+
+        count = 0
+        for entry in _flat_entries(ydl, info):
+            yield entry
+            count += 1
+            if count >= max_items:
+                return
+
+
+def _flat_entries(ydl, playlist, depth=0):
+    for entry in playlist.get('entries') or []:
+        if not entry:
+            continue
+        url = entry.get('url') or entry.get('webpage_url')
+        if not url:
+            continue
+        if entry.get('_type') == 'playlist' or (entry.get('ie_key') == 'YoutubeTab' and depth == 0):
+            # Channel tabs (Videos, Shorts, ...) are playlists of their own, go one level down
+            if depth == 0:
+                nested = ydl.extract_info(url, download=False, process=False)
+                if nested:
+                    yield from _flat_entries(ydl, nested, depth + 1)
+            continue
+        if not url.startswith(('http://', 'https://')):
+            url = f"https://www.youtube.com/watch?v={entry.get('id') or url}"
+        yield {'url': url, 'title': entry.get('title')}
+
+
+class BatchRunner:
+    """
+    Expands batches and feeds their items to the download scheduler
+
+    Batch records live in the job store next to the item jobs, so any worker can
+    report on them; the expansion itself runs on the worker that accepted the batch.
+    If that worker dies, job recovery hands the record to another worker's runner
+    (see recover).
+
+    Args:
+        jobs (JobStore): Store for batch and item records
+        start_item (callable): start_item(job_id, url, format_type, quality, profile) queues
+                               one download; may raise scheduler.QueueFullError
+        concurrency (int): Items per batch queued or downloading at once
+    """
+
+    def __init__(self, jobs, start_item, concurrency=BATCH_CONCURRENCY, max_items=BATCH_MAX_ITEMS,
+                 poll_interval=BATCH_POLL_INTERVAL, zip_timeout=BATCH_ZIP_TIMEOUT):
+        self.jobs = jobs
+        self.start_item = start_item
+        self.concurrency = concurrency
+        self.max_items = max_items
+        self.poll_interval = poll_interval
+        self.zip_timeout = zip_timeout
+        self._lock = threading.Lock()
+        # Batches whose record this process keeps up to date
+        self._running = set()
+
+    def start(self, source, format_type='video', quality='best', profile=None):
+        """
+        Create a batch and start expanding it in the background
+
+        Args:
+            source (str or list): Playlist or channel URL, or a list of video URLs
+            format_type (str): 'video' or 'audio'
+            quality (str): Quality setting for every item
+            profile (str): Throughput profile for every item
+
+        Returns:
+            str: Batch ID
+        """
+        batch_id = str(uuid.uuid4())
+        self.jobs.create(batch_id, {
+            'kind': 'batch',
+            'status': 'pending',
+            'phase': 'expanding',
+            'progress': 0,
+            'format': format_type,
+            'quality': quality,
+            'profile': profile,
+            'items': [],
+            'expanded': False,
+            'error': None,
+        })
+        self._start_thread(batch_id, self._run, (batch_id, source, format_type, quality, profile))
+        return batch_id
+
+    def recover(self, batch):
+        """
+        Take over a batch whose runner died
+
+        A batch that was still being expanded keeps the items queued so far (the
+        source is not stored, so the rest can't be listed again) and records the
+        interruption as its error. The record is closed once the items have ended;
+        interrupted items themselves are resumed by job recovery.
+
+        Args:
+            batch (dict): Batch record
+        """
+        batch_id = batch['job_id']
+        items = batch['items']
+        if not batch.get('expanded'):
+            self.jobs.update(batch_id, expanded=True,
+                             error=f"Batch was interrupted after queueing {len(items)} item(s)",
+                             **({} if items else {'status': 'failed', 'phase': 'failed'}))
+            if not items:
+                return
+        self._start_thread(batch_id, self._close, (batch_id, {item['job_id'] for item in items}))
+
+    def running(self):
+        """Return the IDs of the batches this process is running, for heartbeats"""
+        with self._lock:
+            return list(self._running)
+
+    def _start_thread(self, batch_id, target, args):
+        with self._lock:
+            self._running.add(batch_id)
+
+        def run():
+            try:
+                target(*args)
+            finally:
+                with self._lock:
+                    self._running.discard(batch_id)
+
+        thread = threading.Thread(target=run, name=f"batch-{batch_id[:8]}")
+        thread.daemon = True
+        thread.start()
+
+    def _active_items(self, job_ids):
+        active = set()
+        for job_id in job_ids:
+            job = self.jobs.get(job_id)
+            if job is not None and job['status'] == 'pending':
+                active.add(job_id)
+        return active
+
+    def _run(self, batch_id, source, format_type, quality, profile):
+        items = []
+        active = set()
+        try:
+            for entry in expand_entries(source, self.max_items):
+                # Per-batch limit: wait for a running item to finish before queueing the next
+                while len(active) >= self.concurrency:
+                    time.sleep(self.poll_interval)
+                    active = self._active_items(active)
+
+                job_id = str(uuid.uuid4())
+                while True:
+                    try:
+                        self.start_item(job_id, entry['url'], format_type, quality, profile)
+                        break
+                    except scheduler.QueueFullError as e:
+                        # Back off like an HTTP client would on a 503
+                        time.sleep(e.retry_after)
+
+                active.add(job_id)
+                items.append({'job_id': job_id, 'url': entry['url'], 'title': entry['title']})
+                self.jobs.update(batch_id, items=items, phase='downloading')
+        except Exception as e:
+            logger.warning("Expansion failed after %d item(s): %s", len(items), e, extra={'batch_id': batch_id})
+            self.jobs.update(batch_id, items=items, expanded=True, error=str(e),
+                             **({} if items else {'status': 'failed', 'phase': 'failed'}))
+            return
+
+        self.jobs.update(batch_id, items=items, expanded=True)
+        logger.info("Queued %d item(s)", len(items), extra={'batch_id': batch_id})
+        self._close(batch_id, active)
+
+    def _close(self, batch_id, active):
+        # Close the batch record once every item has ended
+        active = self._active_items(active)
+        while active:
+            time.sleep(self.poll_interval)
+            active = self._active_items(active)
+        summary = self.summary(self.jobs.get(batch_id))
+        self.jobs.update(batch_id, status=summary['status'], phase=summary['status'], progress=100)
+
+    def summary(self, batch):
+        """
+        Aggregate progress of a batch from its item jobs
+
+        Args:
+            batch (dict): Batch record
+
+        Returns:
+            dict: Status, counts, overall progress and per-item status
+        """
+        items = []
+        counts = {'pending': 0, 'completed': 0, 'failed': 0}
+        progress_total = 0
+        for item in batch['items']:
+            job = self.jobs.get(item['job_id']) or {'status': 'failed', 'error': 'Job expired', 'progress': 0}
+            counts[job['status']] = counts.get(job['status'], 0) + 1
+            progress_total += 100 if job['status'] in ('completed', 'failed') else job.get('progress') or 0
+            items.append({
+                'job_id': item['job_id'],
+                'url': item['url'],
+                'title': job.get('title') or item['title'],
+                'status': job['status'],
+                'progress': job.get('progress'),
+                'error': job.get('error'),
+            })
+
+        total = len(items)
+        if not batch.get('expanded') or counts['pending']:
+            status = 'pending'
+        elif batch['status'] == 'failed' or (total and counts['failed'] == total) or not total:
+            status = 'failed'
+        else:
+            status = 'completed'
+
+        return {
+            'batch_id': batch['job_id'],
+            'status': status,
+            'phase': batch.get('phase'),
+            'expanded': batch.get('expanded', False),
+            'total': total,
+            'completed': counts['completed'],
+            'failed': counts['failed'],
+            'pending': counts['pending'],
+            'progress': int(progress_total / total) if total else 0,
+            'error': batch.get('error'),
+            'items': items,
+        }
+
+    def finished_items(self, batch_id, timeout=None):
+        """
+        Yield item jobs of a batch as they finish, in completion order
+
+        Args:
+            batch_id (str): Batch ID
+            timeout (float): Stop waiting after this many seconds, defaults to zip_timeout
+
+        Yields:
+            dict: Item job record (completed or failed); at the deadline, items still
+                running are yielded as failed
+        """
+        deadline = time.monotonic() + (self.zip_timeout if timeout is None else timeout)
+        seen = set()
+        while True:
+            batch = self.jobs.get(batch_id)
+            if batch is None:
+                return
+            waiting = []
+            for item in batch['items']:
+                if item['job_id'] in seen:
+                    continue
+                job = self.jobs.get(item['job_id'])
+                if job is None or job['status'] in ('completed', 'failed'):
+                    seen.add(item['job_id'])
+                    if job is not None:
+                        yield job
+                else:
+                    waiting.append(job)
+            if not waiting and (batch.get('expanded') or batch['status'] != 'pending'):
+                return
+            if time.monotonic() >= deadline:
+                logger.warning("Gave up waiting on %d item(s)", len(waiting), extra={'batch_id': batch_id})
+                for job in waiting:
+                    yield dict(job, status='failed', error='Not finished when the archive was closed')
+                return
+            time.sleep(self.poll_interval)
+
+
+class _ZipSink:
+    """Write-only buffer; without seek() zipfile writes a streamable archive with data descriptors"""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def zip_stream(files):
+    """
+    Build a ZIP archive while it is being sent
+
+    Media is already compressed, so entries are stored; nothing is written to disk.
+
+    Args:
+        files (iterable): (archive name, path or bytes) pairs, consumed lazily
+
+    Yields:
+        bytes: Archive chunks
+    """
+    sink = _ZipSink()
+    names = set()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for name, content in files:
+            # Same title twice would clash inside the archive
+            base, ext = os.path.splitext(name)
+            unique, n = name, 1
+            while unique in names:
+                n += 1
+                unique = f"{base} ({n}){ext}"
+            names.add(unique)
+
+            if isinstance(content, bytes):
+                archive.writestr(unique, content)
+                yield sink.drain()
+                continue
+
+            entry = zipfile.ZipInfo.from_file(content, unique)
+            entry.compress_type = zipfile.ZIP_STORED
+            with open(content, 'rb') as source, archive.open(entry, 'w', force_zip64=True) as dest:
+                while True:
+                    chunk = source.read(ZIP_READ_SIZE)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
@@ -0,0 +1,66 @@
+"""
+Check how the bandwidth manager splits a capped link between competing flows
+
+Threads stand in for downloads: a big video job (bulk lane), Shorts/audio jobs
+(high lane) and one job whose origin is slower than its fair share. Each pushes
+chunks through bandwidth.BandwidthManager.consume for a few seconds; the rate
+every flow got, their total and the cap are printed.
+
+Usage: python benchmarks/bandwidth_sharing.py [--limit-mbit 32] [--seconds 5] [--shorts 2]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bandwidth
+import scheduler
+
+CHUNK = 64 * 1024
+
+
+def run_flow(manager, key, weight, seconds, results, origin_rate=None):
+    deadline = time.monotonic() + seconds
+    sent = 0
+    while time.monotonic() < deadline:
+        if origin_rate:
+            time.sleep(CHUNK / origin_rate)
+        manager.consume(key, CHUNK, weight)
+        sent += CHUNK
+    results[key] = sent / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--limit-mbit', type=float, default=32)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--shorts', type=int, default=2, help='high-lane flows next to the big job')
+    parser.add_argument('--slow-kbps', type=float, default=2000, help='origin rate of the slow flow, kbit/s')
+    args = parser.parse_args()
+
+    limit = args.limit_mbit * 125000
+    manager = bandwidth.BandwidthManager('ingress', limit)
+    flows = [('big-video', bandwidth.lane_weight(scheduler.PRIORITY_LOW), None)]
+    flows += [(f"short-{i}", bandwidth.lane_weight(scheduler.PRIORITY_HIGH), None) for i in range(args.shorts)]
+    flows.append(('slow-origin', bandwidth.lane_weight(scheduler.PRIORITY_NORMAL), args.slow_kbps * 125))
+
+    results = {}
+    threads = [threading.Thread(target=run_flow, args=(manager, key, weight, args.seconds, results, origin))
+               for key, weight, origin in flows]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f"{'flow':<14}{'weight':>8}{'MB/s':>10}")
+    for key, weight, _ in flows:
+        print(f"{key:<14}{weight:>8}{results[key] / 1e6:>10.2f}")
+    total = sum(results.values())
+    print(f"{'total':<14}{'':>8}{total / 1e6:>10.2f}   cap {limit / 1e6:.2f} MB/s ({total / limit:.0%} used)")
+
+
+if __name__ == '__main__':
+    main()
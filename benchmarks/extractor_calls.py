@@ -0,0 +1,100 @@
+"""
+Count yt-dlp extractor invocations per user flow (/download -> /initiate-download -> /download-status)
+
+The extractor is replaced with a fake that returns a synthetic info dict and writes a
+small file on download, so no network access is needed.
+
+Each flow uses a different video unless --same-video is given, so the metadata
+cache and artifact reuse don't hide the per-flow extraction cost.
+
+Usage: python benchmarks/extractor_calls.py [--flows N] [--same-video]
+"""
+import argparse
+import os
+import sys
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# No player cache pre-warm: it would hit YouTube and the patched extractor
+os.environ.setdefault('PLAYER_CACHE_PREWARM_URL', '')
+
+import yt_dlp
+
+import app as downloader_app
+
+FAKE_INFO = {
+    'id': 'bench000001',
+    'title': 'Benchmark Video',
+    'webpage_url': 'https://www.youtube.com/watch?v=bench000001',
+    'extractor': 'youtube',
+    'extractor_key': 'Youtube',
+    'ext': 'mp4',
+    'formats': [{'format_id': '18', 'ext': 'mp4', 'url': 'http://127.0.0.1/fake.mp4'}],
+}
+
+calls = {'extract_info': 0, 'process_ie_result': 0}
+
+
+def _write_fake_download(ydl):
+    outtmpl = ydl.params['outtmpl']['default'] if isinstance(ydl.params['outtmpl'], dict) else ydl.params['outtmpl']
+    filename = outtmpl.replace('%(ext)s', 'mp4')
+    with open(filename, 'wb') as f:
+        f.write(b'\0' * 1024)
+    return dict(FAKE_INFO, requested_downloads=[{'_filename': filename}])
+
+
+def fake_extract_info(self, url, download=True, *args, **kwargs):
+    calls['extract_info'] += 1
+    if download:
+        return _write_fake_download(self)
+    return dict(FAKE_INFO)
+
+
+def fake_process_ie_result(self, ie_result, download=True, *args, **kwargs):
+    calls['process_ie_result'] += 1
+    return _write_fake_download(self)
+
+
+def run_flow(client, url):
+    response = client.post('/download', json={'url': url, 'format': 'video', 'quality': 'best'})
+    data = response.get_json()
+    job_id = client.get(data['redirect']).get_json()['job_id']
+
+    while True:
+        status = client.get(f'/download-status/{job_id}').get_json()
+        if status['status'] != 'pending':
+            return status
+        time.sleep(0.01)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--flows', type=int, default=10, help='number of user flows to run')
+    parser.add_argument('--same-video', action='store_true', help='request the same video in every flow')
+    args = parser.parse_args()
+
+    client = downloader_app.app.test_client()
+    # The enhanced options ask for Chrome cookies, which a benchmark host usually doesn't have
+    no_browser_cookies = lambda *args, **kwargs: yt_dlp.cookies.YoutubeDLCookieJar()
+    with mock.patch.object(yt_dlp.YoutubeDL, 'extract_info', fake_extract_info), \
+            mock.patch.object(yt_dlp.YoutubeDL, 'process_ie_result', fake_process_ie_result), \
+            mock.patch.object(yt_dlp.cookies, 'extract_cookies_from_browser', no_browser_cookies):
+        started = time.perf_counter()
+        for flow in range(args.flows):
+            video_id = FAKE_INFO['id'] if args.same_video else f"bench{flow:06d}"
+            status = run_flow(client, f"https://www.youtube.com/watch?v={video_id}")
+            if status['status'] != 'completed':
+                print(f"Flow failed: {status}")
+                return 1
+        elapsed = time.perf_counter() - started
+
+    print(f"flows: {args.flows}")
+    print(f"extract_info calls per flow: {calls['extract_info'] / args.flows:.2f}")
+    print(f"process_ie_result calls per flow: {calls['process_ie_result'] / args.flows:.2f}")
+    print(f"mean flow time: {elapsed / args.flows * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Compare extraction latency percentiles of sequential and hedged strategy selection
+
+yt-dlp's extractor is replaced by a mock whose latency and failure rate depend on
+the player client, including occasional hangs until socket_timeout. All times are
+multiplied by --scale so a run takes seconds instead of hours.
+
+Usage: python benchmarks/hedged_extraction.py [--requests 100] [--scale 0.1]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp
+
+import hedging
+import strategy_selector
+import youtube_helper
+
+# Per player client: (success probability, success latency, hang probability, failure latency), in seconds
+CLIENT_PROFILES = {
+    'android': (0.85, 1.5, 0.10, 1.0),
+    'ios': (0.90, 2.0, 0.05, 1.0),
+    'tv_embedded': (0.50, 1.0, 0.0, 1.0),
+    'web': (0.90, 3.0, 0.0, 2.0),
+    'web_remix': (0.80, 4.0, 0.0, 2.0),
+}
+SOCKET_TIMEOUT = 30
+
+
+def make_fake_extractor(scale, rng):
+    def fake_extract_info(self, url, download=True, *args, **kwargs):
+        client = self.params['extractor_args']['youtube']['player_client'][0]
+        success_rate, latency, hang_rate, failure_latency = CLIENT_PROFILES.get(client, (0.5, 2.0, 0.0, 1.0))
+        roll = rng.random()
+        if roll < hang_rate:
+            time.sleep(SOCKET_TIMEOUT * scale)
+            raise yt_dlp.utils.DownloadError(f"{client}: read timed out")
+        if roll < hang_rate + success_rate:
+            time.sleep(rng.uniform(0.7, 1.3) * latency * scale)
+            return {'id': url[-11:], 'title': 'Benchmark Video', 'player_client': client}
+        time.sleep(failure_latency * scale)
+        raise yt_dlp.utils.DownloadError(f"{client}: Sign in to confirm you're not a bot")
+    return fake_extract_info
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def run_mode(mode, requests, scale, seed):
+    rng = random.Random(seed)
+
+    def short_pause(cancel=None):
+        delay = rng.uniform(1, 3) * scale
+        if cancel is not None:
+            cancel.wait(delay)
+        else:
+            time.sleep(delay)
+
+    latencies = []
+    failures = 0
+    with mock.patch.object(yt_dlp.YoutubeDL, 'extract_info', make_fake_extractor(scale, rng)), \
+            mock.patch.object(youtube_helper, '_retry_pause', short_pause), \
+            mock.patch.object(youtube_helper, 'EXTRACTION_MODE', mode), \
+            mock.patch.object(hedging, 'HEDGE_DELAY', hedging.HEDGE_DELAY * scale), \
+            mock.patch.object(strategy_selector, 'selector', strategy_selector.StrategySelector()):
+        for i in range(requests):
+            started = time.perf_counter()
+            try:
+                youtube_helper._extract_video_info(f"https://www.youtube.com/watch?v=bench{i:06d}",
+                                                   'video', 'best', True)
+            except Exception:
+                failures += 1
+            latencies.append((time.perf_counter() - started) / scale)
+    return latencies, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=100, help='extractions per mode')
+    parser.add_argument('--scale', type=float, default=0.1, help='factor applied to all simulated times')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    no_browser_cookies = lambda *a, **k: yt_dlp.cookies.YoutubeDLCookieJar()
+    results = {}
+    with mock.patch.object(yt_dlp.cookies, 'extract_cookies_from_browser', no_browser_cookies), \
+            mock.patch('builtins.print'):
+        for mode in ('sequential', 'hedged'):
+            results[mode] = run_mode(mode, args.requests, args.scale, args.seed)
+
+    print(f"Simulated seconds per extraction, hedge delay {hedging.HEDGE_DELAY}s, "
+          f"{hedging.HEDGE_MAX_PARALLEL} parallel")
+    print(f"{'mode':<12} {'p50':>7} {'p90':>7} {'p99':>7} {'max':>7} {'failed':>7}")
+    for mode, (latencies, failures) in results.items():
+        print(f"{mode:<12} {percentile(latencies, 50):>7.2f} {percentile(latencies, 90):>7.2f} "
+              f"{percentile(latencies, 99):>7.2f} {max(latencies):>7.2f} {failures:>7}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
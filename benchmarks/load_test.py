@@ -0,0 +1,413 @@
+"""
+Load-test the download flow against a local mock origin and record a baseline
+
+Starts the mock origin and the app (Werkzeug threaded server) as child processes, then
+runs user flows at a fixed concurrency: /download -> /initiate-download -> /download-status
+polling -> /download-file. Media comes from the origin, either through a stub YouTube
+extractor that maps watch URLs to origin formats (--extractor stub, the default, so the
+YouTube code paths run) or by handing the origin URLs to yt-dlp's generic extractor
+(--extractor generic). The anti-bot sleeps are removed from the yt-dlp options; they
+would dominate every timing.
+
+Reports throughput, latency percentiles per step, the app's peak RSS, peak growth of
+temp_downloads and the mean pipeline phase times from /metrics. --output writes the
+results as JSON; --compare checks a run against such a file and exits with 1 on a regression.
+
+Usage: python benchmarks/load_test.py [--requests 40] [--concurrency 8] [--media mp4|hls|dash]
+                                      [--size-mb 5] [--output baseline.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mock_origin
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DOWNLOAD_FOLDER = os.path.join(ROOT, 'temp_downloads')
+READ_SIZE = 256 * 1024
+
+# Lower is worse for these results, higher is worse for the others
+HIGHER_IS_BETTER = ('flows_per_s', 'served_mb_per_s')
+COMPARED = ('flows_per_s', 'served_mb_per_s', 'latency_ms.flow.p95', 'latency_ms.download.p95',
+            'latency_ms.file.p95', 'peak_rss_mb')
+
+
+def percentile(values, q):
+    """Nearest-rank percentile, None for no values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def folder_size(path):
+    total = 0
+    for folder, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(folder, name))
+            except OSError:
+                pass
+    return total
+
+
+# --- App side: runs in the child process started with --serve ---
+
+def origin_info(base_url, video_id, size, segments):
+    """Info dict for a stub video ID; the prefix picks the media type"""
+    kind = video_id.split('-', 1)[0]
+    if kind in ('hls', 'dash'):
+        return mock_origin.fragmented_info(base_url, video_id, kind, segments=segments,
+                                           segment_size=max(1, size // segments))
+    return mock_origin.video_info(base_url, video_id, size=size)
+
+
+def serve(args):
+    os.environ.setdefault('PLAYER_CACHE_PREWARM_URL', '')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    import yt_dlp
+    from flask import jsonify
+    from werkzeug.serving import make_server
+
+    import app as downloader_app
+    import metadata_cache
+    import youtube_helper
+
+    size = int(args.size_mb * 1024 * 1024)
+    real_extract_info = yt_dlp.YoutubeDL.extract_info
+    real_enhanced_opts = youtube_helper.get_enhanced_ydl_opts
+
+    def stub_extract_info(self, url, download=True, *extra, **kwargs):
+        video_id = metadata_cache.canonical_video_id(url)
+        if video_id == url:
+            # Not a YouTube URL, let the real extractors handle it
+            return real_extract_info(self, url, download, *extra, **kwargs)
+        return self.process_ie_result(origin_info(args.origin, video_id, size, args.segments), download=download)
+
+    def enhanced_opts_without_sleeps(*opts_args, **opts_kwargs):
+        opts = real_enhanced_opts(*opts_args, **opts_kwargs)
+        opts.pop('sleep_interval', None)
+        opts.pop('max_sleep_interval', None)
+        return opts
+
+    def rusage():
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        return jsonify({'peak_rss_bytes': peak if sys.platform == 'darwin' else peak * 1024})
+
+    downloader_app.app.add_url_rule('/_bench/rusage', 'bench_rusage', rusage)
+    # Werkzeug raises its own logger to INFO, one access log line per status poll is noise here
+    logging.getLogger('werkzeug').setLevel(os.environ['LOG_LEVEL'])
+    server = make_server('127.0.0.1', args.port, downloader_app.app, threaded=True)
+    # The enhanced options ask for Chrome cookies, which a benchmark host usually doesn't have
+    no_browser_cookies = lambda *cookie_args, **cookie_kwargs: yt_dlp.cookies.YoutubeDLCookieJar()
+    with mock.patch.object(yt_dlp.YoutubeDL, 'extract_info', stub_extract_info), \
+            mock.patch.object(youtube_helper, 'get_enhanced_ydl_opts', enhanced_opts_without_sleeps), \
+            mock.patch.object(yt_dlp.cookies, 'extract_cookies_from_browser', no_browser_cookies):
+        print(f"Serving on http://127.0.0.1:{args.port}", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+
+
+def start_app(args, origin_url):
+    command = [sys.executable, os.path.abspath(__file__), '--serve', '--port', str(args.port),
+               '--origin', origin_url, '--size-mb', str(args.size_mb), '--segments', str(args.segments)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith('Serving on'):
+        process.kill()
+        raise RuntimeError(f"App did not start: {line!r}")
+    return process
+
+
+# --- Client side ---
+
+class Collector:
+    """Thread-safe latency samples per step and flow outcomes"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.outcomes = {}
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+
+    def add(self, step, seconds):
+        with self._lock:
+            self.latencies.setdefault(step, []).append(seconds)
+
+    def finish(self, outcome, received=0):
+        with self._lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            self.bytes_received += received
+
+
+def request(url, payload=None, timeout=120):
+    """Return (status, body bytes) without raising on HTTP errors"""
+    data = None
+    headers = {}
+    if payload is not None:
+        data = json.dumps(payload).encode('utf-8')
+        headers['Content-Type'] = 'application/json'
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data, headers=headers), timeout=timeout) as r:
+            return r.status, r.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def timed(collector, step, url, payload=None):
+    started = time.perf_counter()
+    status, body = request(url, payload)
+    collector.add(step, time.perf_counter() - started)
+    return status, body
+
+
+def run_flow(app_url, video_url, args, collector):
+    started = time.perf_counter()
+    status, body = timed(collector, 'download', f"{app_url}/download",
+                         {'url': video_url, 'format': args.format, 'quality': args.quality})
+    if status != 200:
+        return collector.finish('failed_download')
+    redirect = json.loads(body)['redirect']
+
+    status, body = timed(collector, 'initiate', f"{app_url}{redirect}")
+    if status == 503:
+        return collector.finish('rejected')
+    if status != 200:
+        return collector.finish('failed_initiate')
+    job_id = json.loads(body)['job_id']
+
+    queued_at = time.perf_counter()
+    while True:
+        status, body = timed(collector, 'status', f"{app_url}/download-status/{job_id}")
+        job = json.loads(body) if status == 200 else {'status': 'failed'}
+        if job['status'] != 'pending':
+            break
+        time.sleep(args.poll_interval)
+    collector.add('job', time.perf_counter() - queued_at)
+    if job['status'] != 'completed':
+        return collector.finish('failed_job')
+
+    file_started = time.perf_counter()
+    received = 0
+    try:
+        with urllib.request.urlopen(f"{app_url}/download-file/{job_id}", timeout=120) as response:
+            collector.add('file_ttfb', time.perf_counter() - file_started)
+            while True:
+                chunk = response.read(READ_SIZE)
+                if not chunk:
+                    break
+                received += len(chunk)
+    except urllib.error.HTTPError:
+        return collector.finish('failed_file')
+    collector.add('file', time.perf_counter() - file_started)
+    collector.add('flow', time.perf_counter() - started)
+    collector.finish('completed', received)
+
+
+def video_url_for(args, origin_url, run_id, index):
+    name = f"{args.media}-{run_id}-{index:05d}"
+    if args.same_video:
+        name = f"{args.media}-{run_id}-shared"
+    size = int(args.size_mb * 1024 * 1024)
+    if args.extractor == 'stub':
+        return f"https://www.youtube.com/watch?v={name}"
+    if args.media == 'mp4':
+        return mock_origin.media_url(origin_url, name, 'mp4', size)
+    return mock_origin.playlist_url(origin_url, name, args.media, args.segments, max(1, size // args.segments))
+
+
+def phase_means(metrics_text):
+    """Mean seconds per pipeline phase from the app's /metrics output"""
+    sums, counts = {}, {}
+    for line in metrics_text.splitlines():
+        match = re.match(r'downloader_phase_seconds_(sum|count)\{phase="(\w+)"[^}]*\} (\S+)', line)
+        if match:
+            target = sums if match.group(1) == 'sum' else counts
+            target[match.group(2)] = target.get(match.group(2), 0) + float(match.group(3))
+    return {phase: round(sums[phase] / counts[phase], 4) for phase in sums if counts.get(phase)}
+
+
+def cpu_means(metrics_text):
+    """Mean CPU seconds per finished download by mode from the app's /metrics output"""
+    sums, counts = {}, {}
+    for line in metrics_text.splitlines():
+        match = re.match(r'downloader_job_cpu_seconds_(sum|count)\{mode="([\w-]+)"[^}]*\} (\S+)', line)
+        if match:
+            target = sums if match.group(1) == 'sum' else counts
+            target[match.group(2)] = target.get(match.group(2), 0) + float(match.group(3))
+    return {mode: round(sums[mode] / counts[mode], 4) for mode in sums if counts.get(mode)}
+
+
+def run(args):
+    origin_process = mock_origin.start_process(args.origin_port, args.rate_mb)
+    origin_url = f"http://127.0.0.1:{args.origin_port}"
+    app_process = None
+    try:
+        app_process = start_app(args, origin_url)
+        app_url = f"http://127.0.0.1:{args.port}"
+
+        os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
+        disk_before = folder_size(DOWNLOAD_FOLDER)
+        disk = {'peak': 0}
+        sampling = threading.Event()
+
+        def sample_disk():
+            while not sampling.wait(0.25):
+                disk['peak'] = max(disk['peak'], folder_size(DOWNLOAD_FOLDER) - disk_before)
+
+        sampler = threading.Thread(target=sample_disk, daemon=True)
+        sampler.start()
+
+        collector = Collector()
+        # Unique IDs per run, so artifacts and cached metadata of earlier runs are not reused
+        run_id = f"{int(time.time())}"
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            futures = [executor.submit(run_flow, app_url, video_url_for(args, origin_url, run_id, index),
+                                       args, collector)
+                       for index in range(args.requests)]
+            for future in futures:
+                future.result()
+        duration = time.perf_counter() - started
+
+        sampling.set()
+        sampler.join()
+        disk['peak'] = max(disk['peak'], folder_size(DOWNLOAD_FOLDER) - disk_before)
+        peak_rss = json.loads(request(f"{app_url}/_bench/rusage")[1])['peak_rss_bytes']
+        metrics_text = request(f"{app_url}/metrics")[1].decode('utf-8')
+    finally:
+        for process in (app_process, origin_process):
+            if process is not None:
+                process.kill()
+                process.wait()
+
+    completed = collector.outcomes.get('completed', 0)
+    return {
+        'flows': args.requests,
+        'outcomes': collector.outcomes,
+        'duration_s': round(duration, 3),
+        'flows_per_s': round(completed / duration, 3),
+        'served_mb_per_s': round(collector.bytes_received / 1024 / 1024 / duration, 3),
+        'latency_ms': {
+            step: {f"p{q}": round(percentile(values, q) * 1000, 1) for q in (50, 90, 95, 99)}
+            for step, values in sorted(collector.latencies.items())
+        },
+        'peak_rss_mb': round(peak_rss / 1024 / 1024, 1),
+        'peak_disk_mb': round(disk['peak'] / 1024 / 1024, 1),
+        'phase_mean_s': phase_means(metrics_text),
+        'job_cpu_mean_s': cpu_means(metrics_text),
+    }
+
+
+def lookup(results, dotted):
+    value = results
+    for part in dotted.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def compare(results, baseline, tolerance):
+    """List of regressions beyond tolerance, as printable strings"""
+    regressions = []
+    for key in COMPARED:
+        current, previous = lookup(results, key), lookup(baseline['results'], key)
+        if current is None or not previous:
+            continue
+        change = (current - previous) / previous
+        worse = -change if key in HIGHER_IS_BETTER else change
+        if worse > tolerance:
+            regressions.append(f"{key}: {previous} -> {current} ({change:+.0%})")
+    return regressions
+
+
+def print_report(results):
+    print(f"flows: {results['flows']}  outcomes: {results['outcomes']}  duration: {results['duration_s']} s")
+    print(f"throughput: {results['flows_per_s']} flows/s, {results['served_mb_per_s']} MB/s served")
+    print(f"app peak RSS: {results['peak_rss_mb']} MB  temp_downloads peak growth: {results['peak_disk_mb']} MB")
+    print(f"{'step':<10} {'p50 ms':>9} {'p90 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for step, values in results['latency_ms'].items():
+        print(f"{step:<10} {values['p50']:>9} {values['p90']:>9} {values['p95']:>9} {values['p99']:>9}")
+    if results['phase_mean_s']:
+        print('mean phase times (s): ' + ', '.join(f"{k}={v}" for k, v in sorted(results['phase_mean_s'].items())))
+    if results.get('job_cpu_mean_s'):
+        print('mean CPU per download (s): ' + ', '.join(f"{k}={v}" for k, v in sorted(results['job_cpu_mean_s'].items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=40, help='user flows to run')
+    parser.add_argument('--concurrency', type=int, default=8, help='flows running at once')
+    parser.add_argument('--media', choices=('mp4', 'hls', 'dash'), default='mp4')
+    parser.add_argument('--extractor', choices=('stub', 'generic'), default='stub')
+    parser.add_argument('--format', choices=('video', 'audio'), default='video',
+                        help="audio needs --media mp4, the only media with an audio-only format")
+    parser.add_argument('--quality', default='best',
+                        help="quality setting; for audio the outputs, e.g. 'native', 'webm' or 'mp3,opus-96'")
+    parser.add_argument('--size-mb', type=float, default=5, help='media size per video')
+    parser.add_argument('--segments', type=int, default=10, help='segments of HLS/DASH media')
+    parser.add_argument('--rate-mb', type=float, default=0, help='origin rate per connection in MB/s, 0 for unlimited')
+    parser.add_argument('--same-video', action='store_true', help='request one video in every flow')
+    parser.add_argument('--poll-interval', type=float, default=0.1, help='seconds between status polls')
+    parser.add_argument('--port', type=int, default=8911, help='port of the app')
+    parser.add_argument('--origin-port', type=int, default=8910)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to check the results against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative regression')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--origin', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return 0
+
+    results = run(args)
+    print_report(results)
+
+    config = {key: getattr(args, key) for key in ('requests', 'concurrency', 'media', 'extractor', 'format',
+                                                  'size_mb', 'segments', 'rate_mb', 'same_video')}
+    if args.output:
+        import yt_dlp
+        with open(args.output, 'w') as f:
+            json.dump({'config': config, 'results': results, 'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'python': platform.python_version(), 'yt_dlp': yt_dlp.version.__version__}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != config:
+            print(f"Warning: baseline was recorded with {baseline.get('config')}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,303 @@
+"""
+Local HTTP origin serving synthetic media for the benchmarks
+
+Files are generated on the fly from their size, so nothing is written to disk.
+Range requests are supported and the transfer rate can be capped to mimic a
+real CDN. HLS playlists and DASH manifests of synthetic segments are served
+under /hls/ and /dash/, so yt-dlp's generic extractor can use every URL directly.
+
+Run it on its own with: python benchmarks/mock_origin.py [--port 8900] [--rate-mb 0]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CHUNK = 64 * 1024
+
+
+def synthetic_bytes(start, length):
+    """Deterministic filler content for a byte range"""
+    pattern = bytes(range(256))
+    offset = start % 256
+    data = (pattern * (length // 256 + 2))[offset:offset + length]
+    return data
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body):
+        parsed = urlparse(self.path)
+        params = parse_qs(parsed.query)
+        playlist = re.match(r'^/hls/([\w-]+)\.m3u8$', parsed.path)
+        if playlist:
+            self._serve_playlist(playlist.group(1), params, send_body)
+            return
+        manifest = re.match(r'^/dash/([\w-]+)\.mpd$', parsed.path)
+        if manifest:
+            self._serve_manifest(manifest.group(1), params, send_body)
+            return
+        match = re.match(r'^/media/[\w-]+\.(mp4|m4a|webm|ts)$', parsed.path)
+        if not match:
+            self.send_error(404)
+            return
+        size = int(params.get('size', [self.server.default_size])[0])
+        content_type = {'mp4': 'video/mp4', 'm4a': 'audio/mp4', 'webm': 'video/webm',
+                        'ts': 'video/mp2t'}[match.group(1)]
+
+        start, end = 0, size - 1
+        status = 200
+        range_header = self.headers.get('Range')
+        if range_header:
+            range_match = re.match(r'bytes=(\d*)-(\d*)', range_header)
+            if range_match:
+                if range_match.group(1):
+                    start = int(range_match.group(1))
+                    if range_match.group(2):
+                        end = min(int(range_match.group(2)), size - 1)
+                else:
+                    start = max(0, size - int(range_match.group(2)))
+                status = 206
+        if start >= size:
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+        if not send_body:
+            return
+
+        rate = self.server.rate
+        position = start
+        started = time.perf_counter()
+        try:
+            while position <= end:
+                length = min(CHUNK, end - position + 1)
+                self.wfile.write(synthetic_bytes(position, length))
+                position += length
+                self.server.bytes_served += length
+                if rate:
+                    # Sleep until the average rate is back under the cap
+                    ahead = (position - start) / rate - (time.perf_counter() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _serve_playlist(self, name, params, send_body):
+        segments = int(params.get('segments', [10])[0])
+        segment_size = int(params.get('segment_size', [1024 * 1024])[0])
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:4', '#EXT-X-MEDIA-SEQUENCE:0']
+        for index in range(segments):
+            lines += ['#EXTINF:4.0,', f"/media/{name}-{index}.ts?size={segment_size}"]
+        lines.append('#EXT-X-ENDLIST')
+        self._send_document(('\n'.join(lines) + '\n').encode('ascii'), 'application/vnd.apple.mpegurl', send_body)
+
+    def _serve_manifest(self, name, params, send_body):
+        segments = int(params.get('segments', [10])[0])
+        segment_size = int(params.get('segment_size', [1024 * 1024])[0])
+        segment_urls = ''.join(f'<SegmentURL media="/media/{name}-{index}.mp4?size={segment_size}"/>'
+                               for index in range(segments))
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" minBufferTime="PT2S" '
+            f'mediaPresentationDuration="PT{segments * 4}S" profiles="urn:mpeg:dash:profile:isoff-main:2011">'
+            '<Period><AdaptationSet mimeType="video/mp4">'
+            '<Representation id="dash" bandwidth="2000000" codecs="avc1.4d401f,mp4a.40.2" width="1280" height="720">'
+            f'<SegmentList timescale="1" duration="4">{segment_urls}</SegmentList>'
+            '</Representation></AdaptationSet></Period></MPD>'
+        ).encode('utf-8')
+        self._send_document(body, 'application/dash+xml', send_body)
+
+    def _send_document(self, body, content_type, send_body):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+
+class MockOrigin:
+    """
+    Threaded HTTP server on 127.0.0.1
+
+    Args:
+        default_size (int): Size of /media/* files without a ?size= parameter
+        rate (int): Bytes per second per connection, 0 for unlimited
+        port (int): Port to listen on, 0 for any free port
+    """
+
+    def __init__(self, default_size=20 * 1024 * 1024, rate=0, port=0):
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+        self.server.daemon_threads = True
+        self.server.default_size = default_size
+        self.server.rate = rate
+        self.server.bytes_served = 0
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    @property
+    def bytes_served(self):
+        return self.server.bytes_served
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def media_url(self, name, ext='mp4', size=None):
+        return media_url(self.base_url, name, ext, size)
+
+    def video_info(self, video_id, size=None, title=None):
+        """Info dict with a progressive mp4 and an m4a format from this origin, see video_info()"""
+        return video_info(self.base_url, video_id, size, title)
+
+    def fragmented_info(self, video_id, protocol='hls', segments=20, segment_size=1024 * 1024, title=None):
+        """Info dict with one segmented format from this origin, see fragmented_info()"""
+        return fragmented_info(self.base_url, video_id, protocol, segments, segment_size, title)
+
+
+def media_url(base_url, name, ext='mp4', size=None):
+    url = f"{base_url}/media/{name}.{ext}"
+    return f"{url}?size={size}" if size else url
+
+
+def playlist_url(base_url, name, protocol='hls', segments=20, segment_size=1024 * 1024):
+    """URL of an HLS playlist or DASH manifest of synthetic segments"""
+    path = f"/hls/{name}.m3u8" if protocol == 'hls' else f"/dash/{name}.mpd"
+    return f"{base_url}{path}?segments={segments}&segment_size={segment_size}"
+
+
+def video_info(base_url, video_id, size=None, title=None):
+    """
+    Build an info dict like yt-dlp's generic extractor would, pointing at an origin
+
+    Contains one progressive mp4 format and one m4a audio format.
+    """
+    formats = [
+        {
+            'format_id': 'audio', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a.40.2',
+            'abr': 128, 'url': media_url(base_url, video_id, 'm4a', size and size // 8),
+            'protocol': 'http',
+        },
+        {
+            'format_id': 'progressive', 'ext': 'mp4', 'vcodec': 'avc1.4d401f', 'acodec': 'mp4a.40.2',
+            'height': 720, 'width': 1280, 'url': media_url(base_url, video_id, 'mp4', size),
+            'protocol': 'http',
+        },
+    ]
+    return _info(video_id, title, formats)
+
+
+def fragmented_info(base_url, video_id, protocol='hls', segments=20, segment_size=1024 * 1024, title=None):
+    """
+    Build an info dict with a single segmented format, pointing at an origin
+
+    Args:
+        protocol (str): 'hls' (m3u8 playlist) or 'dash' (fragment list, as yt-dlp builds from an MPD)
+        segments (int): Number of segments
+        segment_size (int): Bytes per segment
+    """
+    fmt = {'format_id': protocol, 'ext': 'mp4', 'vcodec': 'avc1.4d401f', 'acodec': 'mp4a.40.2',
+           'height': 720, 'width': 1280}
+    if protocol == 'hls':
+        fmt.update({
+            'protocol': 'm3u8_native',
+            'url': playlist_url(base_url, video_id, 'hls', segments, segment_size),
+        })
+    else:
+        fmt.update({
+            'protocol': 'http_dash_segments',
+            'url': playlist_url(base_url, video_id, 'dash', segments, segment_size),
+            'fragment_base_url': f"{base_url}/media/",
+            'fragments': [{'path': f"{video_id}-{index}.mp4?size={segment_size}", 'duration': 4.0}
+                          for index in range(segments)],
+        })
+    return _info(video_id, title, [fmt])
+
+
+def _info(video_id, title, formats):
+    page_url = f"https://www.youtube.com/watch?v={video_id}"
+    return {
+        'id': video_id,
+        'title': title or f"Benchmark {video_id}",
+        'webpage_url': page_url,
+        'original_url': page_url,
+        'extractor': 'generic',
+        'extractor_key': 'Generic',
+        'formats': formats,
+        '_type': 'video',
+    }
+
+
+def start_process(port, rate_mb=0):
+    """
+    Run the origin in a child process, so its CPU and memory stay out of the measurements
+
+    Returns:
+        subprocess.Popen: The running origin, kill() it when done
+    """
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--port', str(port), '--rate-mb', str(rate_mb)],
+        stdout=subprocess.PIPE, text=True
+    )
+    line = process.stdout.readline()
+    if not line.startswith('Serving on'):
+        process.kill()
+        raise RuntimeError(f"Mock origin did not start: {line!r}")
+    return process
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve synthetic media for the benchmarks')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--rate-mb', type=float, default=0, help='per-connection rate in MB/s, 0 for unlimited')
+    args = parser.parse_args()
+
+    origin = MockOrigin(rate=int(args.rate_mb * 1024 * 1024), port=args.port)
+    print(f"Serving on {origin.base_url}", flush=True)
+    try:
+        origin.server.serve_forever()
+    except KeyboardInterrupt:
+        origin.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Measure worker start-up: app import time, time to the first response and the first yt-dlp use per warm-up mode
+
+Each run starts the app in a fresh process serving on a local port:
+- eager/background/lazy set YTDLP_WARMUP;
+- preload imports the app like a preloading gunicorn master (APP_PRELOAD=1),
+  then forks a worker that starts its background services and serves.
+For preload, 'worker ready' is the time from fork to serving, which every later
+worker start (and restart) pays. The player cache pre-warm is disabled, it
+needs the network.
+
+Usage: python benchmarks/startup.py [--runs 5] [--modes eager,background,lazy,preload]
+"""
+import argparse
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ('eager', 'background', 'lazy', 'preload')
+
+
+# --- App side, run in a child process with --serve ---
+
+def serve(mode, port):
+    os.environ['PLAYER_CACHE_PREWARM_URL'] = ''
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    if mode == 'preload':
+        os.environ['APP_PRELOAD'] = '1'
+    else:
+        os.environ['YTDLP_WARMUP'] = mode
+    sys.path.insert(0, ROOT)
+
+    started = time.perf_counter()
+    import app
+    import_seconds = time.perf_counter() - started
+
+    worker_started = time.perf_counter()
+    if mode == 'preload':
+        pid = os.fork()
+        if pid:
+            os.waitpid(pid, 0)
+            return
+        worker_started = time.perf_counter()
+        app.start_background_services()
+
+    import logging
+    import ytdlp_loader
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    @app.app.route('/_bench/ytdlp')
+    def first_ytdlp_use():
+        # What the first extraction waits for before yt-dlp can start working
+        use_started = time.perf_counter()
+        ytdlp_loader.warm('first use')
+        return {'seconds': time.perf_counter() - use_started, 'loaded_by': ytdlp_loader.stats()['loaded_by']}
+
+    server = make_server('127.0.0.1', port, app.app, threaded=True)
+    print(json.dumps({'import_s': import_seconds, 'worker_ready_s': time.perf_counter() - worker_started}),
+          flush=True)
+    server.serve_forever()
+
+
+# --- Client side ---
+
+def get(url):
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=30) as response:
+            body = response.read()
+    except urllib.error.HTTPError as e:
+        body = e.read()
+    return time.perf_counter() - started, body
+
+
+def run_once(mode, port):
+    spawned = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', mode, '--port', str(port)],
+                               stdout=subprocess.PIPE, text=True, start_new_session=True)
+    try:
+        line = process.stdout.readline()
+        if not line.startswith('{'):
+            raise RuntimeError(f"App did not start: {line!r}")
+        result = json.loads(line)
+        index_seconds, _ = get(f"http://127.0.0.1:{port}/")
+        result['first_response_s'] = time.perf_counter() - spawned
+        result['index_ms'] = index_seconds * 1000
+        result['status_ms'] = get(f"http://127.0.0.1:{port}/download-status/unknown")[0] * 1000
+        ytdlp_seconds, body = get(f"http://127.0.0.1:{port}/_bench/ytdlp")
+        result['first_ytdlp_ms'] = json.loads(body)['seconds'] * 1000
+        return result
+    finally:
+        # The whole group: a preload run's forked worker would outlive its parent
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--port', type=int, default=8921)
+    parser.add_argument('--serve', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args.serve, args.port)
+
+    columns = ('import_s', 'worker_ready_s', 'first_response_s', 'index_ms', 'status_ms', 'first_ytdlp_ms')
+    print(f"{'mode':<11}" + ''.join(f"{c:>17}" for c in columns) + '   (medians)')
+    for mode in args.modes.split(','):
+        runs = [run_once(mode, args.port) for _ in range(args.runs)]
+        print(f"{mode:<11}" + ''.join(f"{statistics.median(r[c] for r in runs):>17.3f}" for c in columns))
+
+
+if __name__ == '__main__':
+    main()
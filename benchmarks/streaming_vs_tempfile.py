@@ -0,0 +1,125 @@
+"""
+Compare time-to-first-byte and peak disk use of the temp-file download path
+(/initiate-download + /download-file) against pass-through streaming (/stream-download)
+
+Media is served by a local mock origin; the info dict is handed over through
+info_store the same way /download does, so YouTube is never contacted.
+
+Usage: python benchmarks/streaming_vs_tempfile.py [--size-mb 20] [--rate-mb 10]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# No player cache pre-warm: it would hit YouTube and the patched extractor
+os.environ.setdefault('PLAYER_CACHE_PREWARM_URL', '')
+
+import yt_dlp
+
+import app as downloader_app
+import info_store
+from mock_origin import MockOrigin
+
+
+class DiskSampler(threading.Thread):
+    """Tracks the peak growth of the download folder, ignoring the job database"""
+
+    def __init__(self, folder, interval=0.02):
+        super().__init__(daemon=True)
+        self.folder = folder
+        self.interval = interval
+        self.baseline = self._usage()
+        self.peak = 0
+        self._stop_event = threading.Event()
+
+    def _usage(self):
+        total = 0
+        for root, _, files in os.walk(self.folder):
+            for name in files:
+                if name.startswith('jobs.db'):
+                    continue
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.peak = max(self.peak, self._usage() - self.baseline)
+            time.sleep(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return self.peak
+
+
+def run_tempfile(client, info, url):
+    token = info_store.store_info(info, url)
+    started = time.perf_counter()
+    job_id = client.get('/initiate-download', query_string={'url': url, 'token': token}).get_json()['job_id']
+    while True:
+        status = client.get(f'/download-status/{job_id}').get_json()
+        if status['status'] == 'failed':
+            raise RuntimeError(status.get('error'))
+        if status['status'] == 'completed':
+            break
+        time.sleep(0.05)
+    response = client.get(f'/download-file/{job_id}', buffered=False)
+    body = iter(response.response)
+    first = next(body)
+    ttfb = time.perf_counter() - started
+    size = len(first) + sum(len(chunk) for chunk in body)
+    response.close()
+    return ttfb, time.perf_counter() - started, size
+
+
+def run_streaming(client, info, url):
+    token = info_store.store_info(info, url)
+    started = time.perf_counter()
+    response = client.get('/stream-download', query_string={'url': url, 'token': token}, buffered=False)
+    if response.status_code != 200:
+        raise RuntimeError(response.get_data(as_text=True))
+    body = iter(response.response)
+    first = next(body)
+    ttfb = time.perf_counter() - started
+    size = len(first) + sum(len(chunk) for chunk in body)
+    response.close()
+    return ttfb, time.perf_counter() - started, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-mb', type=float, default=20, help='size of the synthetic video')
+    parser.add_argument('--rate-mb', type=float, default=10, help='origin transfer rate in MB/s, 0 for unlimited')
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    client = downloader_app.app.test_client()
+    # The enhanced options ask for Chrome cookies, which a benchmark host usually doesn't have
+    no_browser_cookies = lambda *a, **k: yt_dlp.cookies.YoutubeDLCookieJar()
+
+    with MockOrigin(default_size=size, rate=int(args.rate_mb * 1024 * 1024)) as origin, \
+            mock.patch.object(yt_dlp.cookies, 'extract_cookies_from_browser', no_browser_cookies):
+        results = {}
+        for mode, runner in (('tempfile', run_tempfile), ('streaming', run_streaming)):
+            video_id = f"{mode}{int(time.time())}"
+            info = origin.video_info(video_id, size=size)
+            sampler = DiskSampler(downloader_app.DOWNLOAD_FOLDER)
+            sampler.start()
+            ttfb, total, received = runner(client, info, info['webpage_url'])
+            results[mode] = (ttfb, total, received, sampler.stop())
+
+    print(f"{'mode':<10} {'ttfb_s':>8} {'total_s':>8} {'bytes':>12} {'peak_disk':>12}")
+    for mode, (ttfb, total, received, peak) in results.items():
+        print(f"{mode:<10} {ttfb:>8.3f} {total:>8.3f} {received:>12} {peak:>12}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
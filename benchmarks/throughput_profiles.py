@@ -0,0 +1,87 @@
+"""
+Measure download throughput and CPU cost of each throughput profile on HLS, DASH and progressive formats
+
+The mock origin runs in a separate process with a per-connection rate cap, so fragment
+concurrency shows up in MB/s and the CPU figures only cover yt-dlp in this process.
+The anti-bot options from get_enhanced_ydl_opts are left out: their random sleeps
+would dominate the timings.
+
+Usage: python benchmarks/throughput_profiles.py [--size-mb 40] [--rate-mb 4] [--segments 40]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp
+
+import throughput
+import mock_origin
+
+
+def run_download(info, profile, folder):
+    opts = throughput.apply_profile({
+        'outtmpl': os.path.join(folder, '%(id)s.%(ext)s'),
+        'quiet': True,
+        'noprogress': True,
+        'no_warnings': True,
+    }, profile)
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        result = ydl.process_ie_result(dict(info), download=True)
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    path = result['requested_downloads'][0]['filepath']
+    size = os.path.getsize(path)
+    os.remove(path)
+    return size, wall, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-mb', type=float, default=40, help='media size per download')
+    parser.add_argument('--rate-mb', type=float, default=4, help='origin rate per connection in MB/s')
+    parser.add_argument('--segments', type=int, default=40, help='segments of the HLS/DASH formats')
+    parser.add_argument('--port', type=int, default=8901)
+    parser.add_argument('--profiles', default=','.join(throughput.PROFILES))
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    origin_process = mock_origin.start_process(args.port, args.rate_mb)
+    base_url = f"http://127.0.0.1:{args.port}"
+    folder = tempfile.mkdtemp(prefix='throughput-bench-')
+
+    rows = []
+    try:
+        for protocol in ('hls', 'dash', 'progressive'):
+            for profile in args.profiles.split(','):
+                video_id = f"{protocol}-{profile}-{int(time.time())}"
+                if protocol == 'progressive':
+                    info = mock_origin.video_info(base_url, video_id, size=size)
+                    info['formats'] = [f for f in info['formats'] if f['format_id'] == 'progressive']
+                else:
+                    info = mock_origin.fragmented_info(base_url, video_id, protocol, segments=args.segments,
+                                                       segment_size=size // args.segments)
+                received, wall, cpu = run_download(info, profile, folder)
+                rows.append((protocol, profile, received, wall, cpu))
+    finally:
+        origin_process.kill()
+        origin_process.wait()
+        shutil.rmtree(folder, ignore_errors=True)
+
+    print(f"Origin capped at {args.rate_mb} MB/s per connection")
+    print(f"{'format':<12} {'profile':<12} {'MB':>7} {'secs':>7} {'MB/s':>7} {'cpu_s':>7} {'cpu%':>6}")
+    for protocol, profile, received, wall, cpu in rows:
+        megabytes = received / 1024 / 1024
+        print(f"{protocol:<12} {profile:<12} {megabytes:>7.1f} {wall:>7.2f} {megabytes / wall:>7.2f} "
+              f"{cpu:>7.2f} {100 * cpu / wall:>6.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+Extraction latency with a fresh YoutubeDL per call (cold) and with the warm instance pool
+
+YouTube's extractor is stubbed to return a synthetic video, so the numbers are the
+client-side overhead per extraction: building YoutubeDL, loading cookies, creating
+extractor instances and format selection. Real extractions additionally save the
+player JS download and signature work on warm instances.
+
+Usage: python benchmarks/ydl_pool.py [--requests 50]
+"""
+import argparse
+import os
+import sys
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp
+from yt_dlp.extractor.youtube import YoutubeIE
+
+import strategy_selector
+import youtube_helper
+import ydl_pool
+
+
+def fake_real_extract(self, url):
+    video_id = self._match_id(url)
+    return {
+        'id': video_id,
+        'title': f"Benchmark {video_id}",
+        'formats': [
+            {'format_id': '18', 'ext': 'mp4', 'height': 360, 'vcodec': 'avc1', 'acodec': 'mp4a',
+             'url': f"https://example.invalid/{video_id}/18.mp4"},
+            {'format_id': '140', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a',
+             'url': f"https://example.invalid/{video_id}/140.m4a"},
+        ],
+    }
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def run(pool_size, requests):
+    latencies = []
+    pool = ydl_pool.YoutubeDLPool(size=pool_size)
+    with mock.patch.object(ydl_pool, 'pool', pool), \
+            mock.patch.object(strategy_selector, 'selector', strategy_selector.StrategySelector()):
+        for i in range(requests):
+            started = time.perf_counter()
+            youtube_helper._extract_video_info(f"https://www.youtube.com/watch?v=bench{i:06d}", 'video', 'best', True)
+            latencies.append(time.perf_counter() - started)
+    return latencies, pool.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=50, help='extractions per mode')
+    args = parser.parse_args()
+
+    no_browser_cookies = lambda *a, **k: yt_dlp.cookies.YoutubeDLCookieJar()
+    results = {}
+    with mock.patch.object(yt_dlp.cookies, 'extract_cookies_from_browser', no_browser_cookies), \
+            mock.patch.object(YoutubeIE, '_real_extract', fake_real_extract), \
+            mock.patch('builtins.print'):
+        for mode, size in (('cold', 0), ('warm', ydl_pool.POOL_SIZE or 8)):
+            results[mode] = run(size, args.requests)
+
+    print(f"{'mode':<6} {'mean_ms':>8} {'p50_ms':>8} {'p95_ms':>8} {'created':>8} {'reused':>8}")
+    for mode, (latencies, stats) in results.items():
+        print(f"{mode:<6} {1000 * sum(latencies) / len(latencies):>8.1f} {1000 * percentile(latencies, 50):>8.1f} "
+              f"{1000 * percentile(latencies, 95):>8.1f} {stats['created']:>8} {stats['reused']:>8}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""
+Time-range clips: download only the part of a video between a start and an end time
+
+yt-dlp's download_ranges hands the range to ffmpeg, which seeks in the source and
+fetches only the byte ranges or HLS/DASH fragments it needs. Cuts are stream copies
+starting at the keyframe before the start time; 'precise' re-encodes instead so the
+clip starts exactly on time.
+
+A clip travels with the job as a suffix of its quality setting, '<quality>@<start>-<end>'
+plus ':precise', so clip jobs get their own flights, artifacts and resumes.
+"""
+import re
+
+import toolchain
+
+CLIP_SEPARATOR = '@'
+PRECISE_SUFFIX = ':precise'
+CUT_MODES = ('keyframe', 'precise')
+
+_TIME = re.compile(r'^(?:(?:(\d+):)?(\d+):([0-5]?\d(?:\.\d+)?)|(\d+(?:\.\d+)?))$')
+
+
+class ClipError(ValueError):
+    """Raised for a start/end pair that doesn't describe a clip this server can cut"""
+
+
+def parse_time(value):
+    """
+    Read a clip time
+
+    Args:
+        value (str): Seconds ('90', '90.5') or [hh:]mm:ss ('1:30', '01:02:03.5')
+
+    Returns:
+        float: Seconds
+
+    Raises:
+        ClipError: If the value is not a time
+    """
+    match = _TIME.match(str(value).strip())
+    if not match:
+        raise ClipError(f"Invalid time {value!r}, use seconds or [hh:]mm:ss")
+    hours, minutes, seconds, plain_seconds = match.groups()
+    # Millisecond precision, what the clip's quality setting keeps
+    if plain_seconds is not None:
+        return round(float(plain_seconds), 3)
+    return round(int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(seconds), 3)
+
+
+def make_clip(start, end, cut=None):
+    """
+    Validate a requested range
+
+    Args:
+        start (str): Start time, see parse_time; None or empty for the beginning
+        end (str): End time
+        cut (str): 'keyframe' (default) to stream-copy from the keyframe before the start,
+                   'precise' to re-encode for frame-accurate cuts
+
+    Returns:
+        dict: 'start', 'end' (seconds) and 'precise', or None if neither time was given
+
+    Raises:
+        ClipError: If the range is invalid or ffmpeg is not available to cut it
+    """
+    if start in (None, '') and end in (None, ''):
+        return None
+    if end in (None, ''):
+        raise ClipError("A clip needs an end time")
+    if (cut or 'keyframe') not in CUT_MODES:
+        raise ClipError(f"Unknown cut {cut!r}, use one of: {', '.join(CUT_MODES)}")
+    clip = {'start': parse_time(start) if start not in (None, '') else 0.0, 'end': parse_time(end),
+            'precise': cut == 'precise'}
+    if clip['end'] <= clip['start']:
+        raise ClipError("The clip must end after it starts")
+    if not toolchain.can_stream_copy():
+        raise ClipError("Clips need ffmpeg, which is not available on this server")
+    return clip
+
+
+def check_duration(clip, duration):
+    """
+    Make sure a clip starts within the video
+
+    Raises:
+        ClipError: If the video is known to end before the clip starts
+    """
+    if clip and duration and clip['start'] >= duration:
+        raise ClipError(f"The clip starts after the end of the video ({duration:g}s)")
+
+
+def _seconds(value):
+    """Shortest text for a time, '90' rather than '90.0'"""
+    return f"{value:.3f}".rstrip('0').rstrip('.')
+
+
+def encode(quality, clip):
+    """Quality setting carrying a clip, the quality itself if there is none"""
+    if clip is None:
+        return quality
+    suffix = f"{CLIP_SEPARATOR}{_seconds(clip['start'])}-{_seconds(clip['end'])}"
+    return quality + suffix + (PRECISE_SUFFIX if clip['precise'] else '')
+
+
+def split(quality):
+    """
+    Separate the clip from a quality setting
+
+    Returns:
+        tuple: (quality without the clip, clip dict or None)
+
+    Raises:
+        ClipError: If the clip part can't be read
+    """
+    if not quality or CLIP_SEPARATOR not in quality:
+        return quality, None
+    base, suffix = quality.rsplit(CLIP_SEPARATOR, 1)
+    precise = suffix.endswith(PRECISE_SUFFIX)
+    if precise:
+        suffix = suffix[:-len(PRECISE_SUFFIX)]
+    start, _, end = suffix.partition('-')
+    try:
+        return base, {'start': float(start), 'end': float(end), 'precise': precise}
+    except ValueError:
+        raise ClipError(f"Invalid clip {suffix!r}") from None
+
+
+def filename_suffix(clip):
+    """Part of the download filename telling clips apart, e.g. '_clip_90-120s'"""
+    return f"_clip_{_seconds(clip['start'])}-{_seconds(clip['end'])}s" if clip else ''
+
+
+def ydl_options(clip):
+    """yt-dlp options that download only the clip"""
+    from ytdlp_loader import yt_dlp
+
+    return {
+        'download_ranges': yt_dlp.utils.download_range_func(None, [(clip['start'], clip['end'])]),
+        'force_keyframes_at_cuts': clip['precise'],
+    }
@@ -0,0 +1,217 @@
+"""
+Serving finished downloads with byte ranges, conditional requests and proxy offload
+
+Supports single and multiple byte ranges (multipart/byteranges), ETag/If-None-Match,
+If-Modified-Since and If-Range. With FILE_OFFLOAD set, the response only carries an
+X-Accel-Redirect (nginx) or X-Sendfile header and the proxy sends the bytes.
+"""
+import os
+import re
+import unicodedata
+import uuid
+from urllib.parse import quote
+
+from flask import Response, request
+from werkzeug.http import http_date, parse_date, parse_etags, quote_etag, unquote_etag
+
+# 'x-accel' (nginx), 'x-sendfile' (Apache/lighttpd) or empty to serve from the app
+FILE_OFFLOAD = os.environ.get('FILE_OFFLOAD', '').lower()
+# Internal nginx location that maps to the download folder, used with x-accel
+X_ACCEL_PREFIX = os.environ.get('X_ACCEL_PREFIX', '/protected-downloads/')
+# Above this many ranges the request is served as a plain 200, as many servers do
+MAX_RANGES = 16
+
+READ_SIZE = 256 * 1024
+HEX_DIGEST = re.compile(r'^[0-9a-f]{64}$')
+
+
+def file_etag(path, stat):
+    """Content digest for content-addressed artifacts, size and mtime otherwise"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    if HEX_DIGEST.match(name):
+        return name
+    return f"{int(stat.st_mtime)}-{stat.st_size}"
+
+
+def parse_byte_ranges(header, size):
+    """
+    Parse a Range header into absolute byte ranges
+
+    Args:
+        header (str): Range header value, e.g. 'bytes=0-99,-500'
+        size (int): File size
+
+    Returns:
+        list: (start, end) tuples with inclusive ends; None if the header is malformed
+              (ignored per RFC 9110); an empty list if no range is satisfiable
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec:
+        return None
+
+    ranges = []
+    for part in spec.split(','):
+        first, sep, last = part.strip().partition('-')
+        if not sep:
+            return None
+        try:
+            if first == '':
+                # Suffix range: the last N bytes
+                length = int(last)
+                if length == 0:
+                    continue
+                ranges.append((max(0, size - length), size - 1))
+                continue
+            start = int(first)
+            end = int(last) if last else None
+        except ValueError:
+            return None
+        if end is not None and start > end:
+            return None
+        if start < size:
+            ranges.append((start, size - 1 if end is None else min(end, size - 1)))
+    return ranges
+
+
+def set_attachment(headers, download_name):
+    """Set Content-Disposition, with an RFC 5987 filename* for non-ASCII names"""
+    try:
+        download_name.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        headers.set('Content-Disposition', 'attachment', filename=simple,
+                    **{'filename*': f"UTF-8''{quote(download_name, safe='!#$&+^`|~')}"})
+    else:
+        headers.set('Content-Disposition', 'attachment', filename=download_name)
+
+
+def _is_fresh(etag, mtime):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        # Weak comparison, as required for If-None-Match
+        return parse_etags(if_none_match).contains_weak(etag)
+    if_modified_since = parse_date(request.headers.get('If-Modified-Since'))
+    return if_modified_since is not None and int(mtime) <= if_modified_since.timestamp()
+
+
+def _if_range_matches(etag, mtime):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        # Only a strong ETag match may be used for ranges
+        tag, weak = unquote_etag(if_range)
+        return not weak and tag == etag
+    date = parse_date(if_range)
+    return date is not None and int(mtime) == int(date.timestamp())
+
+
+def _read_range(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(READ_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _file_body(path, start, size):
+    # Open-ended ranges go through the server's wsgi.file_wrapper: gunicorn turns that
+    # into a zero-copy sendfile() from the current offset
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    if file_wrapper is None:
+        return _read_range(path, start, size - 1)
+    f = open(path, 'rb')
+    f.seek(start)
+    return file_wrapper(f, READ_SIZE)
+
+
+def serve_file(path, mimetype, download_name, download_folder):
+    """
+    Build the response for a finished download
+
+    Args:
+        path (str): File to send
+        mimetype (str): Content type of the file
+        download_name (str): Filename suggested to the client
+        download_folder (str): Root that X_ACCEL_PREFIX maps to
+
+    Returns:
+        Response: 200, 206, 304 or 416 response
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = file_etag(path, stat)
+
+    response = Response(mimetype=mimetype, direct_passthrough=True)
+    response.headers['ETag'] = quote_etag(etag)
+    response.headers['Last-Modified'] = http_date(stat.st_mtime)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Cache-Control'] = 'private, max-age=3600'
+    set_attachment(response.headers, download_name)
+
+    if _is_fresh(etag, stat.st_mtime):
+        response.status_code = 304
+        return response
+
+    if FILE_OFFLOAD in ('x-accel', 'x-sendfile'):
+        # The proxy handles ranges and conditionals itself from here on
+        if FILE_OFFLOAD == 'x-accel':
+            relative = os.path.relpath(path, download_folder).replace(os.sep, '/')
+            response.headers['X-Accel-Redirect'] = X_ACCEL_PREFIX.rstrip('/') + '/' + quote(relative)
+        else:
+            response.headers['X-Sendfile'] = path
+        return response
+
+    ranges = None
+    range_header = request.headers.get('Range')
+    if range_header and _if_range_matches(etag, stat.st_mtime):
+        ranges = parse_byte_ranges(range_header, size)
+        if ranges is not None and len(ranges) > MAX_RANGES:
+            ranges = None
+
+    if ranges is None:
+        response.content_length = size
+        response.response = _file_body(path, 0, size)
+        return response
+
+    if not ranges:
+        response.status_code = 416
+        response.headers['Content-Range'] = f"bytes */{size}"
+        response.content_length = 0
+        return response
+
+    response.status_code = 206
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        response.headers['Content-Range'] = f"bytes {start}-{end}/{size}"
+        response.content_length = end - start + 1
+        if end == size - 1:
+            response.response = _file_body(path, start, size)
+        else:
+            response.response = _read_range(path, start, end)
+        return response
+
+    # Several ranges: multipart/byteranges body with one part per range
+    boundary = uuid.uuid4().hex
+    parts = []
+    for start, end in ranges:
+        head = (f"--{boundary}\r\nContent-Type: {mimetype}\r\n"
+                f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n").encode('ascii')
+        parts.append((head, start, end))
+    closing = f"\r\n--{boundary}--\r\n".encode('ascii')
+
+    def multipart_body():
+        for index, (head, start, end) in enumerate(parts):
+            yield (b"\r\n" if index else b"") + head
+            yield from _read_range(path, start, end)
+        yield closing
+
+    response.content_length = (sum(len(head) + end - start + 1 for head, start, end in parts)
+                               + 2 * (len(parts) - 1) + len(closing))
+    response.headers['Content-Type'] = f"multipart/byteranges; boundary={boundary}"
+    response.response = multipart_body()
+    return response
@@ -0,0 +1,135 @@
+"""
+Compact format ladder of a video: every downloadable format with resolution, codecs,
+bitrate and size, built from one extraction
+
+Jobs can ask for one of the listed formats with the quality setting 'id:<format_id>'
+instead of a preset, and download it from the same (cached) info dict.
+"""
+import toolchain
+
+FORMAT_ID_PREFIX = 'id:'
+
+# UI presets and the single-file format spec each one stands for, see app.background_download
+PRESET_HEIGHTS = {'best': None, '1080': 1080, '720': 720, '480': 480}
+
+
+def format_id_of(quality):
+    """The format ID of an 'id:<format_id>' quality setting, None for presets"""
+    if quality and quality.startswith(FORMAT_ID_PREFIX):
+        return quality[len(FORMAT_ID_PREFIX):]
+    return None
+
+
+def find_format(info, format_id):
+    """The format dict with this ID in an info dict, None if there is none"""
+    return next((f for f in info.get('formats') or [] if f.get('format_id') == format_id), None)
+
+
+def download_format(fmt):
+    """
+    yt-dlp format spec for downloading a format picked from the ladder
+
+    Video-only formats get the best audio merged in when ffmpeg is there to do it.
+    """
+    if _kind(fmt) == 'video' and toolchain.can_stream_copy():
+        return f"{fmt['format_id']}+bestaudio/{fmt['format_id']}"
+    return fmt['format_id']
+
+
+def streamable(fmt):
+    """
+    True if a format can be piped to the client as it is
+
+    A video-only format only gets its audio from a merge, which needs a seekable
+    file; those are downloaded by jobs instead.
+    """
+    return _kind(fmt) != 'video'
+
+
+def _kind(fmt):
+    has_video = fmt.get('vcodec') not in (None, 'none')
+    has_audio = fmt.get('acodec') not in (None, 'none')
+    if has_video and has_audio:
+        return 'video+audio'
+    if has_video:
+        return 'video'
+    if has_audio:
+        return 'audio'
+    return None
+
+
+def _size(fmt, duration):
+    """(bytes, exact) from the reported size, yt-dlp's estimate or bitrate x duration"""
+    if fmt.get('filesize'):
+        return fmt['filesize'], True
+    if fmt.get('filesize_approx'):
+        return fmt['filesize_approx'], False
+    if fmt.get('tbr') and duration:
+        return int(fmt['tbr'] * 1000 / 8 * duration), False
+    return None, False
+
+
+def _entry(fmt, duration):
+    size, exact = _size(fmt, duration)
+    entry = {
+        'format_id': fmt['format_id'],
+        'kind': _kind(fmt),
+        'ext': fmt.get('ext'),
+        'width': fmt.get('width'),
+        'height': fmt.get('height'),
+        'fps': fmt.get('fps'),
+        'vcodec': fmt.get('vcodec') if fmt.get('vcodec') != 'none' else None,
+        'acodec': fmt.get('acodec') if fmt.get('acodec') != 'none' else None,
+        'kbps': round(fmt['tbr']) if fmt.get('tbr') else None,
+        'audio_kbps': round(fmt['abr']) if fmt.get('abr') else None,
+        'protocol': fmt.get('protocol'),
+        'filesize': size,
+        'filesize_exact': exact if size else None,
+    }
+    return {key: value for key, value in entry.items() if value is not None}
+
+
+def build(info):
+    """
+    Build the ladder of an extracted video
+
+    Args:
+        info (dict): Info dict from youtube_helper.extract_video_info
+
+    Returns:
+        dict: 'video_id', 'title', 'duration', 'formats' (best first: formats with
+              video, then audio-only) and 'presets' mapping the UI presets and
+              'audio' to the entry each one downloads
+    """
+    duration = info.get('duration')
+    # Storyboards and other formats without media streams can't be downloaded as a file
+    formats = [f for f in info.get('formats') or [] if f.get('format_id') and f.get('url') and _kind(f)]
+    entries = [_entry(f, duration) for f in formats]
+    best_audio = next((e for e in reversed(entries) if e['kind'] == 'audio'), None)
+
+    for entry in entries:
+        if entry['kind'] == 'video':
+            # What the download will be once download_format merges the best audio in
+            entry['audio_merged'] = toolchain.can_stream_copy() and best_audio is not None
+            if entry['audio_merged'] and entry.get('filesize') and best_audio.get('filesize'):
+                entry['filesize_with_audio'] = entry['filesize'] + best_audio['filesize']
+
+    # yt-dlp lists formats worst first, so the last match of a preset is the one it picks
+    presets = {}
+    for preset, max_height in PRESET_HEIGHTS.items():
+        candidates = [e for e in entries if e['kind'] == 'video+audio'
+                      and (max_height is None or (e.get('height') or 0) <= max_height)]
+        if candidates:
+            presets[preset] = candidates[-1]['format_id']
+    if best_audio:
+        presets['audio'] = best_audio['format_id']
+
+    video_entries = [e for e in entries if e['kind'] != 'audio']
+    audio_entries = [e for e in entries if e['kind'] == 'audio']
+    return {
+        'video_id': info.get('id'),
+        'title': info.get('title'),
+        'duration': duration,
+        'formats': video_entries[::-1] + audio_entries[::-1],
+        'presets': presets,
+    }
@@ -0,0 +1,19 @@
+"""
+gunicorn settings: preload the app in the master so yt-dlp is imported once and shared by the workers
+
+GUNICORN_PRELOAD=0 turns preloading off, each worker then imports the app
+(and starts its background threads) on its own.
+"""
+import os
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+if preload_app:
+    # Read by app.py at import: load yt-dlp, but leave starting threads to the forked workers
+    os.environ['APP_PRELOAD'] = '1'
+
+
+def post_fork(server, worker):
+    if preload_app:
+        import app
+        app.start_background_services()
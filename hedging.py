@@ -0,0 +1,102 @@
+"""
+Hedged execution: start the next candidate when the current one is slow, keep the first success
+
+Used by youtube_helper to race extraction strategies. Losing candidates are told
+to stop through a cancel event and otherwise abandoned; a process-wide slot pool
+bounds how many extra (hedge) attempts can run at once.
+"""
+import os
+import queue
+import threading
+
+# Seconds to wait on a running candidate before starting the next one
+HEDGE_DELAY = float(os.environ.get('HEDGE_DELAY', 3))
+# Candidates one request may run at the same time
+HEDGE_MAX_PARALLEL = int(os.environ.get('HEDGE_MAX_PARALLEL', 2))
+# Hedge attempts running at once across all requests in this process
+HEDGE_GLOBAL_LIMIT = int(os.environ.get('HEDGE_GLOBAL_LIMIT', 4))
+
+hedge_slots = threading.BoundedSemaphore(HEDGE_GLOBAL_LIMIT)
+
+
+class AllCandidatesFailed(Exception):
+    """Raised when no candidate returned a result; wraps the last error"""
+
+    def __init__(self, last_error):
+        super().__init__(str(last_error) if last_error else 'No candidate returned a result')
+        self.last_error = last_error
+
+
+def first_success(candidates, delay=None, max_parallel=None, slots=None):
+    """
+    Run candidates with hedging and return the first truthy result
+
+    The first candidate starts right away. Whenever nothing has finished for
+    `delay` seconds and fewer than `max_parallel` are running, the next one is
+    started as a hedge, if a global slot is free. When a candidate fails and
+    nothing else is running, the next one starts immediately, like a plain
+    sequential loop would.
+
+    Args:
+        candidates (list): (name, func) pairs; func(cancel) returns a result or
+                           raises, and should give up once cancel is set
+        delay (float): Hedge delay in seconds, HEDGE_DELAY by default
+        max_parallel (int): Candidates running at once for this call, HEDGE_MAX_PARALLEL by default
+        slots (threading.Semaphore): Shared limit on hedge attempts, hedge_slots by default
+
+    Returns:
+        tuple: (name, result) of the winning candidate
+
+    Raises:
+        AllCandidatesFailed: If every candidate failed
+    """
+    delay = HEDGE_DELAY if delay is None else delay
+    max_parallel = HEDGE_MAX_PARALLEL if max_parallel is None else max_parallel
+    slots = hedge_slots if slots is None else slots
+
+    cancel = threading.Event()
+    results = queue.Queue()
+    pending = list(candidates)
+    running = 0
+    last_error = None
+
+    def launch(name, func, holds_slot):
+        def run():
+            try:
+                results.put((name, func(cancel), None))
+            except Exception as e:
+                results.put((name, None, e))
+            finally:
+                # The slot is held until the work really stops, abandoned or not
+                if holds_slot:
+                    slots.release()
+        thread = threading.Thread(target=run, name=f"hedge-{name}")
+        thread.daemon = True
+        thread.start()
+
+    try:
+        while pending or running:
+            if not running:
+                name, func = pending.pop(0)
+                launch(name, func, holds_slot=False)
+                running += 1
+
+            can_hedge = pending and running < max_parallel
+            try:
+                name, result, error = results.get(timeout=delay if can_hedge else None)
+            except queue.Empty:
+                if slots.acquire(blocking=False):
+                    name, func = pending.pop(0)
+                    launch(name, func, holds_slot=True)
+                    running += 1
+                continue
+
+            running -= 1
+            if result:
+                return name, result
+            last_error = error or last_error
+    finally:
+        # Losers still running stop at their next checkpoint
+        cancel.set()
+
+    raise AllCandidatesFailed(last_error)
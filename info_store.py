@@ -0,0 +1,93 @@
+"""
+Short-lived store for video metadata handed off from /download to the download job,
+so the job can reuse the extracted info dict instead of extracting the URL again
+"""
+import os
+import time
+import uuid
+
+import job_store
+from ytdlp_loader import yt_dlp
+
+# Signed stream URLs in the info dict expire after a few hours, keep handoffs well below that
+HANDOFF_TTL = int(os.environ.get('INFO_HANDOFF_TTL', 1800))
+# Status of handoff records, so job queries by status never see them
+HANDOFF_STATUS = 'handoff'
+
+# Process-local until the app hands over its shared job store, see use_store
+_store = job_store.MemoryJobStore()
+
+
+def use_store(store):
+    """
+    Keep handoffs in a job store shared by all workers
+
+    The follow-up request may reach another gunicorn worker than the one that
+    extracted the info; with a SQLite or Redis store it finds the handoff there too.
+    """
+    global _store
+    _store = store
+
+
+def is_handoff(record):
+    """True for handoff records stored next to the jobs"""
+    return record is not None and record.get('kind') == 'handoff'
+
+
+def _purge_expired(now):
+    for record in _store.find(status=HANDOFF_STATUS, older_than=now - HANDOFF_TTL, limit=100):
+        _store.delete(record['job_id'])
+
+
+def store_info(info, video_url):
+    """
+    Store an extracted info dict and return a token for the follow-up download job
+
+    Args:
+        info (dict): Info dict returned by yt-dlp's extract_info
+        video_url (str): URL the info was extracted from
+
+    Returns:
+        str: Handoff token
+    """
+    # Same cleanup yt-dlp applies to --load-info-json, so the stored copy can be re-processed
+    # (and serialised by the shared stores)
+    clean_info = yt_dlp.YoutubeDL.sanitize_info(info, remove_private_keys=True)
+    token = uuid.uuid4().hex
+    now = time.time()
+
+    _purge_expired(now)
+    _store.create(token, {
+        'kind': 'handoff',
+        'status': HANDOFF_STATUS,
+        'info': clean_info,
+        'url': video_url,
+        'expires_at': now + HANDOFF_TTL,
+    })
+
+    return token
+
+
+def get_info(token, video_url):
+    """
+    Look up a stored info dict
+
+    Args:
+        token (str): Token returned by store_info
+        video_url (str): URL the caller is about to download, must match the stored one
+
+    Returns:
+        dict: Info dict, or None if the token is unknown, expired or for another URL
+    """
+    if not token:
+        return None
+
+    entry = _store.get(token)
+    if not is_handoff(entry):
+        return None
+    if entry['expires_at'] <= time.time():
+        _store.delete(token)
+        return None
+    if entry['url'] != video_url:
+        return None
+    return entry['info']
@@ -0,0 +1,388 @@
+"""
+Pluggable storage for download job records
+
+The in-memory backend only works within one process. The SQLite (WAL) and Redis
+backends let every gunicorn worker see the same jobs and keep them across restarts.
+Pick one with JOB_STORE=memory|sqlite|redis.
+"""
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+JOB_STORE = os.environ.get('JOB_STORE', 'sqlite')
+JOB_STORE_PATH = os.environ.get('JOB_STORE_PATH')
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+# Minimum seconds between progress writes for the same job
+PROGRESS_WRITE_INTERVAL = float(os.environ.get('JOB_PROGRESS_INTERVAL', 1.0))
+
+
+class JobStore:
+    """
+    Interface of a job store
+
+    Job records are flat dicts of JSON-serialisable values. Every record has
+    'job_id', 'status', 'started_at' and 'updated_at'; other fields are free-form.
+    """
+
+    def create(self, job_id, fields):
+        """Insert a new job record"""
+        raise NotImplementedError
+
+    def get(self, job_id):
+        """Return a copy of a job record, or None"""
+        raise NotImplementedError
+
+    def update(self, job_id, **fields):
+        """Atomically merge fields into a job record, returns False if the job doesn't exist"""
+        raise NotImplementedError
+
+    def delete(self, job_id):
+        """Remove a job record"""
+        raise NotImplementedError
+
+    def find(self, status=None, older_than=None, limit=100):
+        """
+        Look up jobs by status and age
+
+        Args:
+            status (str): Only jobs with this status
+            older_than (float): Only jobs last updated before this timestamp
+            limit (int): Maximum number of records
+
+        Returns:
+            list: Job records, least recently updated first
+        """
+        raise NotImplementedError
+
+    def count_by_status(self):
+        """Return a {status: count} dict"""
+        raise NotImplementedError
+
+    def __contains__(self, job_id):
+        return self.get(job_id) is not None
+
+
+def _new_record(job_id, fields):
+    now = time.time()
+    record = {'status': 'pending', 'started_at': now}
+    record.update(fields)
+    record['job_id'] = job_id
+    record['updated_at'] = now
+    return record
+
+
+class MemoryJobStore(JobStore):
+    """Process-local job store, only correct with a single worker process"""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job_id, fields):
+        with self._lock:
+            self._jobs[job_id] = _new_record(job_id, fields)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            job.update(fields)
+            job['updated_at'] = time.time()
+            return True
+
+    def delete(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def find(self, status=None, older_than=None, limit=100):
+        with self._lock:
+            jobs = [dict(j) for j in self._jobs.values()
+                    if (status is None or j['status'] == status)
+                    and (older_than is None or j['updated_at'] < older_than)]
+        return sorted(jobs, key=lambda j: j['updated_at'])[:limit]
+
+    def count_by_status(self):
+        counts = {}
+        with self._lock:
+            for job in self._jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+        return counts
+
+
+class SQLiteJobStore(JobStore):
+    """Job store in a SQLite database in WAL mode, shared by all workers on the host"""
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'job_id TEXT PRIMARY KEY, status TEXT NOT NULL, '
+                'started_at REAL NOT NULL, updated_at REAL NOT NULL, data TEXT NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_status_updated ON jobs (status, updated_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated_at)')
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        try:
+            conn.execute('PRAGMA synchronous=NORMAL')
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _row_to_record(row):
+        record = json.loads(row[4])
+        record.update({'job_id': row[0], 'status': row[1], 'started_at': row[2], 'updated_at': row[3]})
+        return record
+
+    def create(self, job_id, fields):
+        record = _new_record(job_id, fields)
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO jobs (job_id, status, started_at, updated_at, data) VALUES (?, ?, ?, ?, ?)',
+                (job_id, record['status'], record['started_at'], record['updated_at'], json.dumps(record))
+            )
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT job_id, status, started_at, updated_at, data FROM jobs WHERE job_id = ?', (job_id,)
+            ).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def update(self, job_id, **fields):
+        with self._connect() as conn:
+            # BEGIN IMMEDIATE takes the write lock up front, so the read-modify-write is atomic
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute(
+                    'SELECT job_id, status, started_at, updated_at, data FROM jobs WHERE job_id = ?', (job_id,)
+                ).fetchone()
+                if row is None:
+                    conn.execute('ROLLBACK')
+                    return False
+                record = self._row_to_record(row)
+                record.update(fields)
+                record['updated_at'] = time.time()
+                conn.execute(
+                    'UPDATE jobs SET status = ?, started_at = ?, updated_at = ?, data = ? WHERE job_id = ?',
+                    (record['status'], record['started_at'], record['updated_at'], json.dumps(record), job_id)
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return True
+
+    def delete(self, job_id):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM jobs WHERE job_id = ?', (job_id,))
+
+    def find(self, status=None, older_than=None, limit=100):
+        query = 'SELECT job_id, status, started_at, updated_at, data FROM jobs WHERE 1 = 1'
+        params = []
+        if status is not None:
+            query += ' AND status = ?'
+            params.append(status)
+        if older_than is not None:
+            query += ' AND updated_at < ?'
+            params.append(older_than)
+        query += ' ORDER BY updated_at LIMIT ?'
+        params.append(limit)
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [self._row_to_record(row) for row in rows]
+
+    def count_by_status(self):
+        with self._connect() as conn:
+            rows = conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        return dict(rows)
+
+
+class RedisJobStore(JobStore):
+    """
+    Job store in Redis, shared across hosts
+
+    Each job is a hash of JSON-encoded fields. A sorted set per status, scored by
+    updated_at, serves the status/age lookups.
+    """
+
+    def __init__(self, client, prefix='downloader'):
+        from redis import WatchError
+
+        self.client = client
+        self.prefix = prefix
+        self._watch_error = WatchError
+
+    def _job_key(self, job_id):
+        return f"{self.prefix}:job:{job_id}"
+
+    def _status_key(self, status):
+        return f"{self.prefix}:status:{status}"
+
+    def _statuses_key(self):
+        return f"{self.prefix}:statuses"
+
+    def _decode(self, raw):
+        if not raw:
+            return None
+        return {(k.decode() if isinstance(k, bytes) else k): json.loads(v) for k, v in raw.items()}
+
+    def _write(self, pipe, record, old_status=None):
+        pipe.hset(self._job_key(record['job_id']),
+                  mapping={k: json.dumps(v) for k, v in record.items()})
+        if old_status is not None and old_status != record['status']:
+            pipe.zrem(self._status_key(old_status), record['job_id'])
+        pipe.zadd(self._status_key(record['status']), {record['job_id']: record['updated_at']})
+        pipe.sadd(self._statuses_key(), record['status'])
+
+    def create(self, job_id, fields):
+        pipe = self.client.pipeline()
+        self._write(pipe, _new_record(job_id, fields))
+        pipe.execute()
+
+    def get(self, job_id):
+        return self._decode(self.client.hgetall(self._job_key(job_id)))
+
+    def update(self, job_id, **fields):
+        key = self._job_key(job_id)
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    # Optimistic transaction: retried if another worker touches the job meanwhile
+                    pipe.watch(key)
+                    record = self._decode(pipe.hgetall(key))
+                    if record is None:
+                        pipe.reset()
+                        return False
+                    old_status = record['status']
+                    record.update(fields)
+                    record['updated_at'] = time.time()
+                    pipe.multi()
+                    self._write(pipe, record, old_status)
+                    pipe.execute()
+                    return True
+                except self._watch_error:
+                    continue
+
+    def delete(self, job_id):
+        record = self.get(job_id)
+        if record is None:
+            return
+        pipe = self.client.pipeline()
+        pipe.delete(self._job_key(job_id))
+        pipe.zrem(self._status_key(record['status']), job_id)
+        pipe.execute()
+
+    def find(self, status=None, older_than=None, limit=100):
+        if status is not None:
+            statuses = [status]
+        else:
+            statuses = [s.decode() if isinstance(s, bytes) else s
+                        for s in self.client.smembers(self._statuses_key())]
+        max_score = f"({older_than}" if older_than is not None else '+inf'
+        jobs = []
+        for job_status in statuses:
+            for job_id in self.client.zrangebyscore(self._status_key(job_status), '-inf', max_score,
+                                                    start=0, num=limit):
+                record = self.get(job_id.decode() if isinstance(job_id, bytes) else job_id)
+                if record:
+                    jobs.append(record)
+        return sorted(jobs, key=lambda j: j['updated_at'])[:limit]
+
+    def count_by_status(self):
+        counts = {}
+        for status in self.client.smembers(self._statuses_key()):
+            status = status.decode() if isinstance(status, bytes) else status
+            counts[status] = self.client.zcard(self._status_key(status))
+        return counts
+
+
+class ThrottledProgressWriter:
+    """
+    Rate-limits progress writes so yt-dlp's per-chunk hook callbacks don't hit the store each time
+
+    A job's progress is written at most once per interval, and only when it changed.
+    The latest skipped update is kept, so flush() can write it before the job moves on.
+    """
+
+    def __init__(self, store, interval=PROGRESS_WRITE_INTERVAL):
+        self.store = store
+        self.interval = interval
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def set_progress(self, job_id, progress, **fields):
+        """
+        Record progress for a job, skipping the write if it is too soon or unchanged
+
+        Returns:
+            bool: True if the write went through to the store
+        """
+        now = time.time()
+        with self._lock:
+            last = self._last.get(job_id)
+            if last and last['progress'] == progress:
+                return False
+            if last and now - last['written_at'] < self.interval:
+                last['pending'] = dict(fields, progress=progress)
+                return False
+            self._last[job_id] = {'progress': progress, 'written_at': now, 'pending': None}
+        self.store.update(job_id, progress=progress, **fields)
+        return True
+
+    def flush(self, job_id):
+        """
+        Write the latest progress update that was held back by the interval
+
+        Returns:
+            bool: True if there was one to write
+        """
+        with self._lock:
+            last = self._last.get(job_id)
+            pending = last and last['pending']
+            if not pending:
+                return False
+            last.update(progress=pending['progress'], written_at=time.time(), pending=None)
+        self.store.update(job_id, **pending)
+        return True
+
+    def forget(self, job_id):
+        """Drop throttling state once a job is finished"""
+        with self._lock:
+            self._last.pop(job_id, None)
+
+
+def create_job_store(default_folder):
+    """
+    Build the job store selected by the JOB_STORE environment variable
+
+    Args:
+        default_folder (str): Folder for the SQLite file when JOB_STORE_PATH is unset
+
+    Returns:
+        JobStore: Configured store
+    """
+    if JOB_STORE == 'memory':
+        return MemoryJobStore()
+    if JOB_STORE == 'redis':
+        # Imported only when selected, it is a noticeable part of start-up time otherwise
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("JOB_STORE=redis requires the 'redis' package")
+        return RedisJobStore(redis.Redis.from_url(REDIS_URL))
+    return SQLiteJobStore(JOB_STORE_PATH or os.path.join(default_folder, 'jobs.db'))
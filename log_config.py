@@ -0,0 +1,66 @@
+"""
+Logging setup: level from LOG_LEVEL, plain text or one JSON object per line from LOG_FORMAT
+
+Modules log through logging.getLogger(__name__) with %-style arguments, so a
+disabled level costs one isEnabledFor check and no string formatting. Fields passed
+in `extra` (job_id, batch_id, strategy, ...) are emitted as structured fields.
+"""
+import json
+import logging
+import os
+import sys
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# 'text' or 'json'
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text').lower()
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def _extra_fields(record):
+    return {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS and not k.startswith('_')}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the `extra` fields at the top level"""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Classic log line followed by the `extra` fields as key=value pairs"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if fields:
+            line += ' ' + ' '.join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+def configure():
+    """Install the handler on the root logger once; later calls do nothing"""
+    root = logging.getLogger()
+    if getattr(root, '_downloader_configured', False):
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter())
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    # yt-dlp's screen output is debug chatter unless LOG_LEVEL asks for it
+    logging.getLogger('yt_dlp').setLevel(os.environ.get('YTDLP_LOG_LEVEL', 'WARNING').upper())
+    root._downloader_configured = True
@@ -0,0 +1,221 @@
+"""
+Bounded TTL + LRU cache for extracted video metadata, with an optional SQLite backing store
+so entries survive gunicorn worker restarts
+"""
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+# Cache configuration, overridable from the environment
+CACHE_SIZE = int(os.environ.get('METADATA_CACHE_SIZE', 256))
+CACHE_TTL = int(os.environ.get('METADATA_CACHE_TTL', 3600))
+# Drop entries this many seconds before their signed stream URLs expire
+EXPIRY_MARGIN = int(os.environ.get('METADATA_CACHE_EXPIRY_MARGIN', 600))
+# Path of the SQLite file, leave unset to keep the cache in memory only
+CACHE_DB = os.environ.get('METADATA_CACHE_DB')
+
+YOUTUBE_HOSTS = ('youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com')
+
+
+def canonical_video_id(video_url):
+    """
+    Reduce the different YouTube URL forms to the video ID
+
+    Args:
+        video_url (str): watch, youtu.be, shorts, embed or live URL
+
+    Returns:
+        str: Video ID, or the URL itself if it isn't a recognised YouTube URL
+    """
+    parsed = urlparse(video_url.strip())
+    host = (parsed.hostname or '').lower()
+    parts = [p for p in parsed.path.split('/') if p]
+
+    if host == 'youtu.be' and parts:
+        return parts[0]
+    if host in YOUTUBE_HOSTS:
+        video_ids = parse_qs(parsed.query).get('v')
+        if video_ids:
+            return video_ids[0]
+        if len(parts) >= 2 and parts[0] in ('shorts', 'embed', 'live', 'v'):
+            return parts[1]
+    return video_url.strip()
+
+
+def make_key(video_url, format_type='video', quality='best'):
+    """Build the cache key for a URL and format/quality selection"""
+    return f"{canonical_video_id(video_url)}:{format_type}:{quality}"
+
+
+def stream_urls_expire_at(info):
+    """
+    Find the earliest 'expire' timestamp among the signed stream URLs of an info dict
+
+    Returns:
+        float: Unix timestamp, or None if no URL carries one
+    """
+    urls = [info.get('url')] + [f.get('url') for f in info.get('formats') or []]
+    expiries = []
+    for url in filter(None, urls):
+        expire = parse_qs(urlparse(url).query).get('expire')
+        if expire and expire[0].isdigit():
+            expiries.append(float(expire[0]))
+    return min(expiries) if expiries else None
+
+
+class MetadataCache:
+    """Thread-safe LRU cache of info dicts with per-entry expiry"""
+
+    def __init__(self, max_entries=CACHE_SIZE, ttl=CACHE_TTL, expiry_margin=EXPIRY_MARGIN, db_path=CACHE_DB):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.expiry_margin = expiry_margin
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS metadata_cache '
+                    '(key TEXT PRIMARY KEY, info TEXT NOT NULL, expires_at REAL NOT NULL)'
+                )
+                conn.execute('CREATE INDEX IF NOT EXISTS metadata_cache_expires ON metadata_cache (expires_at)')
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _expires_at(self, info, now):
+        expires_at = now + self.ttl
+        url_expiry = stream_urls_expire_at(info)
+        if url_expiry is not None:
+            expires_at = min(expires_at, url_expiry - self.expiry_margin)
+        return expires_at
+
+    def get(self, key):
+        """
+        Look up an info dict
+
+        Args:
+            key (str): Key from make_key
+
+        Returns:
+            dict: Cached info dict (treat as read-only), or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry['expires_at'] > now:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return entry['info']
+                del self._entries[key]
+                self._stats['expirations'] += 1
+
+        info = self._load(key, now)
+
+        with self._lock:
+            if info is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['disk_hits'] += 1
+            self._insert(key, info['info'], info['expires_at'])
+            return info['info']
+
+    def put(self, key, info):
+        """
+        Store an info dict, unless its stream URLs are about to expire anyway
+
+        Args:
+            key (str): Key from make_key
+            info (dict): JSON-serialisable info dict (see yt_dlp.YoutubeDL.sanitize_info)
+        """
+        now = time.time()
+        expires_at = self._expires_at(info, now)
+        if expires_at <= now:
+            return
+
+        with self._lock:
+            self._insert(key, info, expires_at)
+
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute('DELETE FROM metadata_cache WHERE expires_at <= ?', (now,))
+                    conn.execute(
+                        'INSERT OR REPLACE INTO metadata_cache (key, info, expires_at) VALUES (?, ?, ?)',
+                        (key, json.dumps(info), expires_at)
+                    )
+                    # Keep the on-disk copy bounded too, dropping the entries closest to expiry
+                    conn.execute(
+                        'DELETE FROM metadata_cache WHERE key NOT IN '
+                        '(SELECT key FROM metadata_cache ORDER BY expires_at DESC LIMIT ?)',
+                        (self.max_entries,)
+                    )
+            except sqlite3.Error as e:
+                logger.warning("Metadata cache write failed: %s", e)
+
+    def _insert(self, key, info, expires_at):
+        self._entries[key] = {'info': info, 'expires_at': expires_at}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def _load(self, key, now):
+        if not self.db_path:
+            return None
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    'SELECT info, expires_at FROM metadata_cache WHERE key = ? AND expires_at > ?',
+                    (key, now)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Metadata cache read failed: %s", e)
+            return None
+        if row is None:
+            return None
+        return {'info': json.loads(row[0]), 'expires_at': row[1]}
+
+    def stats(self):
+        """Return hit/miss/eviction counters and current size"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        stats['max_entries'] = self.max_entries
+        stats['ttl'] = self.ttl
+        stats['expiry_margin'] = self.expiry_margin
+        stats['persistent'] = bool(self.db_path)
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def clear(self):
+        """Drop all entries from memory and disk"""
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute('DELETE FROM metadata_cache')
+
+
+# Shared cache used by youtube_helper.extract_video_info
+cache = MetadataCache()
@@ -0,0 +1,157 @@
+"""
+Minimal Prometheus metrics: counters, gauges and histograms rendered in the text exposition format
+
+Metrics are per process; each gunicorn worker exposes its own values on /metrics
+with a 'worker' label so scrapes from different workers can be summed.
+"""
+import bisect
+import os
+import threading
+
+# Seconds, covering quick cache hits up to long downloads
+PHASE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_registry = []
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    # Read per call: a preloading gunicorn master imports this module before forking the workers
+    pairs = list(key) + list(extra) + [('worker', str(os.getpid()))]
+    inner = ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+    return '{' + inner + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Gauge:
+    """Current value, either set directly or read from a callback at scrape time"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def samples(self):
+        if self.callback is not None:
+            value = self.callback()
+            if value is None:
+                return []
+            return [(self.name, (), value)]
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets=PHASE_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(series) for key, series in self._values.items()}
+        samples = []
+        for key, series in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", key, cumulative, (('le', _number(float(bound))),)))
+            samples.append((f"{self.name}_count", key, cumulative))
+            samples.append((f"{self.name}_sum", key, series[-1]))
+        return samples
+
+
+def render():
+    """
+    Render every registered metric
+
+    Returns:
+        str: Prometheus text exposition format (version 0.0.4)
+    """
+    lines = []
+    for metric in _registry:
+        try:
+            samples = metric.samples()
+        except Exception:
+            # A failing gauge callback must not take the whole scrape down
+            continue
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for sample in samples:
+            name, key, value = sample[:3]
+            extra = sample[3] if len(sample) > 3 else ()
+            lines.append(f"{name}{_format_labels(key, extra)} {_number(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+# Pipeline metrics shared by the modules below app.py
+phase_seconds = Histogram('downloader_phase_seconds',
+                          'Time spent per pipeline phase (extract, download, postprocess_wait, postprocess, serve, stream)')
+jobs_total = Counter('downloader_jobs_total', 'Download jobs by outcome')
+extractions_total = Counter('downloader_extraction_attempts_total', 'Extraction attempts by strategy and outcome')
+bytes_total = Counter('downloader_bytes_total', 'Media bytes by direction (downloaded, served, streamed)')
+job_cpu_seconds = Histogram('downloader_job_cpu_seconds',
+                            'CPU time per finished download by mode (video, audio-copy, audio-encode)',
+                            buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
@@ -0,0 +1,165 @@
+"""
+Persistent yt-dlp cache directory for player JS signature/n-parameter solutions
+
+yt-dlp caches the signature and n-parameter functions it derives from the YouTube
+player JS, keyed by player ID. Pointing every YoutubeDL at one directory outside
+the home folder lets all gunicorn workers share the results. yt-dlp writes cache
+files through a temp file and rename, so concurrent writers never leave partial files.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import ytdlp_loader
+from ytdlp_loader import yt_dlp
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, every worker then pre-warms on its own
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+PLAYER_CACHE_DIR = os.environ.get('PLAYER_CACHE_DIR',
+                                  os.path.join(tempfile.gettempdir(), 'downloader-player-cache'))
+# Video extracted at startup so the current player is solved before the first request, empty to skip
+PREWARM_URL = os.environ.get('PLAYER_CACHE_PREWARM_URL', 'https://www.youtube.com/watch?v=jNQXAC9IVRw')
+
+# Cache sections holding player JS work
+PLAYER_SECTIONS = ('youtube-sigfuncs', 'youtube-nsig')
+
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'solve_seconds': 0.0, 'solves_timed': 0}
+# (section, key) -> time of the miss, to time how long solving it took
+_pending_misses = {}
+
+
+def cache_dir():
+    """Cache root for the installed yt-dlp version; solutions from other versions may not apply"""
+    return os.path.join(PLAYER_CACHE_DIR, yt_dlp.version.__version__)
+
+
+class CountingCache:
+    """yt-dlp's cache with hit/miss counters for the player sections"""
+
+    def __init__(self, ydl):
+        # Wrapped rather than subclassed, so defining this class doesn't import yt-dlp
+        self._cache = yt_dlp.cache.Cache(ydl)
+
+    def __getattr__(self, name):
+        return getattr(self._cache, name)
+
+    def load(self, section, key, dtype='json', default=None, **kwargs):
+        data = self._cache.load(section, key, dtype, default, **kwargs)
+        if section in PLAYER_SECTIONS:
+            with _lock:
+                if data is default:
+                    _stats['misses'] += 1
+                    _pending_misses[(section, key)] = time.monotonic()
+                else:
+                    _stats['hits'] += 1
+        return data
+
+    def store(self, section, key, data, dtype='json'):
+        self._cache.store(section, key, data, dtype)
+        if section in PLAYER_SECTIONS:
+            with _lock:
+                _stats['stores'] += 1
+                missed_at = _pending_misses.pop((section, key), None)
+                if missed_at is not None:
+                    _stats['solve_seconds'] += time.monotonic() - missed_at
+                    _stats['solves_timed'] += 1
+
+
+def attach(ydl):
+    """
+    Count player cache hits of a YoutubeDL instance
+
+    Args:
+        ydl (YoutubeDL): Instance built with cachedir=cache_dir()
+
+    Returns:
+        YoutubeDL: The same instance
+    """
+    ydl.cache = CountingCache(ydl)
+    return ydl
+
+
+def stats():
+    """
+    Return hit/miss counters and the estimated time saved by hits
+
+    The cache directory depends on the yt-dlp version, so before yt-dlp is loaded
+    it is reported as not loaded instead of importing yt-dlp for a stats request.
+    """
+    with _lock:
+        result = dict(_stats)
+        pending = len(_pending_misses)
+    lookups = result['hits'] + result['misses']
+    average_solve = result['solve_seconds'] / result['solves_timed'] if result['solves_timed'] else None
+    root = cache_dir() if ytdlp_loader.is_loaded() else None
+    entries = None
+    if root is not None:
+        entries = 0
+        for section in PLAYER_SECTIONS:
+            try:
+                entries += len(os.listdir(os.path.join(root, section)))
+            except FileNotFoundError:
+                pass
+    return {
+        'hits': result['hits'],
+        'misses': result['misses'],
+        'stores': result['stores'],
+        'hit_rate': round(result['hits'] / lookups, 3) if lookups else None,
+        'average_solve_seconds': round(average_solve, 3) if average_solve is not None else None,
+        'estimated_seconds_saved': round(average_solve * result['hits'], 1) if average_solve else None,
+        'unsolved_misses': pending,
+        'entries': entries,
+        'directory': root if root is not None else 'not loaded',
+    }
+
+
+def _prune_old_versions():
+    try:
+        names = os.listdir(PLAYER_CACHE_DIR)
+    except FileNotFoundError:
+        return
+    current = yt_dlp.version.__version__
+    for name in names:
+        path = os.path.join(PLAYER_CACHE_DIR, name)
+        if name != current and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _prewarm(url):
+    os.makedirs(PLAYER_CACHE_DIR, exist_ok=True)
+    lock_file = open(os.path.join(PLAYER_CACHE_DIR, '.prewarm.lock'), 'w')
+    try:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # Another worker is already on it
+                return
+        _prune_old_versions()
+        started = time.monotonic()
+        opts = {'quiet': True, 'no_warnings': True, 'skip_download': True, 'cachedir': cache_dir()}
+        with attach(yt_dlp.YoutubeDL(opts)) as ydl:
+            ydl.extract_info(url, download=False)
+        logger.info("Player cache warmed in %.1fs: %d entries", time.monotonic() - started, stats()['entries'])
+    except Exception as e:
+        logger.warning("Player cache pre-warm failed: %s", e)
+    finally:
+        lock_file.close()
+
+
+def start_prewarm(url=PREWARM_URL):
+    """Solve the current player in the background so the first real extraction finds it cached"""
+    if not url:
+        return
+    thread = threading.Thread(target=_prewarm, args=(url,), name='player-cache-prewarm')
+    thread.daemon = True
+    thread.start()
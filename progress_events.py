@@ -0,0 +1,126 @@
+"""
+In-process fan-out of job progress updates to Server-Sent Events streams
+
+Publishers keep only the latest state per job, so a slow subscriber skips
+intermediate updates instead of queueing them.
+"""
+import os
+import threading
+
+# Minimum seconds between two events on one stream
+SSE_MIN_INTERVAL = float(os.environ.get('SSE_MIN_INTERVAL', 0.5))
+# Without in-process updates, re-read the job store this often (job may run on another worker)
+SSE_POLL_INTERVAL = float(os.environ.get('SSE_POLL_INTERVAL', 3.0))
+# Close streams after this long, EventSource clients reconnect on their own
+SSE_MAX_DURATION = float(os.environ.get('SSE_MAX_DURATION', 300))
+# Milliseconds EventSource clients wait before reconnecting after a closed stream
+SSE_RETRY_MS = int(os.environ.get('SSE_RETRY_MS', 2000))
+# Open streams per worker; each holds a server thread, past this clients are told to poll
+SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', 12))
+
+
+class ProgressNotifier:
+    """Latest-state channel per job that any number of streams can wait on"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+
+    def _channel(self, job_id):
+        channel = self._channels.get(job_id)
+        if channel is None:
+            # One condition per job, so an update only wakes that job's streams
+            channel = {'cond': threading.Condition(self._lock), 'version': 0, 'state': {}, 'waiters': 0}
+            self._channels[job_id] = channel
+        return channel
+
+    def publish(self, job_id, **fields):
+        """Merge fields into the job's latest state and wake its subscribers"""
+        with self._lock:
+            channel = self._channel(job_id)
+            channel['state'].update(fields)
+            channel['version'] += 1
+            channel['cond'].notify_all()
+
+    def wait(self, job_id, last_version, timeout):
+        """
+        Block until the job has a state newer than last_version
+
+        Args:
+            job_id (str): Job to watch
+            last_version (int): Version the caller has already seen
+            timeout (float): Maximum seconds to wait
+
+        Returns:
+            tuple: (version, state dict); version equals last_version on timeout
+        """
+        with self._lock:
+            channel = self._channel(job_id)
+            channel['waiters'] += 1
+            try:
+                channel['cond'].wait_for(lambda: channel['version'] != last_version, timeout)
+            finally:
+                channel['waiters'] -= 1
+            return channel['version'], dict(channel['state'])
+
+    def forget(self, job_id):
+        """Drop a finished job's channel, waking anyone still waiting on it"""
+        with self._lock:
+            channel = self._channels.pop(job_id, None)
+            if channel is not None:
+                channel['version'] += 1
+                channel['cond'].notify_all()
+
+    def release(self, job_id):
+        """Drop a channel nobody publishes to or waits on, e.g. for a job running on another worker"""
+        with self._lock:
+            channel = self._channels.get(job_id)
+            if channel is not None and not channel['waiters'] and not channel['state']:
+                del self._channels[job_id]
+
+    def active_channels(self):
+        with self._lock:
+            return len(self._channels)
+
+
+class StreamSlots:
+    """Counts open event streams so they can't take every server thread"""
+
+    def __init__(self, limit=SSE_MAX_STREAMS):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._open = 0
+        self._stats = {'opened': 0, 'refused': 0}
+
+    def acquire(self):
+        """
+        Take a slot for a new stream
+
+        Returns:
+            callable: Releases the slot, safe to call more than once; None if all slots are taken
+        """
+        with self._lock:
+            if self._open >= self.limit:
+                self._stats['refused'] += 1
+                return None
+            self._open += 1
+            self._stats['opened'] += 1
+        released = []
+
+        def release():
+            with self._lock:
+                if not released:
+                    released.append(True)
+                    self._open -= 1
+        return release
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, open=self._open, limit=self.limit)
+
+
+def format_event(data, event=None, retry=None):
+    """Encode one SSE message, optionally setting the client's reconnection delay in milliseconds"""
+    message = f"retry: {retry}\n" if retry is not None else ''
+    message += f"event: {event}\n" if event else ''
+    return message + f"data: {data}\n\n"
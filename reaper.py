@@ -0,0 +1,208 @@
+"""
+Background garbage collector for temp_downloads and old job records
+
+Enforces a byte quota and a per-file TTL on finished artifacts (least recently
+served first), removes fragments left behind by failed downloads and expires
+job records.
+"""
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, every worker then sweeps on its own
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+TEMP_QUOTA_BYTES = int(os.environ.get('TEMP_QUOTA_BYTES', 5 * 1024 ** 3))
+# Artifacts not served for this long are deleted
+TEMP_FILE_TTL = int(os.environ.get('TEMP_FILE_TTL', 6 * 3600))
+# Temp files and .part/.ytdl fragments untouched for this long belong to dead downloads
+ORPHAN_GRACE = int(os.environ.get('TEMP_ORPHAN_GRACE', 30 * 60))
+JOB_RECORD_TTL = int(os.environ.get('JOB_RECORD_TTL', 24 * 3600))
+REAPER_INTERVAL = int(os.environ.get('REAPER_INTERVAL', 60))
+
+# Files the reaper never touches (job and cache databases, lock files)
+PROTECTED_PREFIXES = ('jobs.db', 'metadata_cache.db', '.reaper.lock', '.recovery.lock')
+# What downloads leave at the top level: temp_<job_id>.* files and yt-dlp's fragments
+TEMP_PREFIX = 'temp_'
+FRAGMENT_SUFFIXES = ('.part', '.ytdl')
+
+
+def job_id_of(name):
+    """Job ID of a temp file name, None for other files"""
+    if not name.startswith(TEMP_PREFIX):
+        return None
+    return name[len(TEMP_PREFIX):].split('.', 1)[0] or None
+
+
+def touch_access(path):
+    """Record that a file was just served, for LRU eviction; mtime is left alone"""
+    try:
+        os.utime(path, (time.time(), os.stat(path).st_mtime))
+    except OSError:
+        pass
+
+
+def _last_used(stat):
+    return max(stat.st_atime, stat.st_mtime)
+
+
+class TempReaper:
+    """
+    Periodic sweeper for the download folder
+
+    Args:
+        folder (str): Download folder (temp files at the top level)
+        artifacts (ArtifactStore): Store whose folder holds the finished artifacts
+        jobs (JobStore): Job records to expire
+    """
+
+    def __init__(self, folder, artifacts, jobs, quota_bytes=TEMP_QUOTA_BYTES, file_ttl=TEMP_FILE_TTL,
+                 orphan_grace=ORPHAN_GRACE, job_ttl=JOB_RECORD_TTL, interval=REAPER_INTERVAL):
+        self.folder = folder
+        self.artifacts = artifacts
+        self.jobs = jobs
+        self.quota_bytes = quota_bytes
+        self.file_ttl = file_ttl
+        self.orphan_grace = orphan_grace
+        self.job_ttl = job_ttl
+        self.interval = interval
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'sweeps': 0, 'evictions': 0, 'expirations': 0, 'orphans_removed': 0,
+            'reclaimed_bytes': 0, 'jobs_expired': 0, 'bytes_used': 0, 'files': 0, 'last_sweep': None,
+        }
+
+    def start(self):
+        """Start the background sweeper thread once"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='temp-reaper')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.exception("Reaper sweep failed")
+            time.sleep(self.interval)
+
+    def _scan(self, folder):
+        entries = []
+        try:
+            names = os.listdir(folder)
+        except FileNotFoundError:
+            return entries
+        for name in names:
+            if name.startswith(PROTECTED_PREFIXES):
+                continue
+            path = os.path.join(folder, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if os.path.isfile(path):
+                # ctime, not mtime: yt-dlp may set mtime to the upstream Last-Modified date
+                entries.append({'name': name, 'path': path, 'size': stat.st_size, 'last_used': _last_used(stat),
+                                'changed': stat.st_ctime})
+        return entries
+
+    def _remove(self, entry, counter):
+        try:
+            os.remove(entry['path'])
+        except FileNotFoundError:
+            return False
+        self.artifacts.forget_path(entry['path'])
+        with self._lock:
+            self._stats[counter] += 1
+            self._stats['reclaimed_bytes'] += entry['size']
+        return True
+
+    def sweep(self):
+        """Run one garbage collection pass, skipped if another worker is already sweeping"""
+        lock_file = self._acquire_sweep_lock()
+        if lock_file is False:
+            return
+        try:
+            self._sweep()
+        finally:
+            if lock_file:
+                lock_file.close()
+
+    def _acquire_sweep_lock(self):
+        if fcntl is None:
+            return None
+        lock_file = open(os.path.join(self.folder, '.reaper.lock'), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        return lock_file
+
+    def _is_orphan(self, name, in_flight):
+        """True for temp files and fragments whose job is no longer running in any worker"""
+        job_id = job_id_of(name)
+        if job_id is None:
+            return name.endswith(FRAGMENT_SUFFIXES)
+        if job_id in in_flight:
+            return False
+        # Jobs of other workers, or waiting to be recovered, still need their files
+        job = self.jobs.get(job_id)
+        return job is None or job['status'] != 'pending'
+
+    def _sweep(self):
+        now = time.time()
+
+        # Leftovers of failed or killed downloads: temp_* files and fragments nobody writes to anymore
+        temp_files = []
+        in_flight = set(self.artifacts.in_flight_jobs())
+        for entry in self._scan(self.folder):
+            if now - entry['changed'] > self.orphan_grace and self._is_orphan(entry['name'], in_flight):
+                self._remove(entry, 'orphans_removed')
+            else:
+                temp_files.append(entry)
+
+        # Finished artifacts: TTL since last served, then quota by least recently served
+        artifact_files = []
+        for entry in self._scan(self.artifacts.folder):
+            if now - entry['last_used'] > self.file_ttl:
+                self._remove(entry, 'expirations')
+            else:
+                artifact_files.append(entry)
+
+        used = sum(e['size'] for e in temp_files) + sum(e['size'] for e in artifact_files)
+        for entry in sorted(artifact_files, key=lambda e: e['last_used']):
+            if used <= self.quota_bytes:
+                break
+            if self._remove(entry, 'evictions'):
+                used -= entry['size']
+                artifact_files.remove(entry)
+
+        # Job records, including jobs whose files were just removed
+        expired_jobs = self.jobs.find(older_than=now - self.job_ttl, limit=1000)
+        for job in expired_jobs:
+            self.jobs.delete(job['job_id'])
+
+        with self._lock:
+            self._stats['jobs_expired'] += len(expired_jobs)
+            self._stats['bytes_used'] = used
+            self._stats['files'] = len(temp_files) + len(artifact_files)
+            self._stats['sweeps'] += 1
+            self._stats['last_sweep'] = now
+
+    def stats(self):
+        """Return disk usage and reclamation counters"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['quota_bytes'] = self.quota_bytes
+        stats['file_ttl'] = self.file_ttl
+        return stats
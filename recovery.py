@@ -0,0 +1,236 @@
+"""
+Heartbeats for running download jobs and recovery of jobs whose worker died
+
+Every process bumps the records of the jobs it owns (queued, downloading or
+attached to a download) each HEARTBEAT_INTERVAL. A pending job whose record
+has not been touched for HEARTBEAT_TIMEOUT lost its worker, e.g. to a gunicorn
+worker recycle or a container restart. It is queued again under its own job ID,
+so yt-dlp finds the .part files of the first run in temp_downloads and continues
+them with HTTP range requests instead of starting from zero.
+
+Heartbeats only show that the process is alive. A job whose download thread hangs
+(a stuck connection, a post-processor that never returns) keeps getting them, so
+each process also fails its own jobs that made no progress for PROGRESS_TIMEOUT.
+Batch records whose runner died are handed to the batch runner of the recovering
+process, which closes them once their items have ended.
+"""
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, every worker then recovers on its own
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = float(os.environ.get('JOB_HEARTBEAT_INTERVAL', 10))
+# A pending job not updated for this long has no live worker
+HEARTBEAT_TIMEOUT = float(os.environ.get('JOB_HEARTBEAT_TIMEOUT', 60))
+# A running job whose download reported no progress for this long is failed, even with a live worker
+PROGRESS_TIMEOUT = float(os.environ.get('JOB_PROGRESS_TIMEOUT', 900))
+# Interrupted runs after which a job is failed instead of resumed
+MAX_RESUMES = int(os.environ.get('JOB_MAX_RESUMES', 3))
+
+
+def partial_bytes(folder, job_id):
+    """Bytes already downloaded by a job: its .part files and fragments in the download folder"""
+    prefix = f"temp_{job_id}."
+    total = 0
+    try:
+        names = os.listdir(folder)
+    except FileNotFoundError:
+        return 0
+    for name in names:
+        if name.startswith(prefix) and not name.endswith('.ytdl'):
+            try:
+                total += os.path.getsize(os.path.join(folder, name))
+            except FileNotFoundError:
+                pass
+    return total
+
+
+class JobRecovery:
+    """
+    Heartbeat and recovery loop, one per process
+
+    Args:
+        folder (str): Download folder holding the temp_<job_id>.* files
+        jobs (JobStore): Job records
+        owned_jobs (callable): Returns the IDs of the jobs this process is working on
+        resume (callable): resume(job, partial_bytes) queues an interrupted job again,
+            returns False if it could not be queued right now
+        fail (callable): fail(job_ids, error) marks jobs as failed
+        abandon (callable): abandon(job_ids, error) fails jobs whose download stopped making
+            progress; defaults to fail
+        recover_batch (callable): recover_batch(batch) takes over a batch record whose runner died
+    """
+
+    def __init__(self, folder, jobs, owned_jobs, resume, fail, abandon=None, recover_batch=None,
+                 interval=HEARTBEAT_INTERVAL, timeout=HEARTBEAT_TIMEOUT, progress_timeout=PROGRESS_TIMEOUT,
+                 max_resumes=MAX_RESUMES):
+        self.folder = folder
+        self.jobs = jobs
+        self.owned_jobs = owned_jobs
+        self.resume = resume
+        self.fail = fail
+        self.abandon = abandon or fail
+        self.recover_batch = recover_batch
+        self.interval = interval
+        self.timeout = timeout
+        self.progress_timeout = progress_timeout
+        self.max_resumes = max_resumes
+        self._thread = None
+        self._lock = threading.Lock()
+        # job_id -> monotonic time of the last progress of a running job of this process
+        self._progress = {}
+        self._stats = {'heartbeats': 0, 'resumed': 0, 'resumed_bytes': 0, 'failed': 0, 'stalled': 0,
+                       'batches_recovered': 0, 'last_pass': None}
+
+    def start(self):
+        """Start the heartbeat/recovery thread once; the first recovery pass runs right away"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='job-recovery')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.beat()
+                self.recover()
+            except Exception:
+                logger.exception("Job recovery pass failed")
+            time.sleep(self.interval)
+
+    def beat(self):
+        """Mark the jobs of this process as alive"""
+        now = time.time()
+        job_ids = self.owned_jobs()
+        for job_id in job_ids:
+            self.jobs.update(job_id, heartbeat_at=now)
+        with self._lock:
+            self._stats['heartbeats'] += len(job_ids)
+        self._fail_stalled(job_ids)
+
+    def touch(self, job_ids):
+        """Record that running jobs of this process just made progress"""
+        now = time.monotonic()
+        with self._lock:
+            for job_id in job_ids:
+                self._progress[job_id] = now
+
+    def queued(self, job_ids):
+        """Suspend the progress deadline of jobs waiting for a worker; their next touch starts it again"""
+        with self._lock:
+            for job_id in job_ids:
+                self._progress.pop(job_id, None)
+
+    def _fail_stalled(self, owned):
+        # Jobs still waiting in the queue were never touched and have no deadline yet
+        now = time.monotonic()
+        owned = set(owned)
+        with self._lock:
+            # Ended jobs; the age check spares jobs that started after owned was taken
+            for job_id in [job_id for job_id, at in self._progress.items()
+                           if job_id not in owned and now - at > self.interval]:
+                del self._progress[job_id]
+            stalled = [job_id for job_id, at in self._progress.items()
+                       if job_id in owned and now - at > self.progress_timeout]
+            for job_id in stalled:
+                del self._progress[job_id]
+            self._stats['stalled'] += len(stalled)
+        if stalled:
+            # The hung thread can't be stopped, but its jobs no longer wait on it
+            logger.warning("Failing %d job(s) without progress for %.0fs", len(stalled), self.progress_timeout)
+            self.abandon(stalled, 'Download stopped making progress, please try again.')
+
+    def is_stale(self, job, now=None):
+        """True if a pending job has not shown a sign of life within the timeout"""
+        now = time.time() if now is None else now
+        return job['status'] == 'pending' and now - job['updated_at'] > self.timeout
+
+    def recover(self):
+        """Queue stale jobs again, skipped if another worker is already recovering"""
+        lock_file = self._acquire_lock()
+        if lock_file is False:
+            return
+        try:
+            self._recover()
+        finally:
+            if lock_file:
+                lock_file.close()
+
+    def _acquire_lock(self):
+        if fcntl is None:
+            return None
+        lock_file = open(os.path.join(self.folder, '.recovery.lock'), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        return lock_file
+
+    def _recover(self):
+        now = time.time()
+        stale = self.jobs.find(status='pending', older_than=now - self.timeout, limit=200)
+        batches = [job for job in stale if job.get('kind') == 'batch']
+        stale = [job for job in stale if job.get('kind') != 'batch']
+        # Leaders first, so attached jobs join the download that continues the leader's .part files
+        stale.sort(key=lambda job: job.get('queue_id', job['job_id']) != job['job_id'])
+
+        for job in stale:
+            # Resuming an earlier job in this pass may have touched this one
+            job = self.jobs.get(job['job_id'])
+            if job is None or not self.is_stale(job):
+                continue
+            job_id = job['job_id']
+            if not job.get('url'):
+                # Recorded before jobs were checkpointed, nothing to resume from
+                self._give_up(job_id, 'Download was interrupted, please try again.')
+                continue
+            if job.get('resumes', 0) >= self.max_resumes:
+                self._give_up(job_id, 'Download was interrupted too many times, please try again later.')
+                continue
+
+            downloaded = partial_bytes(self.folder, job_id)
+            if not self.resume(job, downloaded):
+                # Queue full: the job stays stale and is picked up by a later pass
+                continue
+            logger.info("Resumed interrupted job with %d bytes already downloaded", downloaded,
+                        extra={'job_id': job_id})
+            with self._lock:
+                self._stats['resumed'] += 1
+                self._stats['resumed_bytes'] += downloaded
+
+        # After the items, so a batch's runner finds its resumed items pending
+        for batch in batches:
+            batch = self.jobs.get(batch['job_id'])
+            if batch is None or not self.is_stale(batch) or self.recover_batch is None:
+                continue
+            logger.info("Taking over interrupted batch", extra={'batch_id': batch['job_id']})
+            self.recover_batch(batch)
+            with self._lock:
+                self._stats['batches_recovered'] += 1
+
+        with self._lock:
+            self._stats['last_pass'] = now
+
+    def _give_up(self, job_id, error):
+        logger.warning("Failing interrupted job: %s", error, extra={'job_id': job_id})
+        self.fail([job_id], error)
+        with self._lock:
+            self._stats['failed'] += 1
+
+    def stats(self):
+        """Return heartbeat and recovery counters"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['timeout'] = self.timeout
+        stats['progress_timeout'] = self.progress_timeout
+        return stats
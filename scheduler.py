@@ -0,0 +1,182 @@
+"""
+Bounded worker pools with priority lanes for download jobs
+
+Replaces the thread-per-job model: a fixed number of workers pull from a bounded
+pending queue, and submitting to a full queue raises QueueFullError so the caller
+can push back on the client.
+
+Jobs run in two stages on separate pools: network-bound downloads, and CPU-bound
+ffmpeg post-processing on a pool sized to the CPU cores, so a few transcodes
+can't hold up downloads and downloads can't hold up transcodes.
+"""
+import itertools
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Priority lanes, lower runs first
+PRIORITY_HIGH = 0    # audio and Shorts, short jobs
+PRIORITY_NORMAL = 1  # capped video qualities
+PRIORITY_LOW = 2     # best/1080p video
+
+DOWNLOAD_WORKERS = int(os.environ.get('DOWNLOAD_WORKERS', 4))
+MAX_PENDING = int(os.environ.get('DOWNLOAD_MAX_PENDING', 50))
+# Waiting this long moves a job up one lane so low-priority jobs are not starved
+PRIORITY_AGING = int(os.environ.get('DOWNLOAD_PRIORITY_AGING', 120))
+
+POSTPROCESS_WORKERS = int(os.environ.get('POSTPROCESS_WORKERS', os.cpu_count() or 2))
+POSTPROCESS_MAX_PENDING = int(os.environ.get('POSTPROCESS_MAX_PENDING', 100))
+# Niceness of the post-processing threads and the ffmpeg processes they start; serving and downloads go first
+POSTPROCESS_NICE = int(os.environ.get('POSTPROCESS_NICE', 10))
+
+
+class QueueFullError(Exception):
+    """Raised when the pending queue is full"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Download queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class DownloadScheduler:
+    """
+    Fixed-size pool of worker threads fed from a bounded priority queue
+
+    Args:
+        workers (int): Worker threads
+        max_pending (int): Jobs that may wait for a worker
+        aging (int): Seconds of waiting that move a job up one lane
+        name (str): Stage name, used for the thread names
+        nice (int): Niceness added to the worker threads (Linux), None to leave it
+    """
+
+    def __init__(self, workers=DOWNLOAD_WORKERS, max_pending=MAX_PENDING, aging=PRIORITY_AGING, name='download',
+                 nice=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.aging = aging
+        self.name = name
+        self.nice = nice
+        self._pending = []
+        self._running = set()
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        # Moving average of job run time, used for Retry-After estimates
+        self._avg_runtime = 30.0
+        self._stats = {'submitted': 0, 'rejected': 0, 'completed': 0}
+
+    def _effective_priority(self, entry, now):
+        return entry['priority'] - int((now - entry['queued_at']) / self.aging)
+
+    def _ordered(self, now):
+        return sorted(self._pending, key=lambda e: (self._effective_priority(e, now), e['seq']))
+
+    def _ensure_workers(self):
+        # Started lazily so importing the app (e.g. in a preloading master) doesn't spawn threads
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker, name=f"{self.name}-worker-{len(self._threads)}")
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, job_id, func, args=(), priority=PRIORITY_NORMAL):
+        """
+        Queue a job
+
+        Args:
+            job_id (str): Job identifier, used for queue position lookups
+            func (callable): Function to run on a worker
+            args (tuple): Arguments for func
+            priority (int): One of the PRIORITY_* lanes
+
+        Returns:
+            int: 1-based position in the pending queue
+
+        Raises:
+            QueueFullError: If max_pending jobs are already waiting
+        """
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                self._stats['rejected'] += 1
+                raise QueueFullError(self._retry_after())
+            self._ensure_workers()
+            self._pending.append({
+                'job_id': job_id,
+                'func': func,
+                'args': args,
+                'priority': priority,
+                'seq': next(self._counter),
+                'queued_at': time.time(),
+            })
+            self._stats['submitted'] += 1
+            self._cond.notify()
+            return self._position(job_id)
+
+    def _position(self, job_id):
+        for index, entry in enumerate(self._ordered(time.time())):
+            if entry['job_id'] == job_id:
+                return index + 1
+        return None
+
+    def position(self, job_id):
+        """Return the 1-based queue position of a job, or None if it isn't waiting"""
+        with self._cond:
+            return self._position(job_id)
+
+    def _retry_after(self):
+        # Time for the workers to drain the current backlog, at least a few seconds
+        backlog = len(self._pending) + len(self._running)
+        return max(5, int(self._avg_runtime * backlog / max(self.workers, 1)))
+
+    def retry_after(self):
+        """Estimate how many seconds until the queue has room again"""
+        with self._cond:
+            return self._retry_after()
+
+    def _lower_priority(self):
+        # Linux keeps a nice value per thread, and processes started from the thread inherit it
+        if not self.nice or not hasattr(os, 'setpriority'):
+            return
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(),
+                           os.getpriority(os.PRIO_PROCESS, threading.get_native_id()) + self.nice)
+        except OSError as e:
+            logger.warning("Could not lower the priority of %s workers: %s", self.name, e)
+
+    def _worker(self):
+        self._lower_priority()
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                entry = self._ordered(time.time())[0]
+                self._pending.remove(entry)
+                self._running.add(entry['job_id'])
+
+            started = time.time()
+            try:
+                entry['func'](*entry['args'])
+            except Exception as e:
+                logger.exception("Worker error", extra={'job_id': entry['job_id']})
+            finally:
+                with self._cond:
+                    self._running.discard(entry['job_id'])
+                    self._stats['completed'] += 1
+                    self._avg_runtime = 0.8 * self._avg_runtime + 0.2 * (time.time() - started)
+
+    def stats(self):
+        """Return queue depth, active workers and counters"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['workers'] = self.workers
+            if self.nice:
+                stats['nice'] = self.nice
+            stats['active'] = len(self._running)
+            stats['pending'] = len(self._pending)
+            stats['max_pending'] = self.max_pending
+            stats['avg_runtime'] = round(self._avg_runtime, 2)
+        return stats
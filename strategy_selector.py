@@ -0,0 +1,183 @@
+"""
+Adaptive ordering of the extraction strategies in youtube_helper
+
+Keeps a sliding window of outcomes per strategy, tries the strategy with the
+lowest expected time to a successful extraction first and skips strategies
+that keep failing (circuit breaker) until a cooldown has passed.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+# Attempts remembered per strategy
+STRATEGY_WINDOW = int(os.environ.get('STRATEGY_WINDOW', 50))
+# Consecutive failures that open a strategy's circuit
+STRATEGY_FAILURE_THRESHOLD = int(os.environ.get('STRATEGY_FAILURE_THRESHOLD', 5))
+# Seconds an open circuit stays open before one trial attempt is let through
+STRATEGY_COOLDOWN = int(os.environ.get('STRATEGY_COOLDOWN', 300))
+
+# Assumed latency of a strategy nothing is known about yet
+DEFAULT_LATENCY = 5.0
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class _StrategyState:
+    def __init__(self, window):
+        self.outcomes = deque(maxlen=window)  # (succeeded, latency)
+        self.consecutive_failures = 0
+        self.circuit = CLOSED
+        self.opened_at = None
+        self.trial_running = False
+
+
+class StrategySelector:
+    """
+    Per-strategy success rate and latency tracker
+
+    Args:
+        window (int): Attempts kept per strategy
+        failure_threshold (int): Consecutive failures before a strategy is skipped
+        cooldown (float): Seconds before a skipped strategy gets a trial attempt
+        clock (callable): Time source, replaceable in tests
+    """
+
+    def __init__(self, window=STRATEGY_WINDOW, failure_threshold=STRATEGY_FAILURE_THRESHOLD,
+                 cooldown=STRATEGY_COOLDOWN, clock=time.monotonic):
+        self.window = window
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def _state(self, name):
+        state = self._states.get(name)
+        if state is None:
+            state = self._states[name] = _StrategyState(self.window)
+        return state
+
+    def _expected_cost(self, state, default_latency):
+        # Expected seconds until a success: mean attempt latency / success probability.
+        # The success rate is smoothed so one early failure doesn't bury a strategy.
+        successes = sum(1 for ok, _ in state.outcomes if ok)
+        rate = (successes + 1) / (len(state.outcomes) + 2)
+        if state.outcomes:
+            latency = sum(latency for _, latency in state.outcomes) / len(state.outcomes)
+        else:
+            latency = default_latency
+        return latency / rate
+
+    def order(self, names):
+        """
+        Order strategies for the next extraction
+
+        Strategies with an open circuit are left out, unless every strategy is
+        open, in which case all of them are returned so the request still gets
+        a chance. A strategy whose cooldown has passed is handed to one caller
+        at a time as a trial. Ties keep the order of `names`.
+
+        Args:
+            names (list): Strategy names in their default order
+
+        Returns:
+            list: Strategy names to try, best first
+        """
+        with self._lock:
+            ranked = self._rank(names)
+            for name in ranked:
+                state = self._states[name]
+                if state.circuit == HALF_OPEN:
+                    state.trial_running = True
+            return ranked
+
+    def preview(self, names):
+        """The order the next extraction would use, without claiming trial attempts"""
+        with self._lock:
+            return self._rank(names)
+
+    def _rank(self, names):
+        now = self.clock()
+        observed = [latency for name in names for _, latency in self._state(name).outcomes]
+        default_latency = sum(observed) / len(observed) if observed else DEFAULT_LATENCY
+
+        available = []
+        for name in names:
+            state = self._state(name)
+            if state.circuit == OPEN and now - state.opened_at >= self.cooldown:
+                state.circuit = HALF_OPEN
+            if state.circuit == OPEN or (state.circuit == HALF_OPEN and state.trial_running):
+                continue
+            available.append(name)
+
+        if not available:
+            available = list(names)
+        return sorted(available, key=lambda n: self._expected_cost(self._states[n], default_latency))
+
+    def record(self, name, succeeded, latency):
+        """
+        Record the outcome of one extraction attempt
+
+        Args:
+            name (str): Strategy name
+            succeeded (bool): Whether the attempt returned info
+            latency (float): Seconds the attempt took
+        """
+        with self._lock:
+            state = self._state(name)
+            state.outcomes.append((succeeded, latency))
+            state.trial_running = False
+            if succeeded:
+                state.consecutive_failures = 0
+                state.circuit = CLOSED
+                state.opened_at = None
+                return
+            state.consecutive_failures += 1
+            if state.circuit == HALF_OPEN or state.consecutive_failures >= self.failure_threshold:
+                state.circuit = OPEN
+                state.opened_at = self.clock()
+
+    def is_open(self, name):
+        """True if the strategy is currently being skipped"""
+        with self._lock:
+            state = self._states.get(name)
+            return state is not None and state.circuit == OPEN
+
+    def release(self, names):
+        """Let go of half-open trial slots that were handed out by order() but not used"""
+        with self._lock:
+            for name in names:
+                state = self._states.get(name)
+                if state is not None:
+                    state.trial_running = False
+
+    def stats(self):
+        """Return success rate, latency and circuit state per strategy"""
+        with self._lock:
+            now = self.clock()
+            stats = {}
+            for name, state in self._states.items():
+                attempts = len(state.outcomes)
+                successes = sum(1 for ok, _ in state.outcomes if ok)
+                success_latencies = [latency for ok, latency in state.outcomes if ok]
+                stats[name] = {
+                    'attempts': attempts,
+                    'successes': successes,
+                    'success_rate': round(successes / attempts, 3) if attempts else None,
+                    'mean_latency': (round(sum(l for _, l in state.outcomes) / attempts, 3)
+                                     if attempts else None),
+                    'mean_success_latency': (round(sum(success_latencies) / len(success_latencies), 3)
+                                             if success_latencies else None),
+                    'consecutive_failures': state.consecutive_failures,
+                    'circuit': state.circuit,
+                    'open_for': (round(max(0, self.cooldown - (now - state.opened_at)), 1)
+                                 if state.circuit == OPEN else 0),
+                }
+            return stats
+
+
+# Shared by all extractions in this process
+selector = StrategySelector()
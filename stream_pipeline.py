@@ -0,0 +1,194 @@
+"""
+Pass-through streaming: yt-dlp writes the media to a pipe, optionally through ffmpeg,
+and the bytes go straight to the HTTP client without touching temp_downloads
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import audio_outputs
+import format_ladder
+import metrics
+import toolchain
+
+# Bytes read from the pipeline per chunk sent to the client
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', 64 * 1024))
+# Concurrent streaming downloads, on top of the worker pool
+STREAM_MAX_CONCURRENT = int(os.environ.get('STREAM_MAX_CONCURRENT', 4))
+
+# Single-file formats only: a merged bestvideo+bestaudio download cannot be piped
+VIDEO_FORMATS = {
+    'best': 'best[ext=mp4]/best',
+    '1080': 'best[height<=1080][ext=mp4]/best[height<=1080]',
+    '720': 'best[height<=720][ext=mp4]/best[height<=720]',
+    '480': 'best[height<=480][ext=mp4]/best[height<=480]',
+}
+
+AUDIO_TYPES = {'mp3': 'audio/mpeg', 'm4a': 'audio/mp4', 'webm': 'audio/webm', 'ogg': 'audio/ogg', 'opus': 'audio/ogg'}
+
+_slots = threading.BoundedSemaphore(STREAM_MAX_CONCURRENT)
+
+
+class StreamBusyError(Exception):
+    """Raised when STREAM_MAX_CONCURRENT streams are already running"""
+
+
+class StreamFormatError(ValueError):
+    """Raised for a ladder format that can't be streamed: unknown, or video without audio"""
+
+
+class StreamPipeline:
+    """
+    A running yt-dlp (and optionally ffmpeg) pipeline producing media on stdout
+
+    Iterate over it to get chunks; closing it, including by abandoning the
+    iteration when the client disconnects, kills the processes. The slot and the
+    processes are taken on construction, so a pipeline that is never iterated
+    (e.g. the response is dropped before its body is read) must be closed explicitly.
+    """
+
+    def __init__(self, info, format_type='video', quality='best'):
+        # Streams produce the first output of an audio quality setting; invalid settings fail before a slot is taken
+        self._audio_output = audio_outputs.parse(quality)[0] if format_type == 'audio' else None
+        format_id = format_ladder.format_id_of(quality)
+        if format_id:
+            selected = format_ladder.find_format(info, format_id)
+            if selected is None:
+                raise StreamFormatError(f"Unknown format {format_id!r}, see /formats for this video")
+            if not format_ladder.streamable(selected):
+                raise StreamFormatError(f"Format {format_id!r} has no audio track and can't be streamed, "
+                                        "use /initiate-download to get it with the best audio merged in")
+        if not _slots.acquire(blocking=False):
+            raise StreamBusyError('Too many streaming downloads in progress')
+
+        self._processes = []
+        self._info_file = None
+        self._closed = False
+        self._close_lock = threading.Lock()
+        self.bytes_sent = 0
+        self.started_at = time.monotonic()
+        try:
+            self._start(info, format_type, quality)
+        except Exception:
+            self.close()
+            raise
+
+    def _start(self, info, format_type, quality):
+        # Hand the already extracted info to yt-dlp instead of letting it extract again
+        with tempfile.NamedTemporaryFile('w', suffix='.info.json', delete=False) as f:
+            json.dump(info, f)
+            self._info_file = f.name
+
+        if format_type == 'audio':
+            format_spec = audio_outputs.source_format([self._audio_output])
+        elif format_ladder.format_id_of(quality):
+            # A format from the /formats ladder, as it is: a pipe can't carry a merge
+            format_spec = format_ladder.format_id_of(quality)
+        else:
+            format_spec = VIDEO_FORMATS.get(quality, VIDEO_FORMATS['best'])
+        ytdlp_cmd = [
+            sys.executable, '-m', 'yt_dlp',
+            '--load-info-json', self._info_file,
+            '--format', format_spec,
+            '--output', '-',
+            '--quiet', '--no-progress', '--no-part',
+        ]
+        downloader = subprocess.Popen(ytdlp_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self._processes.append(downloader)
+
+        selected = self._selected_format(info, format_type, quality, self._audio_output)
+        selected_ext = selected.get('ext') if selected else info.get('ext')
+        ffmpeg_cmd = None
+        if format_type == 'audio':
+            output = self._audio_output
+            source_codec = audio_outputs.track_codec(selected.get('acodec') if selected else None)
+            self.extension = output['ext'] or selected_ext or 'm4a'
+            as_downloaded = output['copy'] and (output['codec'] is None or
+                                                (output['codec'] == source_codec and self.extension == selected_ext))
+            if not as_downloaded and toolchain.can_stream_copy():
+                ffmpeg_cmd = (['-vn'] + audio_outputs.codec_args(output, source_codec)
+                              + audio_outputs.PIPE_MUXERS[self.extension])
+            elif not as_downloaded:
+                # No ffmpeg to remux with, stream the native audio as-is
+                self.extension = selected_ext or 'm4a'
+            self.mimetype = AUDIO_TYPES.get(self.extension, f"audio/{self.extension}")
+        else:
+            if selected_ext not in (None, 'mp4') and toolchain.can_stream_copy():
+                # Remux into fragmented MP4, which can be written without seeking
+                ffmpeg_cmd = ['-c', 'copy', '-movflags', 'frag_keyframe+empty_moov', '-f', 'mp4']
+                self.extension = 'mp4'
+            else:
+                self.extension = selected_ext or 'mp4'
+            self.mimetype = f"video/{self.extension}"
+
+        if ffmpeg_cmd:
+            converter = subprocess.Popen(
+                [toolchain.probe()['ffmpeg'], '-loglevel', 'error', '-i', 'pipe:0'] + ffmpeg_cmd + ['pipe:1'],
+                stdin=downloader.stdout, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+            )
+            # ffmpeg owns the read end now, so yt-dlp gets SIGPIPE if ffmpeg goes away
+            downloader.stdout.close()
+            self._processes.append(converter)
+
+        self._output = self._processes[-1].stdout
+
+    @staticmethod
+    def _selected_format(info, format_type, quality, audio_output=None):
+        # Mirror the format spec well enough to pick the response content type up front
+        formats = [f for f in info.get('formats') or [] if f.get('url')]
+        if format_type == 'audio':
+            formats = [f for f in formats if f.get('vcodec') == 'none']
+            if audio_output['codec'] == 'opus':
+                preferred = [f for f in formats if f.get('acodec') == 'opus']
+            elif audio_output['copy']:
+                preferred = [f for f in formats if f.get('ext') == 'm4a']
+            else:
+                preferred = []
+        elif format_ladder.format_id_of(quality):
+            formats = [f for f in formats if f.get('format_id') == format_ladder.format_id_of(quality)]
+            preferred = []
+        else:
+            formats = [f for f in formats if f.get('vcodec') != 'none' and f.get('acodec') != 'none']
+            if quality in ('1080', '720', '480'):
+                formats = [f for f in formats if (f.get('height') or 0) <= int(quality)]
+            preferred = [f for f in formats if f.get('ext') == 'mp4']
+        candidates = preferred or formats
+        return candidates[-1] if candidates else None
+
+    def __iter__(self):
+        try:
+            while True:
+                # read1 returns what the pipe has instead of waiting for a full chunk
+                chunk = self._output.read1(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                self.bytes_sent += len(chunk)
+                yield chunk
+        finally:
+            self.close()
+
+    def succeeded(self):
+        """True if every process in the pipeline exited cleanly"""
+        return all(p.poll() == 0 for p in self._processes)
+
+    def close(self):
+        """Stop the pipeline and release its slot, safe to call more than once and from any thread"""
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+        for process in reversed(self._processes):
+            if process.poll() is None:
+                process.kill()
+            if process.stdout:
+                process.stdout.close()
+            process.wait()
+        if self._info_file and os.path.exists(self._info_file):
+            os.remove(self._info_file)
+        _slots.release()
+        metrics.phase_seconds.observe(time.monotonic() - self.started_at, phase='stream')
+        metrics.bytes_total.inc(self.bytes_sent, direction='streamed')
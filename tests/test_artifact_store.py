@@ -0,0 +1,89 @@
+"""
+Tests for single-flight coordination in the artifact store
+
+Usage: python -m pytest tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import artifact_store
+
+KEY = 'abc|video|best'
+
+
+class FlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.store = artifact_store.ArtifactStore(os.path.join(self.folder, 'artifacts'))
+
+    def download(self, name, content=b'media'):
+        path = os.path.join(self.folder, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_first_job_leads_and_others_attach(self):
+        self.assertTrue(self.store.join(KEY, 'a'))
+        self.assertFalse(self.store.join(KEY, 'b'))
+        self.assertEqual(self.store.flight_leader(KEY), 'a')
+        self.assertEqual(self.store.flight_jobs(KEY), ['a', 'b'])
+
+    def test_finish_completes_every_attached_job(self):
+        self.store.join(KEY, 'a')
+        self.store.join(KEY, 'b')
+        artifact, job_ids = self.store.finish(KEY, self.download('a.mp4'), {'title': 't'}, leader='a')
+        self.assertEqual(job_ids, ['a', 'b'])
+        self.assertEqual(self.store.lookup(KEY)['path'], artifact['path'])
+        self.assertEqual(self.store.in_flight_jobs(), [])
+
+    def test_abandon_closes_the_flight_of_any_job(self):
+        self.store.join(KEY, 'a')
+        self.store.join(KEY, 'b')
+        self.assertEqual(self.store.abandon(['b']), ['a', 'b'])
+        self.assertIsNone(self.store.flight_leader(KEY))
+
+    def test_late_fail_of_abandoned_download_leaves_new_flight(self):
+        self.store.join(KEY, 'old')
+        self.store.abandon(['old'])
+        self.assertTrue(self.store.join(KEY, 'new'))
+        self.store.join(KEY, 'attached')
+
+        # The hung download wakes up and fails
+        self.assertEqual(self.store.fail(KEY, 'old'), [])
+        self.assertEqual(self.store.flight_jobs(KEY, 'old'), [])
+        self.assertEqual(self.store.flight_leader(KEY), 'new')
+        self.assertEqual(self.store.flight_jobs(KEY, 'new'), ['new', 'attached'])
+
+        self.assertEqual(self.store.fail(KEY, 'new'), ['new', 'attached'])
+
+    def test_late_finish_of_abandoned_download_leaves_new_flight(self):
+        self.store.join(KEY, 'old')
+        self.store.abandon(['old'])
+        self.store.join(KEY, 'new')
+
+        artifact, job_ids = self.store.finish(KEY, self.download('old.mp4'), {'title': 't'}, leader='old')
+        self.assertEqual(job_ids, [])
+        self.assertTrue(os.path.exists(artifact['path']))
+        self.assertEqual(self.store.flight_leader(KEY), 'new')
+
+        _, job_ids = self.store.finish(KEY, self.download('new.mp4'), {'title': 't'}, leader='new')
+        self.assertEqual(job_ids, ['new'])
+
+    def test_identical_files_are_stored_once(self):
+        self.store.join('one', 'a')
+        self.store.join('two', 'b')
+        first, _ = self.store.finish('one', self.download('a.mp4'), {}, leader='a')
+        second, _ = self.store.finish('two', self.download('b.mp4'), {}, leader='b')
+        self.assertEqual(first['path'], second['path'])
+        self.assertEqual(self.store.stats()['deduplicated'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""
+Tests for parsing audio output settings against the server's toolchain
+
+Usage: python -m pytest tests
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audio_outputs
+import toolchain
+
+NO_FFMPEG = {'ffmpeg': None, 'ffprobe': None, 'version': None, 'encoders': [], 'audio_codecs': []}
+FFMPEG = {'ffmpeg': '/usr/bin/ffmpeg', 'ffprobe': '/usr/bin/ffprobe', 'version': '6.0',
+          'encoders': ['libmp3lame', 'aac', 'libopus'], 'audio_codecs': ['mp3', 'aac', 'opus']}
+FFMPEG_WITHOUT_OPUS = dict(FFMPEG, encoders=['libmp3lame', 'aac'], audio_codecs=['mp3', 'aac'])
+
+
+def names(spec):
+    return [output['name'] for output in audio_outputs.parse(spec)]
+
+
+class ParseTest(unittest.TestCase):
+
+    def with_toolchain(self, probe):
+        patch = mock.patch.object(toolchain, 'probe', return_value=probe)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_outputs_with_ffmpeg(self):
+        self.with_toolchain(FFMPEG)
+        self.assertEqual(names('best'), ['mp3-256'])
+        self.assertEqual(names('m4a, webm,ogg,mp3-320'), ['m4a', 'webm', 'ogg', 'mp3-320'])
+        self.assertEqual(names('mp3,mp3-256'), ['mp3-256'])
+
+    def test_without_ffmpeg_only_native_is_offered(self):
+        self.with_toolchain(NO_FFMPEG)
+        self.assertEqual(names('best'), ['native'])
+        self.assertEqual(names('native'), ['native'])
+        # The downloaded track may have the other codec, which would fail after the download
+        for spec in ('m4a', 'webm', 'ogg', 'native,m4a', 'mp3'):
+            with self.assertRaises(audio_outputs.AudioSpecError, msg=spec):
+                audio_outputs.parse(spec)
+
+    def test_copy_output_needs_encoder_for_its_codec(self):
+        self.with_toolchain(FFMPEG_WITHOUT_OPUS)
+        self.assertEqual(names('m4a'), ['m4a'])
+        with self.assertRaises(audio_outputs.AudioSpecError):
+            audio_outputs.parse('webm')
+
+    def test_invalid_specs(self):
+        self.with_toolchain(FFMPEG)
+        for spec in ('flac', 'mp3-100', 'mp3-abc', 'mp3,aac,opus,m4a,webm'):
+            with self.assertRaises(audio_outputs.AudioSpecError, msg=spec):
+                audio_outputs.parse(spec)
+
+
+if __name__ == '__main__':
+    unittest.main()
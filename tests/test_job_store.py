@@ -0,0 +1,195 @@
+"""
+Contract tests run against every job store backend
+
+Redis runs against fakeredis and is skipped when it isn't installed.
+
+Usage: python -m pytest tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import job_store
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class JobStoreContract:
+    """Behaviour every backend must have; subclasses provide make_store"""
+
+    def make_store(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.store = self.make_store()
+
+    def test_create_and_get(self):
+        self.store.create('a', {'url': 'https://example.com/v', 'progress': 0})
+        job = self.store.get('a')
+        self.assertEqual(job['job_id'], 'a')
+        self.assertEqual(job['status'], 'pending')
+        self.assertEqual(job['url'], 'https://example.com/v')
+        self.assertIn('started_at', job)
+        self.assertIn('updated_at', job)
+        self.assertIn('a', self.store)
+
+    def test_get_unknown_job(self):
+        self.assertIsNone(self.store.get('missing'))
+        self.assertNotIn('missing', self.store)
+
+    def test_get_returns_a_copy(self):
+        self.store.create('a', {})
+        self.store.get('a')['status'] = 'completed'
+        self.assertEqual(self.store.get('a')['status'], 'pending')
+
+    def test_update_merges_fields(self):
+        self.store.create('a', {'url': 'u', 'progress': 0})
+        before = self.store.get('a')['updated_at']
+        time.sleep(0.01)
+        self.assertTrue(self.store.update('a', progress=50, status='completed'))
+        job = self.store.get('a')
+        self.assertEqual((job['url'], job['progress'], job['status']), ('u', 50, 'completed'))
+        self.assertGreater(job['updated_at'], before)
+
+    def test_update_unknown_job(self):
+        self.assertFalse(self.store.update('missing', progress=1))
+        self.assertIsNone(self.store.get('missing'))
+
+    def test_delete(self):
+        self.store.create('a', {})
+        self.store.delete('a')
+        self.store.delete('a')
+        self.assertIsNone(self.store.get('a'))
+        self.assertEqual(self.store.find(), [])
+        self.assertEqual(self.store.count_by_status().get('pending', 0), 0)
+
+    def test_find_by_status(self):
+        self.store.create('a', {})
+        self.store.create('b', {'status': 'completed'})
+        self.store.create('c', {})
+        self.store.update('c', status='failed')
+        self.assertEqual([j['job_id'] for j in self.store.find(status='pending')], ['a'])
+        self.assertEqual([j['job_id'] for j in self.store.find(status='failed')], ['c'])
+        self.assertEqual(sorted(j['job_id'] for j in self.store.find()), ['a', 'b', 'c'])
+
+    def test_find_by_age_oldest_first(self):
+        for job_id in ('a', 'b', 'c'):
+            self.store.create(job_id, {})
+            time.sleep(0.01)
+        cutoff = time.time()
+        time.sleep(0.01)
+        self.store.update('a')
+        self.assertEqual([j['job_id'] for j in self.store.find(older_than=cutoff)], ['b', 'c'])
+        self.assertEqual([j['job_id'] for j in self.store.find(status='pending', older_than=cutoff, limit=1)],
+                         ['b'])
+        self.assertEqual([j['job_id'] for j in self.store.find()], ['b', 'c', 'a'])
+
+    def test_count_by_status(self):
+        self.store.create('a', {})
+        self.store.create('b', {})
+        self.store.create('c', {'status': 'completed'})
+        self.store.update('b', status='failed')
+        counts = {status: count for status, count in self.store.count_by_status().items() if count}
+        self.assertEqual(counts, {'pending': 1, 'failed': 1, 'completed': 1})
+
+    def test_concurrent_updates_are_not_lost(self):
+        self.store.create('a', {})
+        threads = 8
+        rounds = 10
+
+        def work(n):
+            for i in range(rounds):
+                self.store.update('a', **{f"field_{n}": i})
+
+        workers = [threading.Thread(target=work, args=(n,)) for n in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        job = self.store.get('a')
+        self.assertEqual([job.get(f"field_{n}") for n in range(threads)], [rounds - 1] * threads)
+        self.assertEqual(self.store.count_by_status(), {'pending': 1})
+
+
+class MemoryJobStoreTest(JobStoreContract, unittest.TestCase):
+
+    def make_store(self):
+        return job_store.MemoryJobStore()
+
+
+class SQLiteJobStoreTest(JobStoreContract, unittest.TestCase):
+
+    def make_store(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        return job_store.SQLiteJobStore(os.path.join(folder, 'jobs.db'))
+
+    def test_records_survive_reopening(self):
+        self.store.create('a', {'url': 'u'})
+        reopened = job_store.SQLiteJobStore(self.store.path)
+        self.assertEqual(reopened.get('a')['url'], 'u')
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class RedisJobStoreTest(JobStoreContract, unittest.TestCase):
+
+    def make_store(self):
+        return job_store.RedisJobStore(fakeredis.FakeRedis(server=fakeredis.FakeServer()))
+
+
+class ThrottledProgressWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = job_store.MemoryJobStore()
+        self.store.create('a', {'progress': 0})
+
+    def test_updates_within_interval_are_coalesced(self):
+        writer = job_store.ThrottledProgressWriter(self.store, interval=60)
+        self.assertTrue(writer.set_progress('a', 10, phase='downloading'))
+        self.assertFalse(writer.set_progress('a', 20, phase='downloading'))
+        self.assertFalse(writer.set_progress('a', 30, phase='downloading', speed=5))
+        self.assertEqual(self.store.get('a')['progress'], 10)
+
+        self.assertTrue(writer.flush('a'))
+        job = self.store.get('a')
+        self.assertEqual((job['progress'], job['speed']), (30, 5))
+        self.assertFalse(writer.flush('a'))
+
+    def test_unchanged_progress_is_not_written(self):
+        writer = job_store.ThrottledProgressWriter(self.store, interval=0)
+        self.assertTrue(writer.set_progress('a', 10))
+        self.assertFalse(writer.set_progress('a', 10))
+        self.assertTrue(writer.set_progress('a', 11))
+        self.assertFalse(writer.flush('a'))
+
+    def test_write_after_interval(self):
+        writer = job_store.ThrottledProgressWriter(self.store, interval=0.05)
+        writer.set_progress('a', 10)
+        writer.set_progress('a', 20)
+        time.sleep(0.06)
+        self.assertTrue(writer.set_progress('a', 30))
+        self.assertEqual(self.store.get('a')['progress'], 30)
+        # The held-back 20 is superseded by the write
+        self.assertFalse(writer.flush('a'))
+
+    def test_forget_drops_pending_update(self):
+        writer = job_store.ThrottledProgressWriter(self.store, interval=60)
+        writer.set_progress('a', 10)
+        writer.set_progress('a', 20)
+        writer.forget('a')
+        self.assertFalse(writer.flush('a'))
+        self.assertTrue(writer.set_progress('a', 20))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,231 @@
+"""
+Tests for the adaptive ordering of extraction strategies
+
+The selector runs on a fake clock; the fallback tests drive youtube_helper with
+yt-dlp's extractor replaced by a stub whose outcome depends on the player client.
+
+Usage: python -m pytest tests
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp
+
+import strategy_selector
+import youtube_helper
+
+NAMES = ['android', 'ios', 'tv_embedded', 'web', 'web_remix']
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class StrategySelectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.selector = strategy_selector.StrategySelector(window=10, failure_threshold=3, cooldown=60,
+                                                           clock=self.clock)
+
+    def record_failures(self, name, times, latency=1.0):
+        for _ in range(times):
+            self.selector.record(name, False, latency)
+
+    def test_unknown_strategies_keep_default_order(self):
+        self.assertEqual(self.selector.order(NAMES), NAMES)
+
+    def test_faster_strategy_goes_first(self):
+        self.selector.record('android', True, 4.0)
+        self.selector.record('web', True, 0.5)
+        order = self.selector.order(NAMES)
+        self.assertEqual(order[0], 'web')
+        # Untried strategies are assumed as fast as the average of the tried ones
+        self.assertEqual(order[-1], 'android')
+
+    def test_failures_push_strategy_back(self):
+        self.selector.record('android', True, 1.0)
+        self.record_failures('android', 2)
+        self.selector.record('ios', True, 1.0)
+        order = self.selector.order(NAMES)
+        self.assertEqual(order[0], 'ios')
+        self.assertEqual(order[-1], 'android')
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        self.record_failures('android', 2)
+        self.assertFalse(self.selector.is_open('android'))
+        self.assertIn('android', self.selector.order(NAMES))
+
+        self.record_failures('android', 1)
+        self.assertTrue(self.selector.is_open('android'))
+        self.assertNotIn('android', self.selector.order(NAMES))
+
+    def test_success_resets_failure_count(self):
+        self.record_failures('android', 2)
+        self.selector.record('android', True, 1.0)
+        self.record_failures('android', 2)
+        self.assertFalse(self.selector.is_open('android'))
+
+    def test_all_open_returns_every_strategy(self):
+        for name in NAMES:
+            self.record_failures(name, 3)
+        self.assertEqual(sorted(self.selector.order(NAMES)), sorted(NAMES))
+
+    def test_half_open_trial_goes_to_one_caller(self):
+        self.record_failures('android', 3)
+        self.clock.advance(59)
+        self.assertNotIn('android', self.selector.order(NAMES))
+
+        self.clock.advance(1)
+        self.assertIn('android', self.selector.preview(NAMES))
+        # preview doesn't claim the trial
+        self.assertIn('android', self.selector.order(NAMES))
+        self.assertNotIn('android', self.selector.order(NAMES))
+
+    def test_released_trial_is_handed_out_again(self):
+        self.record_failures('android', 3)
+        self.clock.advance(60)
+        self.selector.order(NAMES)
+        self.selector.release(NAMES)
+        self.assertIn('android', self.selector.order(NAMES))
+
+    def test_successful_trial_closes_circuit(self):
+        self.record_failures('android', 3)
+        self.clock.advance(60)
+        self.selector.order(NAMES)
+        self.selector.record('android', True, 1.0)
+        self.assertEqual(self.selector.stats()['android']['circuit'], strategy_selector.CLOSED)
+        self.assertIn('android', self.selector.order(NAMES))
+
+    def test_failed_trial_reopens_for_another_cooldown(self):
+        self.record_failures('android', 3)
+        self.clock.advance(60)
+        self.selector.order(NAMES)
+        self.record_failures('android', 1)
+        self.assertTrue(self.selector.is_open('android'))
+        self.clock.advance(59)
+        self.assertNotIn('android', self.selector.order(NAMES))
+        self.clock.advance(1)
+        self.assertIn('android', self.selector.order(NAMES))
+
+    def test_window_forgets_old_outcomes(self):
+        self.record_failures('android', 2)
+        for _ in range(10):
+            self.selector.record('android', True, 1.0)
+        self.assertEqual(self.selector.stats()['android']['attempts'], 10)
+        self.assertEqual(self.selector.stats()['android']['success_rate'], 1.0)
+
+
+class StrategyFallbackTest(unittest.TestCase):
+    """Strategies are tried in the selector's order and failing ones are skipped"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.selector = strategy_selector.StrategySelector(window=10, failure_threshold=3, cooldown=60,
+                                                           clock=self.clock)
+        # The stub answers in microseconds, so seed a history that fixes the ranking: android fastest
+        for seconds, name in enumerate(NAMES, 1):
+            self.selector.record(name, True, float(seconds))
+        self.calls = []
+        self.failing = set()
+
+        def stub_extract_info(ydl, url, download=True, *args, **kwargs):
+            client = ydl.params['extractor_args']['youtube']['player_client'][0]
+            self.calls.append(client)
+            if client in self.failing:
+                raise yt_dlp.utils.DownloadError(f"{client}: Sign in to confirm you're not a bot")
+            return {'id': url[-11:], 'title': 'Test Video', 'player_client': client}
+
+        no_browser_cookies = lambda *a, **k: yt_dlp.cookies.YoutubeDLCookieJar()
+        patches = [
+            mock.patch.object(yt_dlp.cookies, 'extract_cookies_from_browser', no_browser_cookies),
+            mock.patch.object(yt_dlp.YoutubeDL, 'extract_info', stub_extract_info),
+            mock.patch.object(youtube_helper, '_retry_pause', lambda cancel=None: None),
+            mock.patch.object(youtube_helper, 'EXTRACTION_MODE', 'sequential'),
+            mock.patch.object(strategy_selector, 'selector', self.selector),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def extract(self):
+        self.calls.clear()
+        return youtube_helper._extract_video_info('https://www.youtube.com/watch?v=jNQXAC9IVRw',
+                                                  'video', 'best', True)
+
+    def test_first_strategy_wins(self):
+        info = self.extract()
+        self.assertEqual(info['player_client'], 'android')
+        self.assertEqual(self.calls, ['android'])
+
+    def test_falls_back_to_next_strategy(self):
+        self.failing = {'android'}
+        info = self.extract()
+        self.assertEqual(info['player_client'], 'ios')
+        # The circuit opens on the third failure and cuts the strategy's attempts short
+        self.assertEqual(self.calls, ['android', 'android', 'android', 'ios'])
+
+    def test_open_strategy_is_skipped(self):
+        self.failing = {'android'}
+        self.extract()
+        info = self.extract()
+        self.assertEqual(info['player_client'], 'ios')
+        self.assertEqual(self.calls, ['ios'])
+
+    def test_open_strategy_gets_trial_after_cooldown(self):
+        self.failing = {'android'}
+        self.extract()
+        self.failing = set()
+        self.clock.advance(59)
+        self.extract()
+        self.assertEqual(self.calls, ['ios'])
+
+        self.clock.advance(1)
+        info = self.extract()
+        self.assertEqual(info['player_client'], 'android')
+        self.assertEqual(self.calls, ['android'])
+        self.assertEqual(self.selector.stats()['android']['circuit'], strategy_selector.CLOSED)
+
+    def test_failed_trial_falls_back(self):
+        self.failing = {'android'}
+        self.extract()
+        self.clock.advance(60)
+        # Still failing: the trial reopens the circuit and ios serves the request
+        info = self.extract()
+        self.assertEqual(info['player_client'], 'ios')
+        self.assertEqual(self.calls, ['android', 'ios'])
+        self.assertTrue(self.selector.is_open('android'))
+
+    def test_unreached_trial_is_released(self):
+        for _ in range(3):
+            self.selector.record('web_remix', False, 5.0)
+        self.clock.advance(60)
+        # Half-open but ranked last: android answers and web_remix's trial is never used
+        self.extract()
+        self.assertEqual(self.calls, ['android'])
+        self.assertIn('web_remix', self.selector.order(NAMES))
+
+    def test_fallback_follows_selector_order(self):
+        self.failing = {'android', 'ios', 'tv_embedded'}
+        info = self.extract()
+        self.assertEqual(info['player_client'], 'web')
+        self.assertEqual(self.calls, ['android'] * 3 + ['ios'] * 3 + ['tv_embedded'] * 3 + ['web'])
+
+        # Next time the open strategies are left out
+        info = self.extract()
+        self.assertEqual(self.calls, ['web'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Named download tuning presets: fragment concurrency, chunk size, buffer size and merge options
+
+A job picks a profile by name (the 'profile' parameter of /initiate-download and
+/batch-download); THROUGHPUT_PROFILE sets the default.
+"""
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+MIB = 1024 * 1024
+
+PROFILES = {
+    # Many parallel fragment connections and DASH formats allowed, for large videos on a fast link
+    'throughput': {
+        'concurrent_fragment_downloads': 8,
+        'http_chunk_size': 10 * MIB,
+        'buffersize': 256 * 1024,
+        'noresizebuffer': False,
+        # Re-extract when YouTube throttles the stream below this many bytes/s
+        'throttledratelimit': 100 * 1024,
+        'youtube_include_dash_manifest': True,
+        'merge_output_format': 'mp4',
+        'fixup': 'detect_or_warn',
+    },
+    # A few fragments at once, the format choice stays as before
+    'balanced': {
+        'concurrent_fragment_downloads': 4,
+        'http_chunk_size': 10 * MIB,
+        'buffersize': 64 * 1024,
+        'noresizebuffer': False,
+        'throttledratelimit': 100 * 1024,
+        'merge_output_format': 'mp4',
+        'fixup': 'detect_or_warn',
+    },
+    # One connection, small fixed buffers and no fixup pass rewriting the file
+    'low-memory': {
+        'concurrent_fragment_downloads': 1,
+        'http_chunk_size': 2 * MIB,
+        'buffersize': 16 * 1024,
+        'noresizebuffer': True,
+        'merge_output_format': 'mp4',
+        'fixup': 'warn',
+    },
+}
+
+DEFAULT_PROFILE = os.environ.get('THROUGHPUT_PROFILE', 'balanced')
+if DEFAULT_PROFILE not in PROFILES:
+    logger.warning("Unknown THROUGHPUT_PROFILE %r, using 'balanced'", DEFAULT_PROFILE)
+    DEFAULT_PROFILE = 'balanced'
+
+
+def resolve(name):
+    """
+    Validate a profile name from a request
+
+    Args:
+        name (str): Profile name, empty for the default
+
+    Returns:
+        str: Profile name, or None if it doesn't exist
+    """
+    if not name:
+        return DEFAULT_PROFILE
+    return name if name in PROFILES else None
+
+
+def apply_profile(ydl_opts, name=None):
+    """
+    Apply a profile on top of yt-dlp options
+
+    Profile settings win over the anti-bot defaults from get_enhanced_ydl_opts,
+    e.g. DASH manifests for 'throughput'.
+
+    Args:
+        ydl_opts (dict): Options to update in place
+        name (str): Profile name, the default profile if None
+
+    Returns:
+        dict: The updated options
+    """
+    ydl_opts.update(PROFILES[name or DEFAULT_PROFILE])
+    return ydl_opts
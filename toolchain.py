@@ -0,0 +1,86 @@
+"""
+One-time detection of the ffmpeg toolchain, memoized for the life of the process
+
+Post-processing decisions (MP3 encode vs. native stream copy) are driven from here
+instead of spawning ffmpeg for every job.
+"""
+import re
+import shutil
+import subprocess
+import threading
+
+# Encoders we care about, by the codec they produce
+AUDIO_ENCODERS = {
+    'mp3': ('libmp3lame',),
+    'aac': ('aac', 'libfdk_aac'),
+    'opus': ('libopus', 'opus'),
+}
+
+_probe_result = None
+_probe_lock = threading.Lock()
+
+
+def _run(cmd):
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=10)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout.decode('utf-8', 'replace')
+
+
+def _detect():
+    ffmpeg = shutil.which('ffmpeg')
+    ffprobe = shutil.which('ffprobe')
+    toolchain = {
+        'ffmpeg': ffmpeg,
+        'ffprobe': ffprobe,
+        'version': None,
+        'encoders': [],
+        'audio_codecs': [],
+    }
+    if not ffmpeg:
+        return toolchain
+
+    version_output = _run([ffmpeg, '-hide_banner', '-version'])
+    if version_output:
+        match = re.search(r'ffmpeg version (\S+)', version_output)
+        toolchain['version'] = match.group(1) if match else None
+
+    encoders_output = _run([ffmpeg, '-hide_banner', '-encoders']) or ''
+    # Lines look like ' A....D libmp3lame           libmp3lame MP3 (MPEG audio layer 3)'
+    encoders = set(re.findall(r'^\s*[VAS][\w.]{5}\s+(\S+)', encoders_output, re.MULTILINE))
+    toolchain['encoders'] = sorted(e for names in AUDIO_ENCODERS.values() for e in names if e in encoders)
+    toolchain['audio_codecs'] = sorted(codec for codec, names in AUDIO_ENCODERS.items()
+                                       if any(name in encoders for name in names))
+    return toolchain
+
+
+def probe():
+    """
+    Detect ffmpeg/ffprobe, the ffmpeg version and available audio encoders
+
+    Runs at most once per process; later calls return the cached result.
+
+    Returns:
+        dict: 'ffmpeg'/'ffprobe' paths (None if missing), 'version', 'encoders'
+              and 'audio_codecs' (codecs that can be encoded: mp3, aac, opus)
+    """
+    global _probe_result
+    if _probe_result is None:
+        with _probe_lock:
+            if _probe_result is None:
+                _probe_result = _detect()
+    return _probe_result
+
+
+def can_encode(codec):
+    """True if ffmpeg can encode the given audio codec ('mp3', 'aac', 'opus')"""
+    return codec in probe()['audio_codecs']
+
+
+def can_stream_copy():
+    """Remuxing with -c copy needs no encoder, only ffmpeg itself"""
+    return probe()['ffmpeg'] is not None
+
@@ -0,0 +1,143 @@
+"""
+Pool of warm YoutubeDL instances, keyed by option profile
+
+Constructing YoutubeDL loads cookies and sets up the opener, and its extractor
+instances hold the downloaded player JS and signature functions. Reusing
+instances keeps all of that between requests.
+"""
+import contextlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import player_cache
+from ytdlp_loader import yt_dlp
+
+logger = logging.getLogger(__name__)
+
+# Idle instances kept in total, 0 disables pooling
+POOL_SIZE = int(os.environ.get('YDL_POOL_SIZE', 8))
+# Instances idle or alive longer than this are rebuilt
+POOL_MAX_IDLE = int(os.environ.get('YDL_POOL_MAX_IDLE', 600))
+POOL_MAX_AGE = int(os.environ.get('YDL_POOL_MAX_AGE', 3600))
+
+
+class _Pooled:
+    def __init__(self, ydl):
+        self.ydl = ydl
+        self.created_at = time.monotonic()
+        self.returned_at = self.created_at
+
+
+class YoutubeDLPool:
+    """
+    Thread-safe checkout/return of YoutubeDL instances
+
+    An instance is only ever used by the thread that checked it out. Instances
+    are grouped by a caller-chosen key; the options of a warm instance are the
+    ones it was built with, so the key must cover every option that matters.
+
+    Args:
+        size (int): Idle instances kept across all keys, least recently returned dropped first
+        max_idle (float): Seconds an instance may sit idle
+        max_age (float): Seconds after which an instance is rebuilt regardless
+    """
+
+    def __init__(self, size=POOL_SIZE, max_idle=POOL_MAX_IDLE, max_age=POOL_MAX_AGE):
+        self.size = size
+        self.max_idle = max_idle
+        self.max_age = max_age
+        self._idle = OrderedDict()  # (key, id) -> _Pooled, oldest return first
+        self._lock = threading.Lock()
+        self._stats = {'created': 0, 'reused': 0, 'expired': 0, 'evicted': 0}
+
+    def _expired(self, pooled, now):
+        return now - pooled.returned_at > self.max_idle or now - pooled.created_at > self.max_age
+
+    def _take(self, key):
+        now = time.monotonic()
+        found = None
+        expired = []
+        with self._lock:
+            # Newest first: warm caches are more likely on recently used instances
+            for slot in reversed(list(self._idle)):
+                if slot[0] != key:
+                    continue
+                pooled = self._idle.pop(slot)
+                if self._expired(pooled, now):
+                    self._stats['expired'] += 1
+                    expired.append(pooled)
+                    continue
+                found = pooled
+                break
+            self._stats['reused' if found else 'created'] += 1
+        for pooled in expired:
+            _close(pooled)
+        return found
+
+    def _give_back(self, key, pooled):
+        pooled.returned_at = time.monotonic()
+        dropped = []
+        with self._lock:
+            if self.size <= 0:
+                dropped.append(pooled)
+            else:
+                self._idle[(key, id(pooled))] = pooled
+                while len(self._idle) > self.size:
+                    dropped.append(self._idle.popitem(last=False)[1])
+                    self._stats['evicted'] += 1
+        for old in dropped:
+            _close(old)
+
+    @contextlib.contextmanager
+    def checkout(self, key, ydl_opts):
+        """
+        Borrow an instance for `key`, built from ydl_opts if none is idle
+
+        Args:
+            key (hashable): Option profile, e.g. (strategy, format, quality)
+            ydl_opts (dict): Options for a new instance
+
+        Yields:
+            YoutubeDL: Instance for exclusive use inside the with block
+        """
+        pooled = self._take(key)
+        if pooled is None:
+            pooled = _Pooled(player_cache.attach(yt_dlp.YoutubeDL(ydl_opts)))
+        try:
+            yield pooled.ydl
+        finally:
+            self._give_back(key, pooled)
+
+    def clear(self):
+        """Drop every idle instance"""
+        with self._lock:
+            idle = list(self._idle.values())
+            self._idle.clear()
+        for pooled in idle:
+            _close(pooled)
+
+    def stats(self):
+        """Return reuse counters and idle instances per key"""
+        with self._lock:
+            stats = dict(self._stats)
+            per_key = {}
+            for key, _ in self._idle:
+                per_key[str(key)] = per_key.get(str(key), 0) + 1
+        stats['idle'] = per_key
+        stats['size'] = self.size
+        return stats
+
+
+def _close(pooled):
+    try:
+        # Same as leaving the with block of a fresh instance (saves the cookie file if any)
+        pooled.ydl.__exit__(None, None, None)
+    except Exception as e:
+        logger.warning("Error closing pooled YoutubeDL: %s", e)
+
+
+# Shared by all extractions in this process
+pool = YoutubeDLPool()
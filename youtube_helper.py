@@ -1,8 +1,24 @@
 """
 Helper module to work around YouTube restrictions on cloud platforms like Railway
 """
+import copy
+import functools
+import logging
+import os
 import random
-import yt_dlp
+import time
+
+import hedging
+import metadata_cache
+import metrics
+import player_cache
+import strategy_selector
+import ydl_pool
+from ytdlp_loader import yt_dlp
+
+logger = logging.getLogger(__name__)
+# Receives yt-dlp's own output instead of stdout/stderr
+ytdlp_logger = logging.getLogger('yt_dlp')
 
 # List of realistic user agents to rotate through - expanded with latest versions
 USER_AGENTS = [
@@ -34,6 +50,12 @@ USER_AGENTS = [
 # Extended list of player client types to try with more options
 PLAYER_CLIENTS = ['android', 'web', 'tv_embedded', 'ios', 'tv_html5', 'tv_cast', 'web_embedded', 'web_remix']
 
+# 'sequential' tries one strategy at a time, 'hedged' races them (see hedging.py)
+EXTRACTION_MODE = os.environ.get('EXTRACTION_MODE', 'sequential').lower()
+
+# Extraction strategies by name, in their default order
+STRATEGY_NAMES = ['android', 'ios', 'tv_embedded', 'web', 'web_remix']
+
 # Extended cookie domains to try and simulate a logged-in session
 COOKIE_DOMAINS = ['youtube.com', 'google.com', 'accounts.google.com']
 
@@ -111,8 +133,7 @@ def get_enhanced_ydl_opts(base_opts=None, format_type='video'):
             'extractor': lambda n: random.uniform(2, 5) * (n + 1),
         },
         
-        # Avoid throttling
-        'throttled_rate': '100K',
+        # Throttling detection (throttledratelimit) is set by the throughput profile of the job
         
         # Advanced networking
         'source_address': '0.0.0.0',  # Use multiple IPs if available
@@ -126,6 +147,12 @@ def get_enhanced_ydl_opts(base_opts=None, format_type='video'):
         'max_sleep_interval': 10,
         'external_downloader_args': ['-timeout', '30'],  # Timeout for external downloaders
         
+        # Player JS signature solutions shared by all workers
+        'cachedir': player_cache.cache_dir(),
+        
+        # yt-dlp messages go through logging, filtered by YTDLP_LOG_LEVEL
+        'logger': ytdlp_logger,
+        
         # Cookie handling
         'cookiefile': None,  # Will try to use default cookies
         'cookiesfrombrowser': ['chrome'],  # Try to load cookies from browser
@@ -155,15 +182,50 @@ def extract_video_info(video_url, format_type='video', quality='best', skip_down
     """
     Extract video information with enhanced anti-bot protection
     
+    Metadata-only lookups are served from metadata_cache when possible. The info
+    dict lists every format whatever the quality, so all qualities share one entry.
+    
     Args:
         video_url (str): YouTube URL
         format_type (str): 'video' or 'audio'
-        quality (str): Quality setting ('best', '1080', '720', '480')
+        quality (str): Quality setting ('best', '1080', '720', '480' or 'id:<format_id>')
         skip_download (bool): Whether to skip the actual download
         
     Returns:
         dict: Video information
     """
+    if not skip_download:
+        return _extract_video_info(video_url, format_type, quality, skip_download)
+    
+    started = time.monotonic()
+    cache_key = metadata_cache.make_key(video_url, format_type)
+    info = metadata_cache.cache.get(cache_key)
+    if info is not None:
+        logger.debug("Metadata cache hit for %s", cache_key)
+    else:
+        info = _extract_video_info(video_url, format_type, quality, skip_download)
+        if info:
+            # Store the JSON-safe form so it can also go to the on-disk cache
+            info = yt_dlp.YoutubeDL.sanitize_info(info)
+            metadata_cache.cache.put(cache_key, info)
+    metrics.phase_seconds.observe(time.monotonic() - started, phase='extract')
+    return info
+
+def cached_video_info(video_url, format_type='video'):
+    """
+    Info dict of a video from metadata_cache, ready for download_from_info
+    
+    Returns:
+        dict: Info dict, or None if the video isn't cached (or its stream URLs expired)
+    """
+    info = metadata_cache.cache.get(metadata_cache.make_key(video_url, format_type))
+    if info is None:
+        return None
+    # Same cleanup as info_store applies to handed-off info dicts
+    return yt_dlp.YoutubeDL.sanitize_info(info, remove_private_keys=True)
+
+def _extract_video_info(video_url, format_type, quality, skip_download):
+    """Run the extraction strategies without consulting the cache"""
     # Start with basic options
     info_opts = {
         'format': 'best',
@@ -172,7 +234,7 @@ def extract_video_info(video_url, format_type='video', quality='best', skip_down
         'quiet': True,
         'skip_download': skip_download,
         'no_warnings': False,  # Show warnings for debugging
-        'verbose': True,  # More verbose for cloud debugging
+        'verbose': logger.isEnabledFor(logging.DEBUG),  # Debug output costs nothing unless LOG_LEVEL=DEBUG
     }
     
     # Format specific settings
@@ -186,20 +248,20 @@ def extract_video_info(video_url, format_type='video', quality='best', skip_down
         elif quality == '480':
             info_opts.update({'format': 'best[height<=480]'})
     
-    # Multiple extraction strategies to try
-    extraction_strategies = [
+    # Options of each extraction strategy, the selector decides the order
+    extraction_strategies = {
         # Strategy 1: Use mobile client
-        {'player_client': ['android'], 'user_agent': next(ua for ua in USER_AGENTS if 'Android' in ua)},
+        'android': {'player_client': ['android'], 'user_agent': next(ua for ua in USER_AGENTS if 'Android' in ua)},
         # Strategy 2: Use iOS client
-        {'player_client': ['ios'], 'user_agent': next(ua for ua in USER_AGENTS if 'iPhone' in ua)},
+        'ios': {'player_client': ['ios'], 'user_agent': next(ua for ua in USER_AGENTS if 'iPhone' in ua)},
         # Strategy 3: Use TV client
-        {'player_client': ['tv_embedded'], 'prefer_insecure': True},
+        'tv_embedded': {'player_client': ['tv_embedded'], 'prefer_insecure': True},
         # Strategy 4: Use web with Tor-like behavior
-        {'player_client': ['web'], 'user_agent': random.choice(USER_AGENTS), 
-         'geo_bypass_country': random.choice(['US', 'GB', 'CA', 'AU'])},
+        'web': {'player_client': ['web'], 'user_agent': random.choice(USER_AGENTS), 
+                'geo_bypass_country': random.choice(['US', 'GB', 'CA', 'AU'])},
         # Strategy 5: Last resort - try with minimal options
-        {'player_client': ['web_remix'], 'youtube_include_dash_manifest': True}
-    ]
+        'web_remix': {'player_client': ['web_remix'], 'youtube_include_dash_manifest': True}
+    }
     
     # Add any YouTube short URL handling
     if 'youtube.com/shorts/' in video_url:
@@ -209,43 +271,39 @@ def extract_video_info(video_url, format_type='video', quality='best', skip_down
     
     last_exception = None
     
-    # Try each strategy until one works
-    for strategy_index, strategy in enumerate(extraction_strategies):
-        # Apply enhanced options with this strategy
-        final_opts = get_enhanced_ydl_opts(info_opts.copy(), format_type)
-        
-        # Apply strategy-specific options
-        for key, value in strategy.items():
-            if key == 'player_client':
-                final_opts['extractor_args']['youtube']['player_client'] = value
-            else:
-                final_opts[key] = value
-        
-        # Multiple attempts with this strategy
-        for attempt in range(3):
+    # Best strategy first, strategies that keep failing are skipped for a while
+    strategy_order = strategy_selector.selector.order(STRATEGY_NAMES)
+    try:
+        if EXTRACTION_MODE == 'hedged' and skip_download:
+            # Race the strategies: a slow one no longer holds up the others
+            candidates = [
+                (name, functools.partial(_run_strategy, video_url, name, extraction_strategies[name],
+                                         info_opts, format_type, skip_download))
+                for name in strategy_order
+            ]
             try:
-                print(f"Strategy {strategy_index+1}, Attempt {attempt+1}: Extracting info for {video_url}")
-                with yt_dlp.YoutubeDL(final_opts) as ydl:
-                    info = ydl.extract_info(video_url, download=not skip_download)
+                strategy_name, info = hedging.first_success(candidates)
+                logger.info("Success with strategy %s (hedged)", strategy_name, extra={'strategy': strategy_name})
+                return info
+            except hedging.AllCandidatesFailed as e:
+                last_exception = e.last_error
+        else:
+            for strategy_name in strategy_order:
+                try:
+                    info = _run_strategy(video_url, strategy_name, extraction_strategies[strategy_name],
+                                         info_opts, format_type, skip_download)
                     if info:
-                        print(f"Success with strategy {strategy_index+1}!")
+                        logger.info("Success with strategy %s", strategy_name, extra={'strategy': strategy_name})
                         return info
-            except Exception as e:
-                last_exception = e
-                print(f"Error with strategy {strategy_index+1}, attempt {attempt+1}: {str(e)}")
-                
-                # Slight delay between attempts to avoid rate limiting
-                import time
-                time.sleep(random.uniform(1, 3))
-                
-                # Modify settings slightly for next attempt
-                final_opts['user_agent'] = random.choice(USER_AGENTS)
-                if 'http_headers' in final_opts:
-                    final_opts['http_headers']['User-Agent'] = final_opts['user_agent']
+                except Exception as e:
+                    last_exception = e
+    finally:
+        # Trial slots of strategies this request never reached
+        strategy_selector.selector.release(strategy_order)
     
     # If all strategies failed, try one more desperate attempt with a completely different approach
     try:
-        print("Final attempt with minimal options...")
+        logger.warning("Final attempt with minimal options")
         minimal_opts = {
             'format': 'worst',  # Try to get any format
             'quiet': False,
@@ -254,15 +312,115 @@ def extract_video_info(video_url, format_type='video', quality='best', skip_down
             'noplaylist': True,
             'skip_download': skip_download,
             'youtube_include_dash_manifest': False,
-            'extractor_args': {'youtube': {'player_client': ['web']}}
+            'extractor_args': {'youtube': {'player_client': ['web']}},
+            'cachedir': player_cache.cache_dir(),
+            'logger': ytdlp_logger
         }
         with yt_dlp.YoutubeDL(minimal_opts) as ydl:
             return ydl.extract_info(video_url, download=not skip_download)
     except Exception as e:
         # Re-raise the last exception
         if last_exception:
-            print(f"All extraction strategies failed. Last error: {str(last_exception)}")
+            logger.error("All extraction strategies failed. Last error: %s", last_exception)
             raise last_exception
         raise e
     
     return None
+
+
+def _run_strategy(video_url, strategy_name, strategy_opts, info_opts, format_type, skip_download, cancel=None):
+    """
+    Make up to three extraction attempts with one strategy
+    
+    Args:
+        video_url (str): YouTube URL
+        strategy_name (str): Name the selector records outcomes under
+        strategy_opts (dict): Strategy-specific options (player_client, user_agent, ...)
+        info_opts (dict): Base extraction options
+        format_type (str): 'video' or 'audio'
+        skip_download (bool): Whether to skip the actual download
+        cancel (threading.Event): Set when another strategy already won, checked between attempts
+        
+    Returns:
+        dict: Video information, or None if every attempt came back empty
+    """
+    # Apply enhanced options with this strategy
+    final_opts = get_enhanced_ydl_opts(info_opts.copy(), format_type)
+    
+    # Apply strategy-specific options
+    for key, value in strategy_opts.items():
+        if key == 'player_client':
+            final_opts['extractor_args']['youtube']['player_client'] = value
+        else:
+            final_opts[key] = value
+    
+    last_exception = None
+    # Metadata lookups run on warm instances; a download needs its own outtmpl and hooks
+    pool_key = (strategy_name, format_type, info_opts['format']) if skip_download else None
+    
+    # Multiple attempts with this strategy
+    for attempt in range(3):
+        if cancel is not None and cancel.is_set():
+            break
+        started = time.monotonic()
+        try:
+            logger.debug("Strategy %s, attempt %d: extracting info for %s", strategy_name, attempt + 1, video_url,
+                         extra={'strategy': strategy_name})
+            if pool_key:
+                with ydl_pool.pool.checkout(pool_key, final_opts) as ydl:
+                    # A warm instance keeps the options it was built with, except the rotated user agent
+                    ydl.params['http_headers']['User-Agent'] = final_opts['http_headers']['User-Agent']
+                    info = ydl.extract_info(video_url, download=False)
+            else:
+                with player_cache.attach(yt_dlp.YoutubeDL(final_opts)) as ydl:
+                    info = ydl.extract_info(video_url, download=not skip_download)
+            strategy_selector.selector.record(strategy_name, bool(info), time.monotonic() - started)
+            metrics.extractions_total.inc(strategy=strategy_name, outcome='success' if info else 'empty')
+            if info:
+                return info
+        except Exception as e:
+            last_exception = e
+            strategy_selector.selector.record(strategy_name, False, time.monotonic() - started)
+            metrics.extractions_total.inc(strategy=strategy_name, outcome='error')
+            logger.warning("Error with strategy %s, attempt %d: %s", strategy_name, attempt + 1, e,
+                           extra={'strategy': strategy_name})
+            
+            # A strategy whose circuit just opened gets no more attempts in this request
+            if strategy_selector.selector.is_open(strategy_name):
+                break
+            
+            # Slight delay between attempts to avoid rate limiting, cut short if cancelled
+            _retry_pause(cancel)
+            
+            # Modify settings slightly for next attempt
+            final_opts['user_agent'] = random.choice(USER_AGENTS)
+            if 'http_headers' in final_opts:
+                final_opts['http_headers']['User-Agent'] = final_opts['user_agent']
+    
+    if last_exception:
+        raise last_exception
+    return None
+
+
+def _retry_pause(cancel=None):
+    delay = random.uniform(1, 3)
+    if cancel is not None:
+        cancel.wait(delay)
+    else:
+        time.sleep(delay)
+
+
+def download_from_info(info, ydl_opts):
+    """
+    Download a video from an already extracted info dict without running the extractor again
+    
+    Args:
+        info (dict): Info dict from a previous extract_info call
+        ydl_opts (dict): yt-dlp options for the download (outtmpl, format, hooks, ...)
+        
+    Returns:
+        dict: Processed info dict including 'requested_downloads'
+    """
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        # Same path yt-dlp uses for --load-info-json: format selection and download only
+        return ydl.process_ie_result(copy.deepcopy(info), download=True)
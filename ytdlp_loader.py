@@ -0,0 +1,98 @@
+"""
+Deferred import of yt-dlp
+
+Importing yt-dlp and its extractors takes a noticeable part of a worker's start-up,
+while the index page, status polling and file downloads never touch it. Modules use
+the `yt_dlp` proxy from here instead of importing the package; it is loaded on first
+attribute access, by the warm-up thread, or once in a preloading gunicorn master so
+every forked worker shares the loaded modules copy-on-write.
+
+YTDLP_WARMUP picks when it loads in a worker: 'background' (default, a thread right
+after start-up), 'lazy' (first use) or 'eager' (at start-up, before serving).
+"""
+import importlib
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+YTDLP_WARMUP = os.environ.get('YTDLP_WARMUP', 'background').lower()
+
+_lock = threading.Lock()
+_module = None
+_stats = {'loaded_by': None, 'import_seconds': None, 'warm_seconds': None}
+
+
+def load(reason='first use'):
+    """
+    Import yt-dlp once per process
+
+    Args:
+        reason (str): Recorded in stats(), e.g. 'first use', 'warm-up' or 'preload'
+
+    Returns:
+        module: The yt_dlp package
+    """
+    global _module
+    if _module is None:
+        with _lock:
+            if _module is None:
+                started = time.monotonic()
+                module = importlib.import_module('yt_dlp')
+                _stats['import_seconds'] = round(time.monotonic() - started, 3)
+                _stats['loaded_by'] = reason
+                _module = module
+                logger.info("yt-dlp %s loaded in %.2fs (%s)", module.version.__version__,
+                            _stats['import_seconds'], reason)
+    return _module
+
+
+def is_loaded():
+    """True once yt-dlp has been imported in this process"""
+    return _module is not None
+
+
+class _LazyModule:
+    """Stands in for the yt_dlp package until an attribute is needed"""
+
+    def __getattr__(self, name):
+        return getattr(load(), name)
+
+    def __repr__(self):
+        return f"<lazy yt_dlp, {'loaded' if is_loaded() else 'not loaded'}>"
+
+
+yt_dlp = _LazyModule()
+
+
+def warm(reason='warm-up'):
+    """Import yt-dlp and the YouTube extractor, the part every extraction needs"""
+    load(reason)
+    started = time.monotonic()
+    # With lazy extractors the real YouTube extractor module is only imported on first use
+    importlib.import_module('yt_dlp.extractor.youtube')
+    _stats['warm_seconds'] = round(time.monotonic() - started, 3)
+
+
+def _warm_in_background():
+    try:
+        warm()
+    except Exception:
+        logger.exception("yt-dlp warm-up failed")
+
+
+def start_warmup():
+    """Load yt-dlp according to YTDLP_WARMUP; called once the worker is ready to serve"""
+    if YTDLP_WARMUP == 'eager':
+        warm('eager')
+    elif YTDLP_WARMUP == 'background' and not is_loaded():
+        thread = threading.Thread(target=_warm_in_background, name='ytdlp-warmup')
+        thread.daemon = True
+        thread.start()
+
+
+def stats():
+    """Return the warm-up mode and when and how fast yt-dlp was loaded"""
+    return dict(_stats, mode=YTDLP_WARMUP, loaded=is_loaded())